@@ -0,0 +1,91 @@
+"""Time the AST stages of a conversion on this interpreter.
+
+    python benchmarks/bench_ast.py
+    FSTRINGIFY_LEGACY_AST=1 python benchmarks/bench_ast.py
+    python benchmarks/bench_ast.py --captures .fstringify-captures
+
+The second run forces the `ast.Str`/astor route (on 3.9+ where the shims
+still exist) to compare it with the `ast.Constant`/`ast.unparse` one. The
+third times the statements of files saved by `--capture-slow-threshold`
+instead of the built in ones.
+"""
+import argparse
+import ast
+import sys
+import timeit
+
+from fstringify.astcompat import MODERN_AST, to_source
+from fstringify.capture import captured_statements
+from fstringify.transform import fstringify_node
+
+
+STATEMENTS = [
+    'msg = "hello %s" % name',
+    'msg = "%s of %s" % (done, total)',
+    'msg = "%(user)s logged in from %(host)s" % info',
+    'msg = "%(a)s-%(b)d" % {"a": x, "b": y}',
+    'msg = "%5.2f%%" % ratio',
+    'msg = "%s" % self.name.upper()',
+    'msg = "{%s}" % key',
+    'msg = "prefix-%s-%03d" % ("abc", 7)',
+    'msg = "%s" % (a + b)',
+    "total = count % 7",
+    'msg = "{} of {total:>5}".format(a, total=b)',
+]
+
+
+def parse_all(statements):
+    return [ast.parse(statement) for statement in statements]
+
+
+def transform_all(trees):
+    return [fstringify_node(tree) for tree in trees]
+
+
+def unparse_all(trees):
+    return [to_source(tree) for tree in trees]
+
+
+def best(func, make_input, number, repeat):
+    """Best seconds of `number` calls of `func`, inputs made beforehand."""
+    times = []
+    for _ in range(repeat):
+        inputs = [make_input() for _ in range(number)]
+        start = timeit.default_timer()
+        for arg in inputs:
+            func(arg)
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--captures", metavar="DIR")
+    args = parser.parse_args()
+
+    if args.captures:
+        statements = captured_statements(args.captures)
+    else:
+        statements = STATEMENTS * 10
+    if not statements:
+        parser.error(f"no statements in `{args.captures}`")
+    converted = [tree for tree, _ in transform_all(parse_all(statements))]
+    stages = [
+        ("parse", parse_all, lambda: statements),
+        # the rules change the trees, every run needs fresh ones
+        ("transform", transform_all, lambda: parse_all(statements)),
+        ("unparse", unparse_all, lambda: converted),
+    ]
+
+    engine = "ast.Constant/ast.unparse" if MODERN_AST else "ast.Str/astor"
+    print(f"Python {sys.version.split()[0]}, {engine}")
+    for name, func, make_input in stages:
+        seconds = best(func, make_input, args.number, args.repeat)
+        per_statement = seconds / (args.number * len(statements)) * 1e6
+        print(f"{name:>10}: {per_statement:8.2f} us per statement")
+
+
+if __name__ == "__main__":
+    main()
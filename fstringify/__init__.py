@@ -2,16 +2,384 @@ __version__ = "0.1.13"
 
 
 import argparse
+import importlib
+import os
 import sys
+import tarfile
+import zipfile
 
-from fstringify.api import fstringify_dir, fstringify_file, fstringify
-from fstringify.transform import fstringify_code
+import astor
+
+from fstringify.archive import fstringify_archive
+from fstringify.capture import (
+    CAPTURE_DIR,
+    find_captures,
+    parse_duration,
+    replay_capture,
+)
+from fstringify.api import (
+    fstringify_dir,
+    fstringify_file,
+    fstringify_stdin,
+    fstringify,
+    fstringify_sources,
+    summary_line,
+)
+from fstringify.difftest import (
+    DEFAULT_ENGINES,
+    diff_sources,
+    fuzz_sources,
+    read_sources,
+    resolve_engine,
+)
+from fstringify.events import Observer, Site
+from fstringify.transform import (
+    fstringify_code,
+    register_rule,
+    Rule,
+    RULES,
+    DEFAULT_RULES,
+    parse_target_version,
+)
+from fstringify.plan import apply_plan, load_plan
 from fstringify.process import fstringify_code_by_line
+from fstringify.report import load_report, merge_reports, missing_shards, write_report
+from fstringify.scan import (
+    SCAN_INDEX,
+    count_by_dir,
+    count_by_reason,
+    list_sites,
+    open_index,
+    scan_summary,
+    update_index,
+)
+from fstringify.shard import parse_shard
+from fstringify.workers import EXECUTORS
+
+
+def merge_reports_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="fstringify merge-reports",
+        description="combine the partial reports written by `--shard` runs",
+    )
+    parser.add_argument("reports", nargs="+", help="partial report files")
+    parser.add_argument("-o", "--output", help="write the merged report here")
+    parser.add_argument("--quiet", action="store_true", help="run without output")
+
+    args = parser.parse_args(argv)
+
+    try:
+        merged = merge_reports([load_report(fn) for fn in args.reports])
+    except (OSError, ValueError) as e:
+        print(f"merge-reports: {e}")
+        sys.exit(1)
+
+    if args.output:
+        write_report(merged, args.output)
+
+    if not args.quiet:
+        for path in merged["changed_files"]:
+            print(f"fstringified {path}")
+        missing = missing_shards(merged)
+        if missing:
+            print(f"\nmissing shards: {', '.join(map(str, missing))}")
+        print(
+            f"\n{summary_line(merged['changed'], merged['wall_time'])} "
+            f"({merged['files']} files, {merged['total_time']}s across "
+            f"{len(merged['shards']) or 1} shards)"
+        )
+
+    if missing_shards(merged):
+        sys.exit(1)
+
+
+def scan_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="fstringify scan",
+        description="index the %-format sites and if they can be converted, "
+        "without changing any file",
+    )
+    parser.add_argument("src", nargs="?", help="source file or directory to scan")
+    parser.add_argument(
+        "--index",
+        default=SCAN_INDEX,
+        metavar="FILE",
+        help=f"SQLite index to update and query (default: {SCAN_INDEX})",
+    )
+    parser.add_argument(
+        "--by-dir", action="store_true", help="count the sites per directory"
+    )
+    parser.add_argument(
+        "--reasons",
+        action="store_true",
+        help="count the unconvertible sites per reason",
+    )
+    parser.add_argument("--sites", action="store_true", help="list every site")
+
+    args = parser.parse_args(argv)
+
+    conn = open_index(args.index)
+    if args.src:
+        to_use = os.path.abspath(args.src)
+        if not os.path.exists(to_use):
+            print(f"`{args.src}` not found")
+            sys.exit(1)
+        if os.path.isdir(to_use):
+            files = astor.code_to_ast.find_py_files(to_use)
+        else:
+            files = ((os.path.dirname(to_use), os.path.basename(to_use)),)
+        scanned, unchanged, removed = update_index(conn, files, to_use)
+        print(f"scanned {scanned} files ({unchanged} unchanged, {removed} removed)")
+
+    if args.by_dir:
+        for directory, sites, convertible in count_by_dir(conn):
+            print(f"{sites:8} {convertible:8}  {directory}")
+    if args.reasons:
+        for reason, sites in count_by_reason(conn):
+            print(f"{sites:8}  {reason}")
+    if args.sites:
+        for path, line, kind, reason in list_sites(conn):
+            print(f"{path}:{line}: {kind}: {reason or 'convertible'}")
+
+    files, sites, convertible = scan_summary(conn)
+    print(f"{sites} sites in {files} files, {convertible} convertible")
+
+
+def plan_main(argv):
+    return main(argv, plan=True)
+
+
+def apply_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="fstringify apply",
+        description="apply the edits written by `fstringify plan`, files that "
+        "changed since are refused",
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--verbose", action="store_true", help="run with verbose output")
+    group.add_argument("--quiet", action="store_true", help="run without output")
+    parser.add_argument(
+        "--root",
+        default=".",
+        metavar="DIR",
+        help="directory the plan was made in (default: the current one)",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="i/N",
+        help="only apply the i-th of N deterministic slices of the files",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=("hash", "size"),
+        default="hash",
+        help="split shards by path hash or balance them by file size",
+    )
+    parser.add_argument("plan", help="the plan file")
+
+    args = parser.parse_args(argv)
+
+    try:
+        applied, done, stale = apply_plan(
+            load_plan(args.plan), args.root, shard=args.shard, shard_by=args.shard_by
+        )
+    except (OSError, ValueError, KeyError) as e:
+        print(f"apply: {e}")
+        sys.exit(1)
+
+    if args.verbose:
+        for path in applied:
+            print(f"applied {path}")
+        for path in done:
+            print(f"already applied {path}")
+    if not args.quiet:
+        for path in stale:
+            print(f"refused {path}: changed since the plan was made")
+        print(
+            f"\napplied {len(applied)} files, {len(done)} already applied, "
+            f"{len(stale)} stale"
+        )
+    if stale:
+        sys.exit(1)
+
+
+def replay_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="fstringify replay",
+        description="convert the files saved by --capture-slow-threshold again "
+        "under cProfile, without writing anything",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        metavar="N",
+        help="show the N most expensive functions per capture (default: 20)",
+    )
+    parser.add_argument(
+        "--sort",
+        choices=("cumulative", "tottime", "calls"),
+        default="cumulative",
+        help="what to rank the functions by",
+    )
+    parser.add_argument(
+        "captures", help="a capture, or a directory of them like .fstringify-captures"
+    )
+
+    args = parser.parse_args(argv)
+
+    try:
+        paths = find_captures(args.captures)
+    except OSError as e:
+        print(f"replay: {e}")
+        sys.exit(1)
+    if not paths:
+        print(f"replay: no captures in `{args.captures}`")
+        sys.exit(1)
+
+    for path in paths:
+        try:
+            capture, seconds, report = replay_capture(
+                path, top=args.top, sort=args.sort
+            )
+        except (OSError, ValueError, KeyError) as e:
+            print(f"replay: `{path}`: {e}")
+            sys.exit(1)
+        print(
+            f"{capture['path']}: {seconds:.3f}s now, {capture['seconds']:.3f}s when "
+            f"captured (fstringify {capture['fstringify']}, Python {capture['python']})"
+        )
+        print(report)
+
+
+def difftest_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="fstringify difftest",
+        description="convert the same sources with two or more engines and "
+        "report where the results differ, without writing anything",
+    )
+    parser.add_argument("src", nargs="?", help="source file or directory to compare")
+    parser.add_argument(
+        "--engines",
+        default=",".join(DEFAULT_ENGINES),
+        metavar="A,B",
+        help="comma separated engines, the first is the reference: ast, "
+        f"fast-path, pep701 or module:function (default: {','.join(DEFAULT_ENGINES)})",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="compare on N processes (0 for all cores)",
+    )
+    parser.add_argument(
+        "--fuzz",
+        type=int,
+        default=0,
+        metavar="N",
+        help="also compare N generated modules of random %%-formats",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the --fuzz generator"
+    )
+    parser.add_argument(
+        "--no-shrink",
+        action="store_true",
+        help="report the whole source instead of a minimal repro",
+    )
+
+    args = parser.parse_args(argv)
+    if not args.src and not args.fuzz:
+        parser.error("nothing to compare, pass src and/or --fuzz N")
+    engines = args.engines.split(",")
+    if len(engines) < 2:
+        parser.error("--engines needs at least two engines")
+    try:
+        for engine in engines:
+            resolve_engine(engine)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(str(e))
+
+    items = []
+    if args.src:
+        if not os.path.exists(args.src):
+            print(f"`{args.src}` not found")
+            sys.exit(1)
+        items += read_sources(args.src)
+    if args.fuzz:
+        items += fuzz_sources(args.fuzz, seed=args.seed)
 
+    mismatches = diff_sources(
+        items,
+        engines=engines,
+        jobs=args.jobs or os.cpu_count() or 1,
+        shrink_mismatch=not args.no_shrink,
+    )
+    for mismatch in mismatches:
+        where = f":{mismatch.lineno}" if mismatch.lineno else ""
+        print(f"{mismatch.name}{where}: {mismatch.kind} mismatch, repro:")
+        print(mismatch.repro.rstrip("\n"))
+        for engine, output in zip(engines, mismatch.outputs):
+            print(f"--- {engine}")
+            print(output.rstrip("\n"))
+        print()
+    print(f"{len(mismatches)} mismatches in {len(items)} sources")
+    if mismatches:
+        sys.exit(1)
+
+
+COMMANDS = {
+    "apply": apply_main,
+    "difftest": difftest_main,
+    "merge-reports": merge_reports_main,
+    "plan": plan_main,
+    "replay": replay_main,
+    "scan": scan_main,
+}
+
+
+def stdin_main(args, options):
+    """`fstringify -`, the converted code goes to stdout and messages to stderr."""
+    name = args.stdin_filename or "-"
+    options = dict(options)
+    for key in ("verbose", "quiet", "report"):
+        del options[key]
+
+    data = sys.stdin.buffer.read()
+    try:
+        new_data, meta = fstringify_stdin(
+            data, filename=args.stdin_filename, exclude=args.exclude, **options
+        )
+    except Exception as e:
+        # whatever reads stdout still gets the source back
+        sys.stdout.buffer.write(data)
+        print(f"fstringifying {name}...failed ({e})", file=sys.stderr)
+        sys.exit(1)
+
+    sys.stdout.buffer.write(new_data)
+    sys.stdout.flush()
+    if args.verbose:
+        print(
+            f"fstringifying {name}...{'yes' if meta['changed'] else 'no'}",
+            file=sys.stderr,
+        )
+
+
+def main(argv=None, plan=False):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if not plan and argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
 
-def main():
     parser = argparse.ArgumentParser(
-        description=f"fstringify {__version__}", add_help=True
+        prog="fstringify plan" if plan else None,
+        description="write the edits of a run to -o/--output instead of "
+        "changing any files, see `fstringify apply`"
+        if plan
+        else f"fstringify {__version__}",
+        add_help=True,
     )
 
     group = parser.add_mutually_exclusive_group()
@@ -20,15 +388,257 @@ def main():
     parser.add_argument(
         "--version", action="store_true", default=False, help="show version and exit"
     )
-    parser.add_argument("src", action="store", help="source file or directory")
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="i/N",
+        help="only process the i-th of N deterministic slices of the files",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=("hash", "size"),
+        default="hash",
+        help="split shards by path hash or balance them by (pre-run) file size",
+    )
+    parser.add_argument(
+        "--report", metavar="FILE", help="write a JSON report of the run to FILE"
+    )
+    parser.add_argument(
+        "--intra-file-jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="convert the statements of large files on N processes (0 for all cores)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="convert files on N workers (0 for all cores)",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default="auto",
+        help="run the workers as threads or processes, auto picks threads "
+        "without the GIL and runs small batches serially",
+    )
+    parser.add_argument(
+        "--max-worker-rss",
+        type=int,
+        metavar="MB",
+        help="replace a worker once it uses more than MB megabytes of memory",
+    )
+    parser.add_argument(
+        "--max-files-per-worker",
+        type=int,
+        metavar="N",
+        help="replace a worker after it converted N files",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="show files done, throughput and ETA on stderr while running",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help="keep counters and histograms of the run in FILE, in the text "
+        "format of node_exporter's textfile collector",
+    )
+    parser.add_argument(
+        "--capture-slow-threshold",
+        type=parse_duration,
+        metavar="DURATION",
+        help="save the source, timings and candidate spans of files that take "
+        "longer than DURATION (like 2s or 500ms) to replay them later, see "
+        "`fstringify replay`",
+    )
+    parser.add_argument(
+        "--capture-dir",
+        default=CAPTURE_DIR,
+        metavar="DIR",
+        help=f"where --capture-slow-threshold saves files (default: {CAPTURE_DIR})",
+    )
+    parser.add_argument(
+        "--fast-path",
+        action="store_true",
+        help="rewrite trivial %%-formats from their tokens, checking a sample",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="check every fast path rewrite against the AST route",
+    )
+    parser.add_argument(
+        "--logging",
+        action="store_true",
+        help="turn %%-formatted logging messages into lazy logging arguments",
+    )
+    parser.add_argument(
+        "--target-version",
+        type=parse_target_version,
+        metavar="X.Y",
+        help="the oldest Python the converted code has to run on (default: 3.6), "
+        "3.12 allows quotes and backslashes inside f-string expressions",
+    )
+    parser.add_argument(
+        "--rule",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="also run this registered rule (can be repeated)",
+    )
+    parser.add_argument(
+        "--rule-module",
+        action="append",
+        default=[],
+        metavar="MODULE",
+        help="import MODULE first so it can register its own rules",
+    )
+    parser.add_argument(
+        "--profile-data",
+        metavar="FILE",
+        help="list the candidate sites ranked by the time spent in them "
+        "according to this cProfile/pstats dump",
+    )
+    parser.add_argument(
+        "--hot-threshold",
+        type=float,
+        metavar="SECONDS",
+        help="with --profile-data, only convert the sites in functions with "
+        "at least this much cumulative time",
+    )
+    parser.add_argument(
+        "--impact-report",
+        metavar="FILE",
+        help="time every %%-format against its f-string on dummy operands and "
+        "write the speedups to FILE (markdown for .md, JSON otherwise)",
+    )
+    parser.add_argument(
+        "--archive",
+        metavar="IN",
+        help="convert the Python files inside a .tar(.gz/.bz2/.xz), .zip or "
+        ".whl archive, without extracting it",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="OUT",
+        help="where --archive writes the result (or `plan` the edits)",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="skip files whose path below src, or a part of it, matches GLOB, "
+        "also checked for --stdin-filename (can be repeated)",
+    )
+    parser.add_argument(
+        "--stdin-filename",
+        metavar="PATH",
+        help="with - as src, the path of the piped in source, for messages "
+        "and --exclude",
+    )
+    parser.add_argument(
+        "src",
+        nargs="?",
+        action="store",
+        help="source file or directory, - to convert stdin to stdout",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.version:
         print("fstringify", __version__)
         sys.exit(0)
 
-    fstringify(args.src, verbose=args.verbose, quiet=args.quiet)
+    if bool(args.archive) == bool(args.src):
+        parser.error("expected either src or --archive")
+    if plan and (args.archive or not args.output):
+        parser.error("plan needs src and -o/--output")
+    if args.archive and not args.output:
+        parser.error("--archive needs -o/--output")
+    if args.output and not (args.archive or plan):
+        parser.error("-o/--output only works with --archive")
+
+    if args.archive and args.capture_slow_threshold is not None:
+        parser.error("--capture-slow-threshold doesn't work with --archive")
+    if args.archive and args.exclude:
+        parser.error("--exclude doesn't work with --archive")
+    stdin = args.src == "-"
+    if args.stdin_filename and not stdin:
+        parser.error("--stdin-filename needs - as src")
+    if stdin:
+        for flag, used in (
+            ("plan", plan),
+            ("--shard", args.shard),
+            ("--report", args.report),
+            ("--profile-data", args.profile_data),
+            ("--impact-report", args.impact_report),
+            ("--capture-slow-threshold", args.capture_slow_threshold is not None),
+        ):
+            if used:
+                parser.error(f"{flag} doesn't work with - (stdin)")
+    if args.hot_threshold is not None and not args.profile_data:
+        parser.error("--hot-threshold needs --profile-data")
+    if args.executor in ("serial", "thread") and (
+        args.max_worker_rss or args.max_files_per_worker
+    ):
+        parser.error("worker limits need --executor process (or auto)")
+
+    for module in args.rule_module:
+        importlib.import_module(module)
+
+    for rule in args.rule:
+        if rule not in RULES:
+            parser.error(f"unknown rule `{rule}`, known: {', '.join(sorted(RULES))}")
+
+    options = dict(
+        verbose=args.verbose,
+        quiet=args.quiet,
+        report=args.report,
+        jobs=args.intra_file_jobs or os.cpu_count() or 1,
+        fast_path=args.fast_path or args.verify,
+        verify=args.verify,
+        target_version=args.target_version,
+        rules=(["logging"] if args.logging else [])
+        + list(DEFAULT_RULES)
+        + [r for r in args.rule if r not in DEFAULT_RULES],
+    )
+
+    if stdin:
+        return stdin_main(args, options)
+
+    if args.archive:
+        try:
+            fstringify_archive(args.archive, args.output, **options)
+        except (OSError, ValueError, tarfile.TarError, zipfile.BadZipFile) as e:
+            print(f"`{args.archive}`: {e}")
+            sys.exit(1)
+        return
+
+    fstringify(
+        args.src,
+        shard=args.shard,
+        shard_by=args.shard_by,
+        profile_data=args.profile_data,
+        hot_threshold=args.hot_threshold,
+        impact_report=args.impact_report,
+        workers=args.jobs or os.cpu_count() or 1,
+        executor=args.executor,
+        max_worker_rss=args.max_worker_rss and args.max_worker_rss << 20,
+        max_files_per_worker=args.max_files_per_worker,
+        progress=args.progress,
+        metrics_file=args.metrics_file,
+        capture_slow_threshold=args.capture_slow_threshold,
+        capture_dir=args.capture_dir,
+        exclude=args.exclude,
+        plan=args.output if plan else None,
+        **options,
+    )
 
 
 if __name__ == "__main__":
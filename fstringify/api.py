@@ -1,65 +1,513 @@
+import fnmatch
+import functools
+import io
 import os
 import sys
 import time
+import tokenize
 
 import astor
 
-from fstringify.process import skip_file, fstringify_code_by_line
+from fstringify.capture import CAPTURE_DIR, write_capture
+from fstringify.events import Dispatcher, Observer
+from fstringify.hotspots import (
+    find_hotspots,
+    hot_lines,
+    hotspot_line,
+    load_profile,
+    profile_functions,
+    rank_hotspots,
+)
+from fstringify.impact import build_impact_report, measure_files, write_impact_report
+from fstringify.metrics import MetricsWriter
+from fstringify.notebook import (
+    find_notebooks,
+    fstringify_notebook_code,
+    is_notebook,
+    skip_notebook,
+)
+from fstringify.plan import PlanCollector, plan_entry, write_plan
+from fstringify.pool import map_batches
+from fstringify.progress import Progress
+from fstringify.process import (
+    fstringify_code_by_line,
+    get_trigger_tokens,
+    merge_rule_stats,
+    skip_code,
+    skip_file,
+)
+from fstringify.report import build_report, write_report
+from fstringify.shard import shard_files
+from fstringify.workers import RecyclingPool, ThreadPool, choose_executor, run_serial
 
 
-def fstringify_file(fn):
-    if skip_file(fn):
-        return False
+def fstringify_file(
+    fn,
+    include_meta=False,
+    hot_functions=None,
+    hot_threshold=0.0,
+    plan=False,
+    capture_slow_threshold=None,
+    capture_dir=CAPTURE_DIR,
+    **options,
+):
+    """Convert a file in place, `options` are passed to `fstringify_code_by_line`.
 
-    with open(fn, encoding="utf8") as f:
-        contents = f.read()
+    With `hot_functions` (see `hotspots.profile_functions`) only the sites in
+    functions that took at least `hot_threshold` seconds are converted.
 
-    new_code = fstringify_code_by_line(contents)
+    Notebooks (`.ipynb`) have their code cells converted, see
+    `notebook.fstringify_notebook_code`. Profiles only cover modules, so
+    notebooks are skipped when there are `hot_functions`.
 
-    if new_code == contents:
-        return False
+    The meta also has the file's `bytes` and the seconds spent per `stages`.
+    With `plan` the file isn't written, a changed file gets the edits that
+    would convert it in `meta["plan"]` instead (see `plan.plan_entry`).
 
-    with open(fn, "w", encoding="utf8") as f:
-        f.write(new_code)
+    Files that took at least `capture_slow_threshold` seconds, from the
+    prefilter to the write, are saved into `capture_dir` to be replayed later
+    (see `capture.write_capture`), `meta["capture"]` is where.
 
-    return True
+    Returns True if the file changed, or `(changed, meta)` with `include_meta`
+    """
+    stages = {}
+    stage_start = time.perf_counter()
+
+    def stage(name):
+        nonlocal stage_start
+        now = time.perf_counter()
+        stages[name] = now - stage_start
+        stage_start = now
+
+    meta = dict(changed=False, rules={})
+    file_meta = dict(bytes=os.path.getsize(fn), stages=stages)
+    notebook = is_notebook(fn)
+    if notebook:
+        # the cells have to be read from the JSON for the prefilter anyway
+        with open(fn, encoding="utf8") as f:
+            contents = f.read()
+        skip = skip_notebook(contents, rules=options.get("rules"))
+    else:
+        skip = skip_file(fn, rules=options.get("rules"))
+    stage("prefilter")
+    if skip or (notebook and hot_functions is not None):
+        meta["skipped"] = "prefilter" if skip else "profile"
+        return (False, dict(meta, **file_meta)) if include_meta else False
+
+    if not notebook:
+        with open(fn, encoding="utf8") as f:
+            contents = f.read()
+        stage("read")
+
+    if hot_functions is not None:
+        hotspots = find_hotspots(contents, hot_functions, rules=options.get("rules"))
+        options["lines"] = hot_lines(hotspots, hot_threshold)
+        stage("profile")
+
+    if notebook:
+        new_code, meta = fstringify_notebook_code(contents, **options)
+    else:
+        new_code, meta = fstringify_code_by_line(contents, include_meta=True, **options)
+    stage("convert")
+
+    changed = new_code != contents
+    if changed and plan:
+        with open(fn, "rb") as f:
+            meta["plan"] = plan_entry(f.read(), new_code)
+        stage("plan")
+    elif changed:
+        with open(fn, "w", encoding="utf8") as f:
+            f.write(new_code)
+        stage("write")
+
+    seconds = sum(stages.values())
+    if capture_slow_threshold is not None and seconds >= capture_slow_threshold:
+        file_meta["capture"] = write_capture(
+            capture_dir, fn, contents, seconds, stages, options
+        )
+
+    return (changed, dict(meta, **file_meta)) if include_meta else changed
+
+
+# sources are handed to the pool a few at a time, they tend to be small
+SOURCES_BATCH_SIZE = 8
+
+
+def fstringify_source(source, **options):
+    """Convert source code that's in memory, `options` as `fstringify_code_by_line`.
+
+    Args:
+        source (str or bytes): Bytes are decoded like Python would, honoring
+            a coding cookie or BOM.
+
+    Returns `(code, meta)` tuple, `code` is always a str
+    """
+    if isinstance(source, bytes):
+        encoding, _ = tokenize.detect_encoding(io.BytesIO(source).readline)
+        source = source.decode(encoding)
+        if source.startswith("\ufeff"):
+            source = source[1:]
+
+    if skip_code(source, rules=options.get("rules")):
+        return source, dict(changed=False, rules={})
+
+    return fstringify_code_by_line(source, include_meta=True, **options)
+
+
+def fstringify_stdin(data, filename=None, exclude=(), **options):
+    """Convert a module (or notebook) piped in, for editor and pre-commit pipelines.
+
+    Input without any trigger token of the rules (like `%`) is handed back
+    untouched before decoding or parsing anything, so chaining this between
+    other formatters costs little.
+
+    Args:
+        data (bytes): What was read from stdin.
+        filename (str): The path the source belongs to, to check `exclude`
+            and tell notebooks apart.
+        exclude (iterable): Globs, see `excluded`.
+        options: Passed to `fstringify_code_by_line`.
+
+    Returns `(data, meta)`, `data` is the bytes to write to stdout, the
+    input itself when nothing changed
+    """
+    meta = dict(changed=False, rules={})
+    if filename and excluded(filename, exclude):
+        return data, dict(meta, skipped="exclude")
+    triggers = get_trigger_tokens(options.get("rules"))
+    if not any(tok.encode("ascii") in data for tok in triggers):
+        return data, dict(meta, skipped="prefilter")
+
+    if filename and is_notebook(filename):
+        contents = data.decode("utf-8")
+        if skip_notebook(contents, rules=options.get("rules")):
+            return data, dict(meta, skipped="prefilter")
+        new_contents, meta = fstringify_notebook_code(contents, **options)
+        return (new_contents.encode("utf-8") if meta["changed"] else data), meta
+
+    # decoded like `open` does for files, "utf-8-sig" drops and restores a BOM
+    encoding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+    source = data.decode(encoding)
+    newline = "\r\n" if "\r\n" in source else "\n"
+    code, meta = fstringify_source(source.replace("\r\n", "\n"), **options)
+    if not meta["changed"]:
+        return data, meta
+    return code.replace("\n", newline).encode(encoding), meta
+
+
+def excluded(path, patterns):
+    """Check if a path matches one of the `--exclude` globs.
+
+    A glob matches the whole path (`/` separated) or any part of it, so
+    `migrations` excludes every file in a `migrations` directory.
+    """
+    path = path.replace(os.sep, "/")
+    parts = path.split("/")
+    return any(
+        fnmatch.fnmatch(path, pattern)
+        or any(fnmatch.fnmatch(part, pattern) for part in parts)
+        for pattern in patterns
+    )
+
+
+def _fstringify_sources(items, **options):
+    return [(name, fstringify_source(source, **options)) for name, source in items]
+
+
+def fstringify_sources(mapping, jobs=1, **options):
+    """Convert many in-memory sources without touching the filesystem.
+
+    With `jobs > 1` the sources are spread over a pool of worker processes.
+
+    Args:
+        mapping (dict): `{name: source}`, sources are str or bytes.
+        jobs (int): Number of worker processes.
+        options: Passed to `fstringify_code_by_line` for every source.
+
+    Returns dict of `{name: (code, meta)}` in the order of `mapping`
+    """
+    items = list(mapping.items())
+    convert = functools.partial(_fstringify_sources, **options)
+    if jobs > 1 and len(items) > 1:
+        results = map_batches(convert, items, jobs, SOURCES_BATCH_SIZE)
+    else:
+        results = convert(items)
+    return dict(results)
+
+
+def find_files(in_dir):
+    """The `(directory, file name)` of the modules and notebooks below `in_dir`"""
+    return list(astor.code_to_ast.find_py_files(in_dir)) + list(find_notebooks(in_dir))
 
 
 def fstringify_dir(in_dir):
-    files = astor.code_to_ast.find_py_files(in_dir)
+    files = find_files(in_dir)
     return fstringify_files(files)
 
 
-def fstringify_files(files, verbose=False, quiet=False):
-    change_count = 0
+def summary_line(change_count, total_time):
+    file_s = "s" if change_count != 1 else ""
+    return f"fstringified {change_count} file{file_s} in {total_time}s"
+
+
+def rule_stats_line(rule_stats):
+    """Like `percent: 12 changed, 3 folded; format: 4 changed`"""
+    return "; ".join(
+        f"{name}: "
+        + ", ".join(f"{count} {counter}" for counter, count in counters.items())
+        for name, counters in sorted(rule_stats.items())
+    )
+
+
+def _fstringify_file_task(task, **options):
+    file_path, file_options = task
+    file_start = time.time()
+    changed, meta = fstringify_file(
+        file_path, include_meta=True, **options, **file_options
+    )
+    return changed, meta, time.time() - file_start
+
+
+class ConsoleObserver(Observer):
+    """The command line output, one line per file with `verbose` and a summary."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+
+    def on_file_done(self, path, changed, meta, seconds, error):
+        if error:
+            print(f"fstringifying {path}...failed ({error})")
+        elif self.verbose:
+            print(f"fstringifying {path}...{'yes' if changed else 'no'}")
+        if "capture" in meta:
+            print(f"{path} took {seconds:.2f}s, captured in {meta['capture']}")
+
+    def on_run_done(self, summary):
+        print(f"\n{summary_line(summary['changed'], summary['total_time'])}")
+        if self.verbose and summary["rules"]:
+            print(rule_stats_line(summary["rules"]))
+        if self.verbose and summary["workers"]:
+            workers = summary["workers"]
+            print(
+                f"peak worker rss {workers['peak_rss'] // (1 << 20)}MiB, "
+                f"{workers['recycled']} workers recycled, "
+                f"{workers['retried']} files retried"
+            )
+
+
+def fstringify_files(
+    files,
+    verbose=False,
+    quiet=False,
+    profile=None,
+    root=".",
+    workers=1,
+    executor="auto",
+    max_worker_rss=None,
+    max_files_per_worker=None,
+    progress=False,
+    metrics_file=None,
+    observers=(),
+    **options,
+):
+    """Convert every file.
+
+    With a `profile` (see `hotspots.load_profile`) each file only gets its
+    hot sites converted, see `fstringify_file`.
+
+    The files are converted with up to `workers` workers by the `executor`,
+    `"serial"`, `"thread"`, `"process"` or `"auto"` (see
+    `workers.choose_executor`). Processes run on a `workers.RecyclingPool`
+    that replaces workers above `max_worker_rss` bytes or after
+    `max_files_per_worker` files.
+
+    Everything that happens is passed on to `observers`, see
+    `events.Observer`. The console output (unless `quiet`), the `progress`
+    line on stderr and the `metrics_file` (see `metrics.MetricsWriter`) are
+    observers too.
+
+    Returns `(results, total_time)`, results are
+    `(file_path, changed, seconds, rule_stats)` tuples
+    """
+    observers = list(observers)
+    if progress:
+        observers.append(Progress())
+    if metrics_file:
+        observers.append(MetricsWriter(metrics_file))
+    if not quiet:
+        observers.append(ConsoleObserver(verbose))
+    events = Dispatcher(observers)
+    if events.wants_sites:
+        options["collect_sites"] = True
+
     start_time = time.time()
+    tasks = []
     for f in files:
         file_path = os.path.join(f[0], f[1])
-        changed = fstringify_file(file_path)
+        file_options = {}
+        if profile is not None:
+            file_options["hot_functions"] = profile_functions(profile, file_path, root)
+        tasks.append((file_path, file_options))
+
+    def on_start(idx):
+        for hook in events.on_file_start:
+            hook(tasks[idx][0])
+
+    recycle = bool(max_worker_rss or max_files_per_worker)
+    executor = choose_executor(executor, workers, len(tasks), recycle=recycle)
+    if recycle and executor != "process":
+        raise ValueError("worker limits need the process executor")
+
+    convert = functools.partial(_fstringify_file_task, **options)
+    pool = None
+    if executor == "process":
+        pool = RecyclingPool(
+            convert, workers, max_rss=max_worker_rss, max_tasks=max_files_per_worker
+        )
+        outcomes = pool.run(tasks, on_start=on_start)
+    elif executor == "thread":
+        outcomes = ThreadPool(convert, workers).run(tasks, on_start=on_start)
+    else:
+        outcomes = run_serial(convert, tasks, on_start=on_start)
+
+    for hook in events.on_run_start:
+        hook(len(tasks))
+
+    results = [None] * len(tasks)
+    rule_stats = {}
+    change_count = 0
+    for idx, outcome, error in outcomes:
+        file_path = tasks[idx][0]
+        changed, meta, seconds = outcome or (False, dict(rules={}), 0.0)
+        results[idx] = (file_path, changed, seconds, meta["rules"])
+        merge_rule_stats(rule_stats, meta["rules"])
         if changed:
             change_count += 1
-        status = "yes" if changed else "no"
-        # TODO: only if `verbose` is set
 
-        if verbose and not quiet:
-            print(f"fstringifying {file_path}...{status}")
+        if "skipped" in meta:
+            for hook in events.on_file_skipped:
+                hook(file_path, meta["skipped"])
+        for site in meta.get("sites", ()):
+            hooks = events.on_site_rejected if site.reason else events.on_site_converted
+            for hook in hooks:
+                hook(file_path, site)
+        for hook in events.on_file_done:
+            hook(file_path, changed, meta, seconds, error)
 
     total_time = round(time.time() - start_time, 3)
+    summary = dict(
+        files=len(tasks),
+        changed=change_count,
+        total_time=total_time,
+        rules=rule_stats,
+        workers=None,
+    )
+    if pool is not None:
+        summary["workers"] = dict(
+            peak_rss=pool.peak_rss, recycled=pool.recycled, retried=pool.retried
+        )
+    for hook in events.on_run_done:
+        hook(summary)
 
-    if not quiet:
-        file_s = "s" if change_count != 1 else ""
-        print(f"\nfstringified {change_count} file{file_s} in {total_time}s")
+    return results, total_time
 
 
-def fstringify(file_or_path, verbose=False, quiet=False):
+def fstringify(
+    file_or_path,
+    verbose=False,
+    quiet=False,
+    shard=None,
+    shard_by="hash",
+    report=None,
+    profile_data=None,
+    hot_threshold=None,
+    impact_report=None,
+    plan=None,
+    exclude=(),
+    **options,
+):
     to_use = os.path.abspath(file_or_path)
     if not os.path.exists(to_use):
         print(f"`{file_or_path}` not found")
         sys.exit(1)
 
     if os.path.isdir(to_use):
-        files = astor.code_to_ast.find_py_files(to_use)
+        root = to_use
+        files = find_files(to_use)
     else:
+        root = os.path.dirname(to_use)
         files = ((os.path.dirname(to_use), os.path.basename(to_use)),)
 
-    fstringify_files(files, verbose=verbose, quiet=quiet)
+    if exclude:
+        files = [
+            f
+            for f in files
+            if not excluded(os.path.relpath(os.path.join(*f), root), exclude)
+        ]
+    if shard:
+        files = shard_files(files, root, *shard, by=shard_by)
+
+    if impact_report:
+        files = list(files)
+        impact = build_impact_report(measure_files(files, root))
+        write_impact_report(impact, impact_report)
+        if not quiet:
+            summary = impact["summary"]
+            print(
+                f"timed {summary['sites']} sites: {summary['speedup']}x faster "
+                f"(geometric mean {summary['geo_mean_speedup']}x)"
+            )
+
+    profile = load_profile(profile_data) if profile_data else None
+    if profile is not None and hot_threshold is None:
+        print(f"{'tottime':>10} {'cumtime':>10} {'calls':>8} site (function)")
+        for spot in list_hotspots(files, root, profile, rules=options.get("rules")):
+            print(hotspot_line(spot))
+        return
+
+    if plan:
+        # files are converted as usual, but the edits are collected, not written
+        collector = PlanCollector()
+        options.update(plan=True, observers=[collector])
+
+    results, total_time = fstringify_files(
+        files,
+        verbose=verbose,
+        quiet=quiet,
+        profile=profile,
+        root=root,
+        hot_threshold=hot_threshold or 0.0,
+        **options,
+    )
+
+    if report:
+        write_report(build_report(results, root, total_time, shard=shard), report)
+
+    if plan:
+        planned = collector.plan()
+        write_plan(planned, plan)
+        if not quiet:
+            print(f"wrote the edits of {len(planned['files'])} files to {plan}")
+
+
+def list_hotspots(files, root, profile, rules=None):
+    """Rank the candidate sites of `files` by the time `profile` spent there.
+
+    Returns list of `hotspots.Hotspot`, paths are relative to `root`
+    """
+    hotspots = []
+    for f in files:
+        file_path = os.path.join(f[0], f[1])
+        # profiles only cover modules
+        if is_notebook(file_path) or skip_file(file_path, rules=rules):
+            continue
+        with open(file_path, encoding="utf8") as fh:
+            contents = fh.read()
+        rel_path = os.path.relpath(file_path, root).replace(os.sep, "/")
+        hotspots += find_hotspots(
+            contents,
+            profile_functions(profile, file_path, root),
+            path=rel_path,
+            rules=rules,
+        )
+    return rank_hotspots(hotspots)
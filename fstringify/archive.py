@@ -0,0 +1,174 @@
+import base64
+import csv
+import hashlib
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+from fstringify.api import rule_stats_line, summary_line
+from fstringify.process import fstringify_code_by_line, merge_rule_stats, skip_code
+from fstringify.report import build_report, write_report
+
+
+TAR_MODES = (
+    (".tar.gz", "gz"),
+    (".tgz", "gz"),
+    (".tar.bz2", "bz2"),
+    (".tar.xz", "xz"),
+    (".tar", ""),
+)
+ZIP_SUFFIXES = (".zip", ".whl")
+
+
+def archive_kind(fn):
+    """Returns `("tar", compression)` or `("zip", None)` for an archive name"""
+    lower = fn.lower()
+    for suffix, compression in TAR_MODES:
+        if lower.endswith(suffix):
+            return "tar", compression
+    if lower.endswith(ZIP_SUFFIXES):
+        return "zip", None
+    raise ValueError(f"`{fn}` isn't a .tar(.gz/.bz2/.xz), .tgz, .zip or .whl file")
+
+
+def convert_member(name, data, **options):
+    """Convert the contents of one archive member if it's Python source.
+
+    Returns `(data, meta)`, `data` is the input bytes when nothing changed
+    and `meta["skipped"]` says why a `.py` member wasn't converted
+    """
+    meta = dict(changed=False, rules={})
+    if not name.endswith(".py"):
+        return data, meta
+    try:
+        code = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data, dict(meta, skipped="not utf-8")
+    if skip_code(code, rules=options.get("rules")):
+        return data, dict(meta, skipped="prefilter")
+
+    new_code, meta = fstringify_code_by_line(code, include_meta=True, **options)
+    if new_code == code:
+        return data, meta
+    return new_code.encode("utf-8"), meta
+
+
+def record_hash(data):
+    """A wheel RECORD hash, see PEP 376 / PEP 427."""
+    digest = hashlib.sha256(data).digest()
+    return "sha256=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def rewrite_record(record, changed):
+    """Update the hash and size of the `changed` `{name: data}` members."""
+    rows = list(csv.reader(io.StringIO(record.decode("utf-8"))))
+    for row in rows:
+        if row and row[0] in changed:
+            row[1:3] = [record_hash(changed[row[0]]), str(len(changed[row[0]]))]
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+def _stream_tar(src, dest, compression, convert):
+    with tarfile.open(src, "r|*") as tin, tarfile.open(
+        dest, "w|" + compression
+    ) as tout:
+        for member in tin:
+            if not member.isfile():
+                tout.addfile(member)
+                continue
+            data = tin.extractfile(member).read()
+            new_data = convert(member.name, data)
+            member.size = len(new_data)
+            # a pax size header would win over `member.size`
+            member.pax_headers.pop("size", None)
+            tout.addfile(member, io.BytesIO(new_data))
+
+
+def _stream_zip(src, dest, convert):
+    changed = {}
+    records = []
+    with zipfile.ZipFile(src) as zin, zipfile.ZipFile(dest, "w") as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if info.filename.endswith(".dist-info/RECORD"):
+                # written last, once the hashes of everything else are known
+                records.append((info, data))
+                continue
+            new_data = data if info.is_dir() else convert(info.filename, data)
+            if new_data is not data:
+                changed[info.filename] = new_data
+            zout.writestr(info, new_data)
+
+        for info, data in records:
+            zout.writestr(info, rewrite_record(data, changed))
+
+
+def fstringify_archive(src, dest, verbose=False, quiet=False, report=None, **options):
+    """Convert the Python files of a tarball, zip or wheel without extracting it.
+
+    Members are read one at a time and written out straight away, everything
+    but changed `.py` files is copied through as is. For wheels the RECORD
+    hashes and sizes of changed files are recomputed. The archive is written
+    next to `dest` first and only renamed to it once it's complete.
+
+    Args:
+        src (str): The archive to read.
+        dest (str): The archive to write, its type follows its name.
+        report (str): Optional file to write a JSON report to.
+
+    Returns `(results, total_time)` like `api.fstringify_files`
+    """
+    if os.path.abspath(src) == os.path.abspath(dest):
+        raise ValueError("the archive can't be converted in place")
+
+    src_kind, _ = archive_kind(src)
+    dest_kind, compression = archive_kind(dest)
+    if src_kind != dest_kind:
+        raise ValueError("can only write the same kind of archive as the input")
+
+    results = []
+    rule_stats = {}
+    start_time = time.time()
+
+    def convert(name, data):
+        member_start = time.time()
+        new_data, meta = convert_member(name, data, **options)
+        if not name.endswith(".py"):
+            return new_data
+        changed = new_data is not data
+        results.append((name, changed, time.time() - member_start, meta["rules"]))
+        merge_rule_stats(rule_stats, meta["rules"])
+        skipped = meta.get("skipped")
+        if skipped and (verbose or skipped == "not utf-8" and not quiet):
+            print(f"fstringifying {name}...skipped ({skipped})")
+        elif verbose:
+            print(f"fstringifying {name}...{'yes' if changed else 'no'}")
+        return new_data
+
+    tmp_dest = f"{dest}.tmp"
+    try:
+        if src_kind == "tar":
+            _stream_tar(src, tmp_dest, compression, convert)
+        else:
+            _stream_zip(src, tmp_dest, convert)
+    except BaseException:
+        if os.path.exists(tmp_dest):
+            os.remove(tmp_dest)
+        raise
+    os.replace(tmp_dest, dest)
+
+    total_time = round(time.time() - start_time, 3)
+    if not quiet:
+        change_count = sum(1 for result in results if result[1])
+        print(f"\n{summary_line(change_count, total_time)}")
+        if verbose and rule_stats:
+            print(rule_stats_line(rule_stats))
+
+    if report:
+        write_report(build_report(results, ".", total_time), report)
+
+    return results, total_time
@@ -0,0 +1,93 @@
+import ast
+import os
+import sys
+
+import astor
+
+
+# Since 3.8 every literal parses to `ast.Constant`, `ast.Str`/`ast.Num` are
+# deprecated shims whose `isinstance` checks go through a Python level
+# metaclass hook, and 3.9 drops `ast.Index` and adds `ast.unparse`. From 3.9 on
+# the nodes are handled as what they are, older interpreters keep the
+# `ast.Str` and astor route. `FSTRINGIFY_LEGACY_AST=1` forces the old route
+# where the shims still exist, to compare the two.
+MODERN_AST = sys.version_info >= (3, 9) and not (
+    os.environ.get("FSTRINGIFY_LEGACY_AST") == "1" and hasattr(ast, "Str")
+)
+NUMBER_TYPES = (int, float, complex)
+# what rules written against the shims have `visit_` methods for
+LEGACY_CONSTANT_NODES = {"Str", "Num", "Bytes", "NameConstant", "Ellipsis"}
+
+if MODERN_AST:
+
+    def is_str(node):
+        """Is `node` a str literal."""
+        return type(node) is ast.Constant and type(node.value) is str
+
+    def is_num(node):
+        """Is `node` a number literal (bools aren't)."""
+        return type(node) is ast.Constant and type(node.value) in NUMBER_TYPES
+
+    def is_constant(node):
+        """Is `node` a literal that evaluates to a constant."""
+        return type(node) is ast.Constant
+
+    def str_value(node):
+        return node.value
+
+    def make_str(value):
+        return ast.Constant(value=value)
+
+    def make_num(value):
+        return ast.Constant(value=value)
+
+    def make_fstring_literal(value):
+        """A literal part of an `ast.JoinedStr`, braces are escaped when written."""
+        return ast.Constant(value=value)
+
+    def make_slice(node):
+        """The `slice` of an `ast.Subscript` for the index `node`."""
+        return node
+
+    def to_source(tree):
+        return ast.unparse(tree) + "\n"
+
+
+else:
+    # astor 0.7 writes the literal parts of f-strings as they are, 0.8 escapes
+    # their braces like `ast.unparse` does
+    ASTOR_ESCAPES_BRACES = "{{" in astor.to_source(ast.parse('f"{{"'))
+
+    def is_str(node):
+        """Is `node` a str literal."""
+        return isinstance(node, ast.Str)
+
+    def is_num(node):
+        """Is `node` a number literal (bools aren't)."""
+        return isinstance(node, ast.Num)
+
+    def is_constant(node):
+        """Is `node` a literal that evaluates to a constant."""
+        return isinstance(node, (ast.Str, ast.Num, ast.NameConstant))
+
+    def str_value(node):
+        return node.s
+
+    def make_str(value):
+        return ast.Str(s=value)
+
+    def make_num(value):
+        return ast.Num(n=value)
+
+    def make_fstring_literal(value):
+        """A literal part of an `ast.JoinedStr`, braces are escaped when written."""
+        if not ASTOR_ESCAPES_BRACES:
+            value = value.replace("{", "{{").replace("}", "}}")
+        return ast.Str(s=value)
+
+    def make_slice(node):
+        """The `slice` of an `ast.Subscript` for the index `node`."""
+        return ast.Index(value=node)
+
+    def to_source(tree):
+        return astor.to_source(tree)
@@ -0,0 +1,179 @@
+import argparse
+import ast
+import cProfile
+import hashlib
+import io
+import json
+import os
+import platform
+import pstats
+import time
+
+from fstringify.notebook import fstringify_notebook_code, is_notebook
+from fstringify.process import fstringify_code_by_line, no_skipping
+
+
+CAPTURE_VERSION = 1
+CAPTURE_DIR = ".fstringify-captures"
+CAPTURE_FILE = "capture.json"
+PROFILE_FILE = "replay.pstats"
+# what a replay needs to convert the source the same way again
+REPLAY_OPTIONS = ("rules", "fast_path", "verify", "target_version")
+DURATION_UNITS = (("ms", 0.001), ("s", 1.0), ("m", 60.0))
+
+
+def parse_duration(value):
+    """Parse a `--capture-slow-threshold` value like `2s` or `500ms` into seconds.
+
+    Plain numbers are seconds.
+    """
+    number, scale = value, 1.0
+    for unit, unit_scale in DURATION_UNITS:
+        if value.endswith(unit):
+            number, scale = value[: -len(unit)], unit_scale
+            break
+    try:
+        seconds = float(number) * scale
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid duration `{value}`, expected like 2s or 500ms"
+        )
+    if seconds < 0:
+        raise argparse.ArgumentTypeError(f"invalid duration `{value}`, it's negative")
+    return seconds
+
+
+def candidate_spans(contents, rules=None):
+    """The `(first, last)` lines of the statements `no_skipping` hands to the rules."""
+    _, scopes_by_idx = no_skipping(contents, rules=rules)
+    return [
+        (idx + 1, idx + len(scopes_by_idx[idx]["raw_scope"]))
+        for idx in sorted(scopes_by_idx)
+    ]
+
+
+def replay_options(options):
+    """The JSON safe part of `fstringify_code_by_line` options worth replaying."""
+    kept = {key: options[key] for key in REPLAY_OPTIONS if options.get(key)}
+    if "rules" in kept:
+        kept["rules"] = [getattr(rule, "name", rule) for rule in kept["rules"]]
+    return kept
+
+
+def write_capture(capture_dir, fn, contents, seconds, stages, options):
+    """Save what it takes to reproduce a slow file into its own directory.
+
+    The source goes next to `capture.json` as `<name>.txt`, so runs over
+    the directory the captures are in don't convert it. `capture.json` has the
+    fstringify and Python versions, the timings and the candidate spans.
+    Captures are named after the file and a hash of its contents, capturing
+    the same contents again replaces the old capture.
+
+    Args:
+        capture_dir (str): Where the captures go, created if needed.
+        fn (str): The path of the slow file.
+        contents (str): Its source, as it was before converting.
+        seconds (float): The end to end time spent on the file.
+        stages (dict): Seconds per stage, see `api.fstringify_file`.
+        options (dict): What `fstringify_code_by_line` got.
+
+    Returns the path of the capture
+    """
+    # the package imports the modules that do the converting
+    from fstringify import __version__
+
+    name = os.path.basename(fn)
+    digest = hashlib.sha256(contents.encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(capture_dir, f"{name}-{digest}")
+    os.makedirs(path, exist_ok=True)
+
+    with open(os.path.join(path, name + ".txt"), "w", encoding="utf8") as f:
+        f.write(contents)
+
+    spans = None
+    if not is_notebook(fn):
+        spans = candidate_spans(contents, rules=options.get("rules"))
+    capture = dict(
+        version=CAPTURE_VERSION,
+        fstringify=__version__,
+        python=platform.python_version(),
+        path=fn,
+        source=name + ".txt",
+        seconds=round(seconds, 6),
+        stages={stage: round(value, 6) for stage, value in stages.items()},
+        spans=spans,
+        options=replay_options(options),
+    )
+    with open(os.path.join(path, CAPTURE_FILE), "w", encoding="utf8") as f:
+        json.dump(capture, f, indent=2, sort_keys=True)
+    return path
+
+
+def load_capture(path):
+    """Read a capture, returns `(capture, contents)`."""
+    with open(os.path.join(path, CAPTURE_FILE), encoding="utf8") as f:
+        capture = json.load(f)
+    if capture.get("version") != CAPTURE_VERSION:
+        raise ValueError(f"`{path}` isn't a version {CAPTURE_VERSION} capture")
+    with open(os.path.join(path, capture["source"]), encoding="utf8") as f:
+        return capture, f.read()
+
+
+def find_captures(path):
+    """`path` itself if it's a capture, or the captures right inside it."""
+    if os.path.isfile(os.path.join(path, CAPTURE_FILE)):
+        return [path]
+    return [
+        os.path.join(path, name)
+        for name in sorted(os.listdir(path))
+        if os.path.isfile(os.path.join(path, name, CAPTURE_FILE))
+    ]
+
+
+def captured_statements(path):
+    """The candidate statements of the captures in `path`, one str each.
+
+    Lines are stripped like `scan.scan_code` does, statements that don't
+    parse on their own that way are left out.
+    """
+    statements = []
+    for capture_path in find_captures(path):
+        capture, contents = load_capture(capture_path)
+        lines = contents.split("\n")
+        for first, last in capture["spans"] or ():
+            statement = "\n".join(line.strip() for line in lines[first - 1 : last])
+            try:
+                ast.parse(statement)
+            except SyntaxError:
+                continue
+            statements.append(statement)
+    return statements
+
+
+def replay_capture(path, top=20, sort="cumulative"):
+    """Convert a captured source again under cProfile, without writing it.
+
+    The profile is also saved as `replay.pstats` in the capture.
+
+    Returns `(capture, seconds, report)`, `report` has the `top` entries of
+    the profile sorted by `sort`
+    """
+    capture, contents = load_capture(path)
+    options = dict(capture["options"])
+    if "target_version" in options:
+        options["target_version"] = tuple(options["target_version"])
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    if is_notebook(capture["path"]):
+        fstringify_notebook_code(contents, **options)
+    else:
+        fstringify_code_by_line(contents, **options)
+    profiler.disable()
+    seconds = time.perf_counter() - start
+
+    profiler.dump_stats(os.path.join(path, PROFILE_FILE))
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(top)
+    return capture, seconds, out.getvalue()
@@ -0,0 +1,305 @@
+import ast
+import collections
+import functools
+import importlib
+import os
+import random
+
+import astor
+
+from fstringify.pool import map_batches
+from fstringify.process import fstringify_code_by_line
+
+
+# `fstringify_code_by_line` options per built in engine, the fast path isn't
+# sampled so its own output is what gets compared
+ENGINES = {
+    "ast": dict(),
+    "fast-path": dict(fast_path=True, sample_fast_path=False),
+    "pep701": dict(target_version=(3, 12)),
+}
+DEFAULT_ENGINES = ("ast", "fast-path")
+# sources are small, a few at a time keeps the pickling overhead low
+DIFF_BATCH_SIZE = 8
+# mismatches from most to least serious, `lost` is an output missing
+# statements of the source, even if all engines agree on it
+KINDS = ("compile", "lost", "ast", "text")
+
+# one mismatch on a source, `repro` is the shrunk source and
+# `outputs` what the engines made of it
+Mismatch = collections.namedtuple("Mismatch", "name kind lineno repro outputs")
+
+
+def resolve_engine(name):
+    """An engine by name, or a `module:function` taking and returning the source."""
+    if name in ENGINES:
+        return functools.partial(fstringify_code_by_line, **ENGINES[name])
+    module, sep, func = name.partition(":")
+    if not sep:
+        raise ValueError(
+            f"unknown engine `{name}`, known: {', '.join(sorted(ENGINES))} "
+            "or module:function"
+        )
+    return getattr(importlib.import_module(module), func)
+
+
+def compiles(code):
+    try:
+        compile(code, "<difftest>", "exec")
+    except (SyntaxError, ValueError):
+        return False
+    return True
+
+
+def first_different_statement(code, other):
+    """The line in `code` of the first top level statement that parses to
+    another AST than its counterpart in `other`, None if they're the same."""
+    body = ast.parse(code).body
+    other_body = ast.parse(other).body
+    for stmt, other_stmt in zip(body, other_body):
+        if ast.dump(stmt) != ast.dump(other_stmt):
+            return stmt.lineno
+    if len(body) > len(other_body):
+        return body[len(other_body)].lineno
+    if len(body) < len(other_body):
+        return body[-1].lineno + 1 if body else 1
+    return None
+
+
+def statement_kinds(code):
+    """`(kind, lineno)` of every statement in `code`, nested ones included."""
+    return [
+        (type(node).__name__, node.lineno)
+        for node in ast.walk(ast.parse(code))
+        if isinstance(node, ast.stmt)
+    ]
+
+
+def lost_statement(code, output):
+    """The line in `code` of the first statement `output` dropped or replaced.
+
+    Converting only rewrites expressions, the statements stay the same
+    whatever the engine, so this catches bugs all of them share. Returns
+    None when nothing was lost.
+    """
+    kinds = statement_kinds(code)
+    output_kinds = [kind for kind, _ in statement_kinds(output)]
+    for (kind, lineno), output_kind in zip(kinds, output_kinds):
+        if kind != output_kind:
+            return lineno
+    if len(kinds) > len(output_kinds):
+        return kinds[len(output_kinds)][1]
+    if len(kinds) < len(output_kinds):
+        return kinds[-1][1] if kinds else 1
+    return None
+
+
+def check_source(code, engines):
+    """Run `code` through every engine and compare the results to the first.
+
+    Returns `(kind, lineno, outputs)`, `kind` is one of `KINDS` (or None
+    when all engines agree) and `lineno` the line of the first disagreeing
+    statement in the first engine's output (or in the failing one's, or in
+    `code` for a lost statement).
+    """
+    outputs = tuple(resolve_engine(engine)(code) for engine in engines)
+    if compiles(code):
+        for output in outputs:
+            if not compiles(output):
+                try:
+                    ast.parse(output)
+                except SyntaxError as e:
+                    return "compile", e.lineno, outputs
+                return "compile", None, outputs
+        for output in outputs:
+            lineno = lost_statement(code, output)
+            if lineno is not None:
+                return "lost", lineno, outputs
+
+    expected = outputs[0]
+    for output in outputs[1:]:
+        if output == expected:
+            continue
+        try:
+            lineno = first_different_statement(expected, output)
+        except SyntaxError:
+            return "compile", None, outputs
+        if lineno is not None:
+            return "ast", lineno, outputs
+        return "text", None, outputs
+    return None, None, outputs
+
+
+def ddmin(items, test):
+    """Zeller's delta debugging, a small sublist of `items` that `test` holds for.
+
+    Args:
+        items (list): What `test` holds for.
+        test (callable): Takes a sublist, the order of `items` is kept.
+
+    Returns list that `test` holds for, with no single chunk left to remove
+    """
+    n = 2
+    while len(items) >= 2:
+        size = -(-len(items) // n)
+        chunks = [items[i : i + size] for i in range(0, len(items), size)]
+        for idx, chunk in enumerate(chunks):
+            complement = [item for other in chunks[:idx] for item in other] + [
+                item for other in chunks[idx + 1 :] for item in other
+            ]
+            if test(chunk):
+                items, n = chunk, 2
+                break
+            if test(complement):
+                items, n = complement, max(n - 1, 2)
+                break
+        else:
+            if n >= len(items):
+                break
+            n = min(len(items), n * 2)
+    return items
+
+
+def shrink(code, engines, kind):
+    """The fewest lines of `code` that still make the engines disagree like `kind`."""
+    lines = code.split("\n")
+
+    def test(candidate):
+        return check_source("\n".join(candidate), engines)[0] == kind
+
+    return "\n".join(ddmin(lines, test))
+
+
+def diff_source(name, code, engines=DEFAULT_ENGINES, shrink_mismatch=True):
+    """Compare the engines on one source, returns a `Mismatch` or None."""
+    kind, lineno, outputs = check_source(code, engines)
+    if kind is None:
+        return None
+    if not shrink_mismatch:
+        return Mismatch(name, kind, lineno, code, outputs)
+    repro = shrink(code, engines, kind)
+    return Mismatch(name, kind, lineno, repro, check_source(repro, engines)[2])
+
+
+def read_sources(path):
+    """`(path, code)` of the file at `path` or of the modules below it."""
+    if os.path.isdir(path):
+        paths = [
+            os.path.join(directory, name)
+            for directory, name in astor.code_to_ast.find_py_files(path)
+        ]
+    else:
+        paths = [path]
+    for fn in sorted(paths):
+        with open(fn, encoding="utf8") as f:
+            yield fn, f.read()
+
+
+def _diff_sources(items, **options):
+    return [diff_source(name, code, **options) for name, code in items]
+
+
+def diff_sources(items, engines=DEFAULT_ENGINES, jobs=1, shrink_mismatch=True):
+    """Compare the engines on many sources, on `jobs` worker processes.
+
+    Args:
+        items (iterable): `(name, code)` pairs.
+        engines (sequence): Engine names (see `resolve_engine`), the first
+            one is the reference.
+        jobs (int): Number of worker processes.
+        shrink_mismatch (bool): Reduce every mismatch to a minimal repro.
+
+    Returns list of `Mismatch`, worst `kind` first
+    """
+    items = list(items)
+    compare = functools.partial(
+        _diff_sources, engines=tuple(engines), shrink_mismatch=shrink_mismatch
+    )
+    if jobs > 1 and len(items) > 1:
+        results = map_batches(compare, items, jobs, DIFF_BATCH_SIZE)
+    else:
+        results = compare(items)
+    return sorted(
+        (result for result in results if result is not None),
+        key=lambda mismatch: KINDS.index(mismatch.kind),
+    )
+
+
+FUZZ_FLAGS = ("", "", "", "-", "0", "+", " ", "#", "-0", "+ ")
+FUZZ_CONVERSIONS = "sssssdddrfiueEgGxXoca"
+FUZZ_TEXT = ("", "", "a", "id=", " ", ": ", "{", "}", "{}", "'", '"', "%%", "\t")
+FUZZ_OPERANDS = (
+    "x",
+    "obj.attr",
+    "a.b.c",
+    "f(x)",
+    "len(s)",
+    "d['k']",
+    "'lit'",
+    '"it\'s"',
+    "1",
+    "2.5",
+    "None",
+    "x if y else z",
+    "-n",
+    "t[0]",
+)
+
+
+def random_spec(rng, key=None):
+    spec = "%" + (f"({key})" if key else "") + rng.choice(FUZZ_FLAGS)
+    if rng.random() < 0.3:
+        spec += str(rng.randint(1, 12))
+    if rng.random() < 0.2:
+        spec += "." + str(rng.randint(0, 6))
+    return spec + rng.choice(FUZZ_CONVERSIONS)
+
+
+def random_mod_expression(rng):
+    """A random `%` expression, mostly valid, with the edge cases the rules know about."""
+    count = rng.choice((1, 1, 2, 3))
+    keyed = rng.random() < 0.25
+    keys = [rng.choice("abc") for _ in range(count)]
+    specs = [random_spec(rng, keys[i] if keyed else None) for i in range(count)]
+    fmt = rng.choice(FUZZ_TEXT)
+    for spec in specs:
+        fmt += spec + rng.choice(FUZZ_TEXT)
+
+    operands = [rng.choice(FUZZ_OPERANDS) for _ in range(count)]
+    if keyed and rng.random() < 0.5:
+        right = "mapping"
+    elif keyed:
+        right = "{" + ", ".join(f"{key!r}: {op}" for key, op in zip(keys, operands))
+        right += "}"
+    elif count == 1 and rng.random() < 0.5:
+        right = operands[0]
+    else:
+        right = "(" + ", ".join(operands) + ("," if count == 1 else "") + ")"
+    if " " in right and not right.startswith(("(", "{")):
+        right = f"({right})"
+    return f"{fmt!r} % {right}"
+
+
+def random_module(rng, statements=20):
+    """A module of up to `statements` `random_mod_expression` assignments.
+
+    Some of them are indented. Sites can be on the first line, and some
+    modules are a single line or end without a newline, like notebook cells
+    and snippets piped in from an editor.
+    """
+    lines = []
+    for idx in range(rng.randint(1, statements)):
+        statement = f"v{idx} = {random_mod_expression(rng)}"
+        if rng.random() < 0.2:
+            lines += ["if v:", "    " + statement]
+        else:
+            lines.append(statement)
+    return "\n".join(lines) + rng.choice(("\n", "\n", ""))
+
+
+def fuzz_sources(count, seed=0, statements=20):
+    """`count` `(name, code)` pairs of `random_module`, the same for the same seed."""
+    rng = random.Random(seed)
+    return [
+        (f"fuzz-{seed}-{idx}", random_module(rng, statements)) for idx in range(count)
+    ]
@@ -0,0 +1,71 @@
+import collections
+
+
+# one decision of a rule, `reason` is None for converted sites
+Site = collections.namedtuple("Site", "rule lineno col_offset reason")
+
+HOOKS = (
+    "on_run_start",
+    "on_file_start",
+    "on_file_skipped",
+    "on_site_converted",
+    "on_site_rejected",
+    "on_file_done",
+    "on_run_done",
+)
+
+
+class Observer:
+    """Base class for following a run, override the hooks you need.
+
+    Observers don't have to inherit from this, any object with some of the
+    `on_*` methods works. Hooks that aren't overridden are never called.
+    """
+
+    def on_run_start(self, total):
+        """`total` files are about to be converted."""
+
+    def on_file_start(self, path):
+        """`path` is being converted (in a worker when there are workers)."""
+
+    def on_file_skipped(self, path, reason):
+        """`path` wasn't converted at all, `reason` is like `"prefilter"`."""
+
+    def on_site_converted(self, path, site):
+        """A rule rewrote `site` (a `Site`) of `path`."""
+
+    def on_site_rejected(self, path, site):
+        """A rule left `site` of `path` alone, `site.reason` says why."""
+
+    def on_file_done(self, path, changed, meta, seconds, error):
+        """`path` is done, `error` is None or a message if it failed."""
+
+    def on_run_done(self, summary):
+        """All files are done, `summary` has the totals of the run."""
+
+
+class Dispatcher:
+    """Call the hooks of some observers.
+
+    Every hook is a list of the bound methods that observers override, so
+    emitting goes like `for hook in events.on_file_done: hook(...)` and costs
+    an empty loop when nobody listens. Check `events.wants_sites` before
+    collecting site decisions at all.
+    """
+
+    def __init__(self, observers=()):
+        for hook in HOOKS:
+            base = getattr(Observer, hook)
+            setattr(
+                self,
+                hook,
+                [
+                    getattr(observer, hook)
+                    for observer in observers
+                    if getattr(type(observer), hook, base) is not base
+                ],
+            )
+
+    @property
+    def wants_sites(self):
+        return bool(self.on_site_converted or self.on_site_rejected)
@@ -0,0 +1,149 @@
+import ast
+import io
+import keyword
+import token
+import tokenize
+
+from fstringify.utils import VAR_KEY_PATTERN
+
+
+# tokens that may come right before the format string without the `%` binding
+# to something else than the string literal
+FAST_PATH_BEFORE = {"(", "[", "{", ",", "=", "return", "yield"}
+# tokens that may come right after the right operand
+FAST_PATH_AFTER = {")", "]", "}", ","}
+# any other binary operator in the statement might be an ancestor of the `%`
+# node, and the AST route leaves those alone
+BINARY_OPS = {"+", "-", "*", "/", "//", "@", "**", "<<", ">>", "&", "|", "^", "%"}
+SKIP_TOKENS = (
+    token.NL,
+    token.NEWLINE,
+    token.ENDMARKER,
+    token.INDENT,
+    token.DEDENT,
+    tokenize.ENCODING,
+)
+
+
+def _parse_name(tokens, idx):
+    """Parse `name(.attr)*` starting at `idx`, returns `(text, next_idx)`"""
+    parts = []
+    while idx < len(tokens):
+        tok = tokens[idx]
+        if tok.type != token.NAME or keyword.iskeyword(tok.string):
+            return None, idx
+        parts.append(tok.string)
+        idx += 1
+        if idx < len(tokens) and tokens[idx].string == ".":
+            idx += 1
+            continue
+        return ".".join(parts), idx
+
+    return None, idx
+
+
+def _parse_operands(tokens, idx):
+    """Parse the right side of the `%`, a name or a tuple of names"""
+    if idx < len(tokens) and tokens[idx].string == "(":
+        names = []
+        idx += 1
+        while idx < len(tokens) and tokens[idx].string != ")":
+            name, idx = _parse_name(tokens, idx)
+            if name is None:
+                return None, idx
+            names.append(name)
+            if idx < len(tokens) and tokens[idx].string == ",":
+                idx += 1
+            elif idx < len(tokens) and tokens[idx].string != ")":
+                return None, idx
+        return names, idx + 1
+
+    name, idx = _parse_name(tokens, idx)
+    return (None if name is None else [name]), idx
+
+
+def fast_fstringify(code, tokens=None):
+    """Convert a trivial single line `%` format without going through the AST.
+
+    Only handles `"literal %s literal" % name` and `% (a, b.c)` where the
+    operands are plain names or attributes, everything else returns None and
+    is left to `fstringify_code`. The rest of the line is kept as written.
+
+    Args:
+        code (str): A single statement.
+        tokens (list): The statement's tokens if they are already known.
+
+    Returns the converted (stripped) statement or None
+    """
+    if "%" not in code:
+        return None
+
+    if tokens is None:
+        try:
+            tokens = list(tokenize.tokenize(io.BytesIO(code.encode("utf-8")).readline))
+        except (tokenize.TokenError, SyntaxError):
+            return None
+
+    tokens = [tok for tok in tokens if tok.type not in SKIP_TOKENS]
+    if not tokens or tokens[0].start[0] != tokens[-1].end[0]:
+        return None
+
+    mod_idxs = [
+        idx
+        for idx, tok in enumerate(tokens)
+        if tok.type == token.OP and tok.string in BINARY_OPS
+    ]
+    if len(mod_idxs) != 1 or tokens[mod_idxs[0]].string != "%":
+        return None
+
+    mod_idx = mod_idxs[0]
+    if mod_idx == 0 or tokens[mod_idx - 1].type != token.STRING:
+        return None
+
+    str_tok = tokens[mod_idx - 1]
+    if mod_idx > 1 and tokens[mod_idx - 2].string not in FAST_PATH_BEFORE:
+        return None
+
+    literal = str_tok.string
+    if literal[0] not in "'\"" or literal[:3] in ('"""', "'''"):
+        return None
+
+    body = literal[1:-1]
+    if any(ch in body for ch in "\\{}"):
+        return None
+
+    matches = VAR_KEY_PATTERN.findall(body)
+    if not matches or body.count("%") != len(matches):
+        return None
+
+    operands, end_idx = _parse_operands(tokens, mod_idx + 1)
+    if operands is None or len(operands) != len(matches):
+        return None
+
+    if end_idx < len(tokens):
+        after = tokens[end_idx]
+        if after.type != tokenize.COMMENT and after.string not in FAST_PATH_AFTER:
+            return None
+
+    quote = '"' if '"' not in body else "'"
+    operands.reverse()
+    parts = []
+    for block in VAR_KEY_PATTERN.split(body):
+        if VAR_KEY_PATTERN.match(block):
+            parts.append("{" + operands.pop() + "}")
+        else:
+            parts.append(block)
+    fstring = "f" + quote + "".join(parts) + quote
+
+    line = str_tok.line
+    start_col = str_tok.start[1]
+    end_col = tokens[end_idx - 1].end[1]
+    return (line[:start_col] + fstring + line[end_col:]).strip()
+
+
+def same_ast(code, other):
+    """Check if two snippets of code parse to the same AST."""
+    try:
+        return ast.dump(ast.parse(code)) == ast.dump(ast.parse(other))
+    except SyntaxError:
+        return False
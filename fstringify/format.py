@@ -1,7 +1,5 @@
 import re
 
-import black
-
 
 class Leaf:
     """Bare minimum implemention of black `Leaf`"""
@@ -23,6 +21,23 @@ def force_double_quote_fstring(code):
     if '"' in org or "\\" in org:
         return code
 
-    leaf = Leaf(org)
-    black.normalize_string_quotes(leaf)  # mutates the argument
-    return code.replace(org, leaf.value)
+    return code.replace(org, normalize_string_quotes(org))
+
+
+def normalize_string_quotes(value):
+    """black's quote normalization for one string literal.
+
+    black takes a while to import, so it's only imported once a converted
+    statement needs it. Newer versions moved the function to `black.strings`
+    and have it take and return the str instead of mutating a leaf.
+    """
+    import black
+
+    if hasattr(black, "normalize_string_quotes"):
+        leaf = Leaf(value)
+        black.normalize_string_quotes(leaf)  # mutates the argument
+        return leaf.value
+
+    from black.strings import normalize_string_quotes as normalize
+
+    return normalize(value)
@@ -0,0 +1,160 @@
+import ast
+import collections
+import os
+import pstats
+
+from fstringify.process import get_candidate_chunks
+
+
+FunctionTime = collections.namedtuple(
+    "FunctionTime", "name lineno calls tottime cumtime"
+)
+Hotspot = collections.namedtuple(
+    "Hotspot", "path start end function calls tottime cumtime"
+)
+
+# what a site outside of any profiled function is charged with
+NO_TIME = FunctionTime(None, 0, 0, 0.0, 0.0)
+
+
+def normalize_path(path):
+    return os.path.normcase(os.path.abspath(path)).replace(os.sep, "/")
+
+
+def load_profile(fn):
+    """Load a `cProfile` / `pstats` dump and group its functions by file.
+
+    Args:
+        fn (str): A file written by `cProfile.Profile.dump_stats` or
+            `python -m cProfile -o`.
+
+    Returns dict of normalized file path -> list of `FunctionTime`
+    """
+    profile = collections.defaultdict(list)
+    for (path, lineno, name), (_, calls, tottime, cumtime, _) in pstats.Stats(
+        fn
+    ).stats.items():
+        # built-ins are recorded as `("~", 0, "<built-in method ...>")`
+        if path == "~" or not lineno:
+            continue
+        profile[normalize_path(path)].append(
+            FunctionTime(name, lineno, calls, tottime, cumtime)
+        )
+    return dict(profile)
+
+
+def profile_functions(profile, file_path, root):
+    """Find the profiled functions of `file_path`.
+
+    The profile may have been recorded on another machine or from another
+    checkout, so when the absolute paths don't match the file is looked up
+    by its path relative to `root` instead.
+
+    Returns list of `FunctionTime`
+    """
+    path = normalize_path(file_path)
+    if path in profile:
+        return profile[path]
+
+    rel_path = "/" + os.path.relpath(file_path, root).replace(os.sep, "/")
+    for profiled_path, functions in profile.items():
+        if profiled_path.endswith(rel_path):
+            return functions
+
+    return []
+
+
+def function_ranges(code):
+    """Find the line range of every function in `code`.
+
+    Returns list of `(first_lines, start, end)` tuples where `first_lines` are
+    the lines a profile can use for the function (its decorators and `def`)
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+
+    ranges = []
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        first_lines = {node.lineno} | {dec.lineno for dec in node.decorator_list}
+        # 3.8+ knows where a node ends, before that the last line any child
+        # starts on has to do, statements spanning lines are cut short
+        end = getattr(node, "end_lineno", None) or max(
+            getattr(child, "lineno", node.lineno) for child in ast.walk(node)
+        )
+        ranges.append((first_lines, min(first_lines), end))
+    return ranges
+
+
+def find_hotspots(code, functions, path="", rules=None):
+    """Charge every candidate statement with the time of its function.
+
+    A `%` runs in the body of the innermost function around it, so that
+    function's own time (`tottime`) is the estimate of what converting the
+    site can gain while its `cumtime` is what `--hot-threshold` compares.
+    Module level sites are charged with the module's `<module>` entry.
+
+    Args:
+        code (str): The module source.
+        functions (list): The module's `FunctionTime`s, see `profile_functions`.
+        path (str): Reported as the `path` of the hotspots.
+        rules (iterable): Rules to find candidates for.
+
+    Returns list of `Hotspot`
+    """
+    by_lineno = collections.defaultdict(list)
+    for function in functions:
+        by_lineno[function.lineno].append(function)
+    module = next((f for f in functions if f.name == "<module>"), NO_TIME)
+
+    timed_ranges = []
+    for first_lines, start, end in function_ranges(code):
+        timed = [f for lineno in first_lines for f in by_lineno[lineno]]
+        if timed:
+            timed_ranges.append((start, end, max(timed, key=lambda f: f.cumtime)))
+
+    hotspots = []
+    for (start, end), _, _ in get_candidate_chunks(code, rules=rules):
+        enclosing = [r for r in timed_ranges if r[0] <= start and end <= r[1]]
+        # the innermost function is the one starting last
+        function = max(enclosing, key=lambda r: r[0])[2] if enclosing else module
+        hotspots.append(
+            Hotspot(
+                path,
+                start,
+                end,
+                function.name,
+                function.calls,
+                function.tottime,
+                function.cumtime,
+            )
+        )
+    return hotspots
+
+
+def hot_lines(hotspots, threshold):
+    """The lines of the hotspots whose function took at least `threshold`s."""
+    return {
+        lineno
+        for spot in hotspots
+        if spot.cumtime >= threshold
+        for lineno in range(spot.start, spot.end + 1)
+    }
+
+
+def rank_hotspots(hotspots):
+    """Order hotspots by estimated runtime impact, biggest first."""
+    return sorted(
+        hotspots, key=lambda s: (-s.tottime, -s.cumtime, -s.calls, s.path, s.start)
+    )
+
+
+def hotspot_line(spot):
+    function = spot.function or "-"
+    return (
+        f"{spot.tottime:10.6f} {spot.cumtime:10.6f} {spot.calls:8} "
+        f"{spot.path}:{spot.start} ({function})"
+    )
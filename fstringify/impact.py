@@ -0,0 +1,260 @@
+import ast
+import copy
+import json
+import math
+import os
+import timeit
+
+from fstringify.astcompat import MODERN_AST, is_num, is_str, str_value, to_source
+from fstringify.notebook import is_notebook
+from fstringify.process import get_candidate_chunks, skip_file
+from fstringify.transform import (
+    FstringifyTransformer,
+    fstringify_node,
+    split_format_str,
+)
+
+
+IMPACT_NUMBER = 20000
+IMPACT_REPEAT = 5
+# what an operand stands in for when it isn't a literal itself
+DUMMY_VALUES = {"str": "some text", "int": 123456, "float": 3.14159}
+# all the harness expressions may contain once the operands are swapped out
+HARNESS_NODES = (
+    ast.Module,
+    ast.Assign,
+    ast.Store,
+    ast.Load,
+    ast.BinOp,
+    ast.Mod,
+    ast.Name,
+    ast.Tuple,
+    ast.Dict,
+    ast.Subscript,
+    ast.JoinedStr,
+    ast.FormattedValue,
+) + ((ast.Constant,) if MODERN_AST else (ast.Str, ast.Num, ast.Index))
+
+
+def dummy_type(conv):
+    """The operand type a printf conversion type like `d` or `s` hints at."""
+    if conv in "diuxXoc":
+        return "int"
+    if conv in "eEfFgG":
+        return "float"
+    return "str"
+
+
+class ImpactTransformer(FstringifyTransformer):
+    """The `percent` rule, but it also keeps `(node, converted)` of every site."""
+
+    def __init__(self):
+        super().__init__()
+        self.converted = []
+
+    def visit_BinOp(self, node):
+        counter = self.counter
+        result = super().visit_BinOp(node)
+        if self.counter > counter:
+            self.converted.append((node, result))
+        return result
+
+
+class _SwapOperands(ast.NodeTransformer):
+    def __init__(self, names):
+        self.names = names
+
+    def visit(self, node):
+        if id(node) in self.names:
+            return ast.Name(id=self.names[id(node)], ctx=ast.Load())
+        return super().visit(node)
+
+
+def build_harness(node, converted):
+    """Turn a converted site into two expressions over dummy operands.
+
+    Every operand of the `%` (the tuple items, dict values or the single
+    value on the right) that isn't a literal is replaced by a name bound to
+    a dummy of the type its specifier hints at, `str` by default. Nothing of
+    the user's code is left that could run.
+
+    Args:
+        node (ast.BinOp): The original `%` node.
+        converted (ast.AST): What `FstringifyTransformer` turned it into.
+
+    Returns `(before, after, namespace, types)` or None if it can't be timed
+    """
+    specs = [
+        part
+        for part in split_format_str(str_value(node.left))
+        if not isinstance(part, str)
+    ]
+    keyed = any(spec[0] is not None for spec in specs)
+
+    if isinstance(node.right, ast.Tuple):
+        operands = [(elt, [spec]) for elt, spec in zip(node.right.elts, specs)]
+    elif isinstance(node.right, ast.Dict):
+        operands = [
+            (
+                value,
+                [spec for spec in specs if is_str(key) and spec[0] == str_value(key)],
+            )
+            for key, value in zip(node.right.keys, node.right.values)
+        ]
+    else:
+        operands = [(node.right, specs)]
+
+    # the converted node shares the operand nodes, copy both in one go to keep that
+    operands, node, converted = copy.deepcopy((operands, node, converted))
+
+    names = {}
+    namespace = {"__builtins__": {}}
+    types = {}
+    for idx, (operand, operand_specs) in enumerate(operands):
+        name = f"_v{idx}"
+        names[id(operand)] = name
+        if keyed and not isinstance(node.right, ast.Dict):
+            # `"%(a)s" % mapping`, the operand is the mapping itself
+            types[name] = {spec[0]: dummy_type(spec[4]) for spec in operand_specs}
+            namespace[name] = {key: DUMMY_VALUES[t] for key, t in types[name].items()}
+            continue
+        if is_str(operand) or is_num(operand):
+            # literals are safe to keep, and Python may fold them already
+            del names[id(operand)]
+            continue
+        types[name] = dummy_type(operand_specs[0][4]) if operand_specs else "str"
+        namespace[name] = DUMMY_VALUES[types[name]]
+
+    swap = _SwapOperands(names)
+    sources = []
+    for expr in (node, converted):
+        # parsed rather than built, so it has the fields of this Python's nodes
+        tree = ast.parse("_result = _")
+        tree.body[0].value = swap.visit(expr)
+        if not all(isinstance(child, HARNESS_NODES) for child in ast.walk(tree)):
+            return None
+        sources.append(to_source(tree).strip())
+
+    return sources[0], sources[1], namespace, types
+
+
+def time_expression(source, namespace, number=IMPACT_NUMBER, repeat=IMPACT_REPEAT):
+    """Best time of `source` in nanoseconds per run."""
+    timer = timeit.Timer(source, globals=dict(namespace))
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def measure_code(code, path="", number=IMPACT_NUMBER, repeat=IMPACT_REPEAT):
+    """Time every `%` site of a module before and after conversion.
+
+    The sites are found and converted just like `fstringify_code_by_line`
+    does, but the result is only used to build the timing harnesses.
+
+    Returns list of site dicts
+    """
+    raw_lines = code.split("\n")
+    sites = []
+    for (start, end), _, _ in get_candidate_chunks(code, rules=["percent"]):
+        statement = "\n".join(line.strip() for line in raw_lines[start - 1 : end])
+        try:
+            tree = ast.parse(statement)
+        except SyntaxError:
+            continue
+
+        rule = ImpactTransformer()
+        fstringify_node(tree, rules=[rule])
+        for node, converted in rule.converted:
+            harness = build_harness(node, converted)
+            if harness is None:
+                continue
+            before, after, namespace, types = harness
+            before_ns = time_expression(before, namespace, number, repeat)
+            after_ns = time_expression(after, namespace, number, repeat)
+            sites.append(
+                dict(
+                    path=path,
+                    line=start + node.lineno - 1,
+                    before=before[len("_result = ") :],
+                    after=after[len("_result = ") :],
+                    operands=types,
+                    before_ns=round(before_ns, 1),
+                    after_ns=round(after_ns, 1),
+                    speedup=round(before_ns / after_ns, 2) if after_ns else None,
+                )
+            )
+    return sites
+
+
+def measure_files(files, root, **options):
+    """`measure_code` for `(dir, name)` files, paths are relative to `root`."""
+    sites = []
+    for f in files:
+        file_path = os.path.join(f[0], f[1])
+        if is_notebook(file_path) or skip_file(file_path, rules=["percent"]):
+            continue
+        with open(file_path, encoding="utf8") as fh:
+            contents = fh.read()
+        rel_path = os.path.relpath(file_path, root).replace(os.sep, "/")
+        sites += measure_code(contents, path=rel_path, **options)
+    return sites
+
+
+def build_impact_report(sites):
+    """Per site timings plus the totals and the geometric mean speedup."""
+    before_ns = sum(site["before_ns"] for site in sites)
+    after_ns = sum(site["after_ns"] for site in sites)
+    speedups = [site["speedup"] for site in sites if site["speedup"]]
+    geo_mean = (
+        math.exp(sum(math.log(s) for s in speedups) / len(speedups))
+        if speedups
+        else None
+    )
+    return dict(
+        sites=sites,
+        summary=dict(
+            sites=len(sites),
+            before_ns=round(before_ns, 1),
+            after_ns=round(after_ns, 1),
+            speedup=round(before_ns / after_ns, 2) if after_ns else None,
+            geo_mean_speedup=round(geo_mean, 2) if geo_mean else None,
+        ),
+    )
+
+
+def impact_markdown(report):
+    summary = report["summary"]
+    lines = [
+        "# fstringify impact report",
+        "",
+        f"{summary['sites']} sites, {summary['before_ns']} ns before, "
+        f"{summary['after_ns']} ns after per evaluation of each site once: "
+        f"{summary['speedup']}x faster (geometric mean per site "
+        f"{summary['geo_mean_speedup']}x).",
+        "",
+        "| site | before | after | operands | ns before | ns after | speedup |",
+        "| --- | --- | --- | --- | ---: | ---: | ---: |",
+    ]
+    for site in report["sites"]:
+        cells = (
+            f"{site['path']}:{site['line']}",
+            f"`{site['before']}`",
+            f"`{site['after']}`",
+            ", ".join(f"{name}: {t}" for name, t in site["operands"].items()),
+            site["before_ns"],
+            site["after_ns"],
+            f"{site['speedup']}x",
+        )
+        lines.append(
+            "| " + " | ".join(str(c).replace("|", "\\|") for c in cells) + " |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_impact_report(report, fn):
+    """Write markdown for `.md` files and JSON otherwise."""
+    with open(fn, "w", encoding="utf8") as f:
+        if fn.endswith(".md"):
+            f.write(impact_markdown(report))
+        else:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
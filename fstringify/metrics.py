@@ -0,0 +1,114 @@
+import collections
+import os
+import time
+
+from fstringify.events import Observer
+
+
+# seconds between rewrites of the metrics file
+METRICS_INTERVAL = 15.0
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+
+    def samples(self, name):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket{{le="{bound:g}"}} {count}'
+        yield f'{name}_bucket{{le="+Inf"}} {self.count}'
+        yield f"{name}_count {self.count}"
+        yield f"{name}_sum {self.sum:g}"
+
+
+class MetricsWriter(Observer):
+    """Keep counters and histograms of a run in a metrics text file.
+
+    The file is in the Prometheus text format node_exporter's textfile
+    collector reads (counter families are named after their `_total`
+    samples, which OpenMetrics parsers don't accept).
+
+    The file is rewritten at most every `interval` seconds (and at the end)
+    by writing a temporary file and renaming it, so the collector never sees
+    half a file.
+
+    Args:
+        fn (str): The `.prom` file to write.
+        interval (float): Seconds between rewrites.
+    """
+
+    def __init__(self, fn, interval=METRICS_INTERVAL):
+        self.fn = fn
+        self.interval = interval
+        self.last_write = 0.0
+        self.start = time.time()
+        self.files = collections.Counter()
+        self.bytes = 0
+        self.stages = collections.Counter()
+        self.rules = collections.Counter()
+        self.seconds = Histogram(SECONDS_BUCKETS)
+        self.file_bytes = Histogram(BYTES_BUCKETS)
+
+    def on_file_done(self, path, changed, meta, seconds, error):
+        self.update(changed, seconds, meta, error)
+
+    def on_run_done(self, summary):
+        self.write()
+
+    def update(self, changed, seconds, meta, error=None):
+        self.files["failed" if error else "changed" if changed else "unchanged"] += 1
+        self.bytes += meta.get("bytes", 0)
+        self.stages.update(meta.get("stages", {}))
+        for name, counters in meta.get("rules", {}).items():
+            self.rules[name] += counters.get("changed", 0)
+        self.seconds.observe(seconds)
+        self.file_bytes.observe(meta.get("bytes", 0))
+
+        now = time.time()
+        if now - self.last_write >= self.interval:
+            self.last_write = now
+            self.write()
+
+    def lines(self):
+        yield "# HELP fstringify_files_total Files processed by result."
+        yield "# TYPE fstringify_files_total counter"
+        for result in ("changed", "unchanged", "failed"):
+            yield f'fstringify_files_total{{result="{result}"}} {self.files[result]}'
+        yield "# HELP fstringify_bytes_total Bytes of source processed."
+        yield "# TYPE fstringify_bytes_total counter"
+        yield f"fstringify_bytes_total {self.bytes}"
+        yield "# HELP fstringify_sites_total Sites converted by rule."
+        yield "# TYPE fstringify_sites_total counter"
+        for name, count in sorted(self.rules.items()):
+            yield f'fstringify_sites_total{{rule="{name}"}} {count}'
+        yield "# HELP fstringify_stage_seconds_total Time spent per stage of a file."
+        yield "# TYPE fstringify_stage_seconds_total counter"
+        for stage, seconds in sorted(self.stages.items()):
+            yield f'fstringify_stage_seconds_total{{stage="{stage}"}} {seconds:g}'
+        yield "# HELP fstringify_file_seconds Time to process one file."
+        yield "# TYPE fstringify_file_seconds histogram"
+        yield from self.seconds.samples("fstringify_file_seconds")
+        yield "# HELP fstringify_file_bytes Size of the processed files."
+        yield "# TYPE fstringify_file_bytes histogram"
+        yield from self.file_bytes.samples("fstringify_file_bytes")
+        yield "# HELP fstringify_run_start_seconds When the run started."
+        yield "# TYPE fstringify_run_start_seconds gauge"
+        yield f"fstringify_run_start_seconds {self.start:.3f}"
+
+    def write(self):
+        tmp_fn = f"{self.fn}.tmp"
+        with open(tmp_fn, "w", encoding="utf8") as f:
+            f.write("\n".join(self.lines()) + "\n")
+        os.replace(tmp_fn, self.fn)
@@ -0,0 +1,104 @@
+import json
+import os
+
+from fstringify.process import (
+    fstringify_code_by_line,
+    get_trigger_tokens,
+    merge_rule_stats,
+)
+
+
+NOTEBOOK_SUFFIX = ".ipynb"
+# Jupyter keeps copies of every notebook in there, they aren't the user's code
+CHECKPOINT_DIR = ".ipynb_checkpoints"
+# lines IPython handles itself: magics and shell escapes, they aren't Python
+IPYTHON_PREFIXES = ("%", "!")
+
+
+def is_notebook(fn):
+    return fn.endswith(NOTEBOOK_SUFFIX)
+
+
+def find_notebooks(srctree):
+    """Like `astor.code_to_ast.find_py_files`, but for `.ipynb` files."""
+    for srcpath, dirnames, fnames in os.walk(srctree):
+        dirnames[:] = [name for name in dirnames if name != CHECKPOINT_DIR]
+        for fname in fnames:
+            if is_notebook(fname):
+                yield srcpath, fname
+
+
+def code_cells(notebook):
+    """The code cells of a notebook and their source as one str."""
+    for cell in notebook.get("cells", ()):
+        if cell.get("cell_type") == "code":
+            source = cell.get("source", "")
+            yield cell, source if isinstance(source, str) else "".join(source)
+
+
+def skip_notebook(contents, rules=None):
+    """The prefilter for notebooks, looks for the trigger tokens in code cells.
+
+    Textual, unlike `process.skip_file`, and only for the cells, as the
+    notebook format itself has words like "nbformat" in it.
+
+    Args:
+        contents (str): The notebook file.
+    """
+    try:
+        notebook = json.loads(contents)
+    except ValueError:
+        # not JSON, so nothing Jupyter could open either
+        return True
+    triggers = get_trigger_tokens(rules)
+    return not any(tok in code for _, code in code_cells(notebook) for tok in triggers)
+
+
+def has_ipython_syntax(code):
+    return any(line.lstrip().startswith(IPYTHON_PREFIXES) for line in code.split("\n"))
+
+
+def fstringify_notebook_code(contents, **options):
+    """Convert the code cells of a notebook's JSON.
+
+    Cells are converted one at a time with `fstringify_code_by_line`, cells
+    using magics or shell escapes are left alone. Everything but the source
+    of changed cells (outputs, metadata, key order) is written back as it
+    was read, with the 1 space indentation Jupyter uses.
+
+    Args:
+        contents (str): The notebook file.
+
+    Returns `(contents, meta)`, `contents` is the input when nothing changed.
+    Sites in `meta["sites"]` count lines within their cell.
+    """
+    notebook = json.loads(contents)
+    meta = dict(changed=False, rules={})
+    if options.get("collect_sites"):
+        meta["sites"] = []
+
+    for cell, code in code_cells(notebook):
+        if has_ipython_syntax(code):
+            continue
+
+        new_code, cell_meta = fstringify_code_by_line(
+            code, include_meta=True, **options
+        )
+        merge_rule_stats(meta["rules"], cell_meta["rules"])
+        if "sites" in meta:
+            meta["sites"] += cell_meta.get("sites", [])
+        if new_code == code:
+            continue
+
+        meta["changed"] = True
+        cell["source"] = (
+            new_code if isinstance(cell["source"], str) else new_code.splitlines(True)
+        )
+
+    if not meta["changed"]:
+        return contents, meta
+
+    new_contents = json.dumps(notebook, indent=1, ensure_ascii=False)
+    if contents.endswith("\n"):
+        new_contents += "\n"
+    return new_contents, meta
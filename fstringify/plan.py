@@ -0,0 +1,153 @@
+import difflib
+import hashlib
+import json
+import os
+
+from fstringify.events import Observer
+from fstringify.shard import shard_files
+
+
+PLAN_VERSION = 1
+
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_newline(line):
+    """`line` ending in `\n` like universal newlines mode reads it."""
+    if line.endswith("\r\n"):
+        return line[:-2] + "\n"
+    if line.endswith("\r"):
+        return line[:-1] + "\n"
+    return line
+
+
+def compute_edits(old, new):
+    """The replacements that turn `old` into `new`, a line based diff.
+
+    `new` is read with universal newlines, so the lines are compared with
+    normalized newlines and the replacements get the newlines of `old`
+    (`\r\n` if it has any), a CRLF file doesn't become one big edit.
+
+    Args:
+        old (str): The source as it is on disk.
+        new (str): The converted source.
+
+    Returns list of `[start, end, replacement]`, `start` and `end` are byte
+    offsets into the UTF-8 encoded `old`
+    """
+    old_lines = old.splitlines(True)
+    new_lines = [normalize_newline(line) for line in new.splitlines(True)]
+    newline = "\r\n" if "\r\n" in old else "\n"
+    offsets = [0]
+    for line in old_lines:
+        offsets.append(offsets[-1] + len(line.encode("utf-8")))
+
+    matcher = difflib.SequenceMatcher(
+        None, [normalize_newline(line) for line in old_lines], new_lines, autojunk=False
+    )
+    return [
+        [offsets[i1], offsets[i2], "".join(new_lines[j1:j2]).replace("\n", newline)]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_edits(data, edits):
+    """Splice `compute_edits` replacements into the bytes they were made for."""
+    for start, end, replacement in reversed(edits):
+        data = data[:start] + replacement.encode("utf-8") + data[end:]
+    return data
+
+
+def plan_entry(data, new_code):
+    """What `fstringify_file` puts in `meta["plan"]` for a changed file."""
+    edits = compute_edits(data.decode("utf-8"), new_code)
+    return dict(
+        sha256=file_hash(data),
+        new_sha256=file_hash(apply_edits(data, edits)),
+        edits=edits,
+    )
+
+
+class PlanCollector(Observer):
+    """Gather the `meta["plan"]` of the changed files of a `plan` run."""
+
+    def __init__(self):
+        self.files = []
+
+    def on_file_done(self, path, changed, meta, seconds, error):
+        if changed and "plan" in meta:
+            self.files.append(dict(path=plan_path(path), **meta["plan"]))
+
+    def plan(self):
+        return dict(
+            version=PLAN_VERSION, files=sorted(self.files, key=lambda f: f["path"])
+        )
+
+
+def plan_path(file_path):
+    """Paths in a plan are relative to the current directory, `/` separated."""
+    return os.path.relpath(file_path).replace(os.sep, "/")
+
+
+def write_plan(plan, fn):
+    with open(fn, "w", encoding="utf8") as f:
+        json.dump(plan, f, separators=(",", ":"))
+
+
+def load_plan(fn):
+    with open(fn, encoding="utf8") as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"`{fn}` isn't a version {PLAN_VERSION} plan")
+    return plan
+
+
+def apply_plan(plan, root=".", shard=None, shard_by="hash"):
+    """Apply the edits of a plan without parsing anything.
+
+    A file is only touched if its hash is the one the plan was made for.
+    Files that already have the planned result are left as they are, so a
+    plan can be applied again after an interruption.
+
+    Args:
+        plan (dict): As returned by `load_plan`.
+        root (str): The directory the plan was made in.
+        shard (tuple): `(index, count)` to only apply one slice of the files.
+        shard_by (str): See `shard.shard_files`.
+
+    Returns `(applied, done, stale)` lists of paths, `done` were already
+    applied and `stale` changed since the plan was made (or are gone)
+    """
+    entries = {entry["path"]: entry for entry in plan["files"]}
+    paths = sorted(entries)
+    if shard:
+        files = {}
+        for path in paths:
+            dirname, name = os.path.split(os.path.join(root, *path.split("/")))
+            files[dirname, name] = path
+        paths = [files[f] for f in shard_files(files, root, *shard, by=shard_by)]
+
+    applied, done, stale = [], [], []
+    for path in paths:
+        entry = entries[path]
+        file_path = os.path.join(root, *path.split("/"))
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            stale.append(path)
+            continue
+
+        digest = file_hash(data)
+        if digest == entry["new_sha256"]:
+            done.append(path)
+        elif digest != entry["sha256"]:
+            stale.append(path)
+        else:
+            with open(file_path, "wb") as f:
+                f.write(apply_edits(data, entry["edits"]))
+            applied.append(path)
+    return applied, done, stale
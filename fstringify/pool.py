@@ -0,0 +1,27 @@
+from concurrent.futures import ProcessPoolExecutor
+
+
+def batched(items, size):
+    """Split `items` into lists of at most `size` items, keeping their order."""
+    items = list(items)
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def map_batches(func, items, jobs, batch_size):
+    """Run `func` over batches of `items` on `jobs` worker processes.
+
+    `func` takes a list of items and returns a list of results. Batching keeps
+    the pickling overhead per item low and the results come back in order.
+
+    Args:
+        func (callable): A module level (picklable) function.
+        items (iterable): The work items.
+        jobs (int): Number of worker processes.
+        batch_size (int): Number of items sent to a worker at once.
+
+    Returns list of results in the same order as `items`
+    """
+    batches = batched(items, batch_size)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(func, batches))
+    return [result for batch in results for result in batch]
@@ -1,10 +1,37 @@
+import functools
 import io
+import itertools
+import threading
 import token
 import tokenize
 
+from fstringify.events import Site
 from fstringify.utils import get_indent, get_lines
-from fstringify.transform import fstringify_code
+from fstringify.transform import (
+    fstringify_code,
+    get_rule_classes,
+    is_str_bin_op_chunk,
+    parses_on_target,
+)
 from fstringify.format import force_double_quote_fstring
+from fstringify.fastpath import fast_fstringify, same_ast
+from fstringify.pool import map_batches
+
+
+# below this many candidate statements a worker pool costs more than it saves
+INTRA_FILE_MIN_SCOPES = 200
+INTRA_FILE_BATCH_SIZE = 50
+# every n-th fast path conversion is checked against the AST route
+FAST_PATH_VERIFY_EVERY = 50
+
+_fast_path_sites = itertools.count()
+_fast_path_lock = threading.Lock()
+
+
+def _verify_fast_path_sample():
+    # the counter is shared by all threads, a free-threaded build needs the lock
+    with _fast_path_lock:
+        return next(_fast_path_sites) % FAST_PATH_VERIFY_EVERY == 0
 
 
 def skip_line(raw_line):
@@ -15,13 +42,18 @@ def skip_line(raw_line):
         found_paren = False
         for toknum, tokval, _, _, _ in g:
             # print(toknum, tokval)
-            if toknum == 53 and tokval == "%":
+            if toknum == token.OP and tokval == "%":
                 found_bin_op = True
-            elif found_bin_op and toknum == 53 and tokval == "(":
+            elif found_bin_op and toknum == token.OP and tokval == "(":
                 found_paren = True
-            elif found_bin_op and not found_paren and toknum == 1 and tokval == "if":
+            elif (
+                found_bin_op
+                and not found_paren
+                and toknum == token.NAME
+                and tokval == "if"
+            ):
                 punt = True
-            elif found_bin_op and toknum == 53 and tokval == ":":
+            elif found_bin_op and toknum == token.OP and tokval == ":":
                 punt = False
     except tokenize.TokenError:
         pass
@@ -41,9 +73,9 @@ def usable_chunk(fn):
         last_tokval = None
         for toknum, tokval, _, _, _ in g:
             if (
-                toknum == 53
+                toknum == token.OP
                 and tokval == "%"
-                and last_toknum == 3
+                and last_toknum == token.STRING
                 and "\\n" not in last_tokval
             ):
                 return True
@@ -59,7 +91,6 @@ def usable_chunk(fn):
 def get_chunk(code):
     g = tokenize.tokenize(io.BytesIO(code.encode("utf-8")).readline)
     chunk = []
-    END_CHECK = 58  # token.N_TOKENS in 3.7
     for item in g:
         toknum, tokval, start, end, content = item
 
@@ -70,7 +101,7 @@ def get_chunk(code):
                 yield chunk
                 chunk = []
         else:
-            if not chunk and toknum == END_CHECK:  # token.N_TOKENS in 3.7
+            if not chunk and toknum == token.ENCODING:
                 continue
 
             chunk.append(item)
@@ -78,40 +109,33 @@ def get_chunk(code):
 
 def get_str_bin_op_lines(code):
     for chunk in get_chunk(code):
-        start = chunk[0][2][0]  # first line -> 2 idx is start -> is line
-        end = chunk[-1][3][0]  # last line -> 3 idx is end -> is line
+        if is_str_bin_op_chunk(chunk):
+            yield chunk_lines(chunk)
 
-        last_toknum = None
-        last_tokval = None
-        found = False
-        for toknum, tokval, *rest in chunk:
-            if (
-                toknum == 53
-                and tokval == "%"
-                and last_toknum == 3
-                and "\\n" not in last_tokval
-                and "\n" not in last_tokval
-                and "%%" not in last_tokval
-            ):
-                found = True
-            # punt if this happens
-            elif found and toknum == 53 and tokval == ":":
-                found = False  # punt on this (see django_noop7 test)
-                break
 
-            if not (toknum in (56, 58) and tokval == "\n"):  # 3.7 is 56...
-                last_toknum = toknum
-                last_tokval = tokval
+def chunk_lines(chunk):
+    start = chunk[0][2][0]  # first line -> 2 idx is start -> is line
+    end = chunk[-1][3][0]  # last line -> 3 idx is end -> is line
+    return start, end
 
-        if found:
-            yield (start, end)
 
+def get_candidate_chunks(code, rules=None):
+    """Find the statements any of the rules might rewrite in one tokenization.
 
-def no_skipping(code):
+    Yields `((start, end), chunk, rule_names)` tuples
+    """
+    rule_classes = get_rule_classes(rules)
+    for chunk in get_chunk(code):
+        matched = [rule.name for rule in rule_classes if rule.match_chunk(chunk)]
+        if matched:
+            yield chunk_lines(chunk), chunk, matched
+
+
+def no_skipping(code, rules=None):
     raw_code_lines = code.split("\n")
     no_skip_range = []
     scopes_by_idx = {}
-    for positions in get_str_bin_op_lines(code):
+    for positions, tokens, matched in get_candidate_chunks(code, rules=rules):
         # for start, end in positions:
         if not positions:
             continue
@@ -131,6 +155,8 @@ def no_skipping(code):
             raw_scope=raw_scope,
             strip_scope=strip_scope,
             indent=indent,
+            tokens=tokens,
+            rules=matched,
         )
         no_skip_range += list(range(start_idx, end))
     return no_skip_range, scopes_by_idx
@@ -158,11 +184,170 @@ def rebuild_transformed_lines(code, indent):
     return code_block
 
 
-def fstringify_code_by_line(code, stats=False, debug=False):
+def fstringify_scope(
+    code,
+    debug=False,
+    fast_path=False,
+    verify=False,
+    tokens=None,
+    rules=None,
+    collect_sites=False,
+    target_version=None,
+    sample_fast_path=True,
+):
+    """Convert one candidate statement found by `no_skipping`.
+
+    With `fast_path` trivial statements are rewritten straight from their
+    tokens. A sample of those (or all of them with `verify`) are also run
+    through the AST route and the AST route wins if they don't match.
+
+    Args:
+        code (str): The stripped statement.
+        fast_path (bool): Try `fast_fstringify` first.
+        verify (bool): Check every fast path result.
+        tokens (list): The statement's tokens, saves the fast path tokenizing.
+        rules (iterable): Rules to run, see `transform.fstringify_node`.
+        collect_sites (bool): See `transform.fstringify_node`.
+        target_version (tuple): See `transform.fstringify_node`.
+        sample_fast_path (bool): Check a sample of the fast path results, off
+            to see what the fast path does on its own (see `difftest`).
+
+    Returns `(code, meta)` tuple, see `fstringify_code`
+    """
+    fast_code = fast_fstringify(code, tokens=tokens) if fast_path else None
+    if fast_code is not None and not (
+        verify or (sample_fast_path and _verify_fast_path_sample())
+    ):
+        meta = dict(
+            changed=True,
+            lineno=1,
+            col_offset=-1,
+            skip=True,
+            rules={"percent": dict(changed=1, folded=0)},
+        )
+        if collect_sites:
+            meta["sites"] = [Site("percent", 1, -1, None)]
+        return fast_code, meta
+
+    code_line, meta = fstringify_code(
+        code,
+        include_meta=True,
+        debug=debug,
+        rules=rules,
+        collect_sites=collect_sites,
+        target_version=target_version,
+    )
+    if meta["changed"]:
+        double_quoted = force_double_quote_fstring(code_line)
+        # the quotes are swapped on the text, make sure it still parses
+        if parses_on_target(double_quoted, target_version):
+            code_line = double_quoted
+
+    if fast_code is not None:
+        meta["fast_path"] = same_ast(fast_code, code_line)
+        if debug and not meta["fast_path"]:
+            print(f"fast path mismatch, using the AST route for: {code.strip()}")
+
+    return code_line, meta
+
+
+def _fstringify_scopes(scopes, **kwargs):
+    return [
+        fstringify_scope(code, fast_path=fast_path, **kwargs)
+        for code, fast_path in scopes
+    ]
+
+
+def merge_rule_stats(total, rule_stats):
+    """Add up the per rule counters of `meta["rules"]` dicts into `total`."""
+    for name, counters in rule_stats.items():
+        merged = total.setdefault(name, {})
+        for key, value in counters.items():
+            merged[key] = merged.get(key, 0) + value
+    return total
+
+
+def fstringify_code_by_line(
+    code,
+    stats=False,
+    debug=False,
+    jobs=1,
+    fast_path=False,
+    verify=False,
+    rules=None,
+    include_meta=False,
+    lines=None,
+    collect_sites=False,
+    target_version=None,
+    sample_fast_path=True,
+):
+    """Convert the %-formatted strings of a whole module.
+
+    Every candidate statement parses on its own, so with `jobs > 1` large
+    modules have their statements converted in batches on a process pool.
+
+    Args:
+        code (str): The module source.
+        jobs (int): Number of worker processes to use for large modules.
+        fast_path (bool): Rewrite trivial statements without the AST route.
+        verify (bool): Check every fast path rewrite against the AST route.
+        rules (iterable): Rules to run, see `transform.fstringify_node`.
+        include_meta (bool): Also return the per rule counters of the module.
+        lines (set): Only convert statements starting on these (1-based) lines.
+        collect_sites (bool): Add the module's `events.Site`s to the meta.
+        target_version (tuple): The oldest Python the result has to run on.
+        sample_fast_path (bool): See `fstringify_scope`.
+
+    Returns the converted source, or `(code, meta)` with `include_meta`
+    """
     raw_code_lines = code.split("\n")
-    no_skip_range, scopes_by_idx = no_skipping(code)
+    no_skip_range, scopes_by_idx = no_skipping(code, rules=rules)
+    no_skip_range = set(no_skip_range)
+
+    if lines is not None:
+        for idx in [idx for idx in scopes_by_idx if idx + 1 not in lines]:
+            scope = scopes_by_idx.pop(idx)
+            no_skip_range.difference_update(range(idx, idx + len(scope["raw_scope"])))
+
+    scope_idxs = sorted(scopes_by_idx)
+    scopes = [
+        (
+            "\n".join(scopes_by_idx[idx]["strip_scope"]),
+            # the fast path only knows about `%`, leave anything else to the rules
+            fast_path and scopes_by_idx[idx]["rules"] == ["percent"],
+        )
+        for idx in scope_idxs
+    ]
+    scope_options = dict(
+        verify=verify,
+        rules=rules,
+        collect_sites=collect_sites,
+        target_version=target_version,
+        sample_fast_path=sample_fast_path,
+    )
+    if jobs > 1 and len(scopes) >= INTRA_FILE_MIN_SCOPES:
+        converted = map_batches(
+            functools.partial(_fstringify_scopes, **scope_options),
+            scopes,
+            jobs,
+            INTRA_FILE_BATCH_SIZE,
+        )
+    else:
+        converted = [
+            fstringify_scope(
+                scope_code,
+                debug=debug,
+                fast_path=scope_fast_path,
+                tokens=scopes_by_idx[idx]["tokens"],
+                **scope_options,
+            )
+            for idx, (scope_code, scope_fast_path) in zip(scope_idxs, scopes)
+        ]
+    converted_by_idx = dict(zip(scope_idxs, converted))
 
     result_lines = []
+    rule_stats = {}
+    sites = []
     for line_idx, raw_line in enumerate(raw_code_lines):
         lineno = line_idx + 1
 
@@ -174,9 +359,9 @@ def fstringify_code_by_line(code, stats=False, debug=False):
             continue
 
         scoped = scopes_by_idx[line_idx]
-        code_line, meta = fstringify_code(
-            "\n".join(scoped["strip_scope"]), include_meta=True, debug=debug
-        )
+        code_line, meta = converted_by_idx[line_idx]
+        for site in meta.get("sites", ()):
+            sites.append(site._replace(lineno=site.lineno + line_idx))
 
         if not meta["changed"]:
             if debug:
@@ -184,31 +369,47 @@ def fstringify_code_by_line(code, stats=False, debug=False):
             result_lines += scoped["raw_scope"]
             continue
 
-        code_line = force_double_quote_fstring(code_line)
-        code_line_parts = code_line.strip().split("\n")
-
-        indie = ""
-        indent = scoped["indent"]
+        merge_rule_stats(rule_stats, meta["rules"])
         indie = rebuild_transformed_lines(code_line, scoped["indent"])
 
         result_lines.append(indie)
 
     final_code = "\n".join(result_lines)
+    if include_meta:
+        meta = dict(changed=final_code != code, rules=rule_stats)
+        if collect_sites:
+            meta["sites"] = sites
+        return final_code, meta
     return final_code
 
 
-def skip_file(fn):
+def get_trigger_tokens(rules=None):
+    return {tok for rule in get_rule_classes(rules) for tok in rule.trigger_tokens}
+
+
+def skip_readline(readline, rules=None):
+    triggers = get_trigger_tokens(rules)
+    try:
+        g = tokenize.tokenize(readline)
+        for toknum, tokval, _, _, _ in g:
+            if toknum in (token.OP, token.NAME) and tokval in triggers:
+                return False
+    except tokenize.TokenError:
+        pass
+
+    return True
+
+
+def skip_file(fn, rules=None):
     """use tokenizer to make a fancier
         `"s%" not in contents`
     """
-    # fn = io.BytesIO(fn.encode("utf-8")).readline
     with open(fn, "rb") as f:
-        try:
-            g = tokenize.tokenize(f.readline)
-            for toknum, tokval, _, _, _ in g:
-                if toknum == 53 and tokval == "%":
-                    return False
-        except tokenize.TokenError:
-            pass
-
-        return True
+        return skip_readline(f.readline, rules=rules)
+
+
+def skip_code(code, rules=None):
+    """`skip_file` for source that's already in memory (str or bytes)."""
+    if isinstance(code, str):
+        code = code.encode("utf-8")
+    return skip_readline(io.BytesIO(code).readline, rules=rules)
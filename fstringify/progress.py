@@ -0,0 +1,86 @@
+import sys
+import time
+
+from fstringify.events import Observer
+
+
+# seconds between redraws, a terminal gets a live line, logs get fewer lines
+PROGRESS_INTERVAL = 0.5
+PROGRESS_LOG_INTERVAL = 10.0
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02}s"
+    return f"{seconds}s"
+
+
+class Progress(Observer):
+    """A one line progress display for long runs.
+
+    Shows files done out of the total, files/s, MB/s, the ETA and the
+    changed and failed counts. On a terminal the line is redrawn in place,
+    otherwise (like in CI logs) a new line is written every so often.
+
+    Args:
+        total (int): Number of files in the run, as an observer it's taken
+            from `on_run_start`.
+        stream (file): Where to draw, stderr by default.
+    """
+
+    def __init__(self, total=0, stream=None):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        self.interval = PROGRESS_INTERVAL if self.tty else PROGRESS_LOG_INTERVAL
+        self.start = time.time()
+        self.last_draw = 0.0
+        self.done = 0
+        self.bytes = 0
+        self.changed = 0
+        self.failed = 0
+
+    def on_run_start(self, total):
+        self.total = total
+        self.start = time.time()
+
+    def on_file_done(self, path, changed, meta, seconds, error):
+        self.update(changed, meta.get("bytes", 0), error)
+
+    def on_run_done(self, summary):
+        self.finish()
+
+    def update(self, changed, nbytes, error=None):
+        self.done += 1
+        self.bytes += nbytes
+        self.changed += bool(changed)
+        self.failed += bool(error)
+
+        now = time.time()
+        if now - self.last_draw >= self.interval:
+            self.last_draw = now
+            self.draw(now)
+
+    def line(self, now=None):
+        elapsed = max((now or time.time()) - self.start, 1e-9)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate else 0
+        return (
+            f"{self.done}/{self.total} files, {rate:.1f} files/s, "
+            f"{self.bytes / elapsed / 1e6:.2f} MB/s, ETA {format_duration(eta)}, "
+            f"{self.changed} changed, {self.failed} failed"
+        )
+
+    def draw(self, now=None):
+        end = "" if self.tty else "\n"
+        self.stream.write(("\r\033[K" if self.tty else "") + self.line(now) + end)
+        self.stream.flush()
+
+    def finish(self):
+        self.draw()
+        if self.tty:
+            self.stream.write("\n")
+            self.stream.flush()
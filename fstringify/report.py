@@ -0,0 +1,115 @@
+import json
+import os
+
+from fstringify.process import merge_rule_stats
+
+
+REPORT_VERSION = 1
+
+
+def build_report(results, root, total_time, shard=None):
+    """Build a JSON-able summary of one run (or one shard of a run).
+
+    Args:
+        results (list): `(file_path, changed, seconds, rule_stats)` tuples,
+            one per file.
+        root (str): Directory the reported paths are made relative to.
+        total_time (float): Wall time of the run in seconds.
+        shard (tuple): Optional `(index, count)` this run covered.
+
+    Returns dict
+    """
+    timings = {}
+    changed_files = []
+    rules = {}
+    for file_path, changed, seconds, rule_stats in results:
+        rel_path = os.path.relpath(file_path, root).replace(os.sep, "/")
+        timings[rel_path] = round(seconds, 6)
+        merge_rule_stats(rules, rule_stats)
+        if changed:
+            changed_files.append(rel_path)
+
+    return dict(
+        version=REPORT_VERSION,
+        shards=[list(shard)] if shard else [],
+        files=len(timings),
+        changed=len(changed_files),
+        total_time=round(total_time, 3),
+        wall_time=round(total_time, 3),
+        changed_files=sorted(changed_files),
+        rules=rules,
+        timings=timings,
+    )
+
+
+def write_report(report, fn):
+    with open(fn, "w", encoding="utf8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load_report(fn):
+    with open(fn, encoding="utf8") as f:
+        report = json.load(f)
+
+    if report.get("version") != REPORT_VERSION:
+        raise ValueError(f"`{fn}` is not a fstringify report")
+
+    return report
+
+
+def merge_reports(reports):
+    """Combine partial (per shard) reports into one report.
+
+    `total_time` is the sum of the shard times (the work done) while
+    `wall_time` is the slowest shard (how long CI actually waited).
+
+    Raises ValueError if the shards overlap or disagree on the shard count.
+    """
+    shards = []
+    timings = {}
+    changed_files = set()
+    rules = {}
+    total_time = 0.0
+    wall_time = 0.0
+
+    for report in reports:
+        for shard in report["shards"]:
+            if shard in shards:
+                raise ValueError(f"shard {shard[0]}/{shard[1]} reported twice")
+            shards.append(shard)
+
+        overlap = timings.keys() & report["timings"].keys()
+        if overlap:
+            raise ValueError(f"file reported by more than one shard: {min(overlap)}")
+
+        timings.update(report["timings"])
+        changed_files.update(report["changed_files"])
+        merge_rule_stats(rules, report["rules"])
+        total_time += report["total_time"]
+        wall_time = max(wall_time, report["wall_time"])
+
+    if len({count for _, count in shards}) > 1:
+        raise ValueError("reports come from runs with different shard counts")
+
+    return dict(
+        version=REPORT_VERSION,
+        shards=sorted(shards),
+        files=len(timings),
+        changed=len(changed_files),
+        total_time=round(total_time, 3),
+        wall_time=round(wall_time, 3),
+        changed_files=sorted(changed_files),
+        rules=rules,
+        timings=timings,
+    )
+
+
+def missing_shards(report):
+    """Return the 1-based shard indexes a merged report doesn't cover."""
+    if not report["shards"]:
+        return []
+
+    count = report["shards"][0][1]
+    seen = {index for index, _ in report["shards"]}
+    return [index for index in range(1, count + 1) if index not in seen]
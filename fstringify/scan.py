@@ -0,0 +1,204 @@
+import ast
+import hashlib
+import os
+import sqlite3
+
+from fstringify.astcompat import is_str
+from fstringify.process import get_str_bin_op_lines, skip_code
+from fstringify.transform import fold_constant_mod, handle_from_mod, mod_skip_reason
+
+
+SCAN_INDEX = ".fstringify-index.sqlite"
+SCAN_INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha1 TEXT
+);
+CREATE TABLE IF NOT EXISTS sites (
+    path TEXT,
+    dir TEXT,
+    start INTEGER,
+    end INTEGER,
+    line INTEGER,
+    kind TEXT,
+    convertible INTEGER,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS sites_path ON sites (path);
+"""
+
+
+def open_index(fn=SCAN_INDEX):
+    """Open (or create) a scan index, an index of another version is rebuilt."""
+    conn = sqlite3.connect(fn)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != SCAN_INDEX_VERSION:
+        conn.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS sites;")
+        conn.execute(f"PRAGMA user_version = {SCAN_INDEX_VERSION}")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def check_site(node):
+    """Cheap check if the `percent` rule converts a `%` node.
+
+    Runs the same checks as `FstringifyTransformer` and builds the f-string
+    node, but skips generating and formatting the code.
+
+    Returns `(kind, reason)`, reason is None for convertible sites
+    """
+    kind = type(node.right).__name__.lower()
+    if fold_constant_mod(node) is not None:
+        return "literal", None
+
+    reason = mod_skip_reason(node)
+    if reason is not None:
+        return kind, reason
+
+    try:
+        handle_from_mod(node)
+    except ValueError as e:
+        return kind, str(e)
+    return kind, None
+
+
+def scan_code(code):
+    """Find the `%` sites of a module without converting anything.
+
+    Returns list of `(start, end, line, kind, reason)` tuples, `start` and
+    `end` are the lines of the statement and `line` the one of the `%`
+    """
+    raw_lines = code.split("\n")
+    sites = []
+    for start, end in get_str_bin_op_lines(code):
+        statement = "\n".join(line.strip() for line in raw_lines[start - 1 : end])
+        try:
+            tree = ast.parse(statement)
+        except SyntaxError:
+            sites.append((start, end, start, "unknown", "statement doesn't parse"))
+            continue
+
+        found = False
+        for node in ast.walk(tree):
+            if (
+                isinstance(node, ast.BinOp)
+                and isinstance(node.op, ast.Mod)
+                and is_str(node.left)
+            ):
+                found = True
+                kind, reason = check_site(node)
+                sites.append((start, end, start + node.lineno - 1, kind, reason))
+
+        if not found:
+            sites.append((start, end, start, "unknown", "no % on a string literal"))
+    return sites
+
+
+def index_path(file_path, base):
+    return os.path.relpath(file_path, base).replace(os.sep, "/")
+
+
+def update_index(conn, files, root):
+    """Bring the index up to date for `files`.
+
+    Paths are stored relative to `root` (its directory if it's a file), so an
+    index matches no matter where it's built from. Files are only read when
+    their size or mtime changed, only rescanned when their contents hash
+    changed too, and files without a `%` token aren't parsed at all. Indexed
+    files under `root` that aren't in `files` anymore are dropped.
+
+    Returns `(scanned, unchanged, removed)` file counts
+    """
+    known = {
+        row[0]: row[1:]
+        for row in conn.execute("SELECT path, size, mtime_ns, sha1 FROM files")
+    }
+    base = root if os.path.isdir(root) else os.path.dirname(root)
+    scanned = unchanged = 0
+    seen = set()
+    with conn:
+        for f in files:
+            file_path = os.path.join(f[0], f[1])
+            path = index_path(file_path, base)
+            seen.add(path)
+            stat = os.stat(file_path)
+            old = known.get(path)
+            if old and old[:2] == (stat.st_size, stat.st_mtime_ns):
+                unchanged += 1
+                continue
+
+            with open(file_path, "rb") as fh:
+                contents = fh.read()
+            sha1 = hashlib.sha1(contents).hexdigest()
+            conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, sha1),
+            )
+            if old and old[2] == sha1:
+                unchanged += 1
+                continue
+
+            scanned += 1
+            conn.execute("DELETE FROM sites WHERE path = ?", (path,))
+            try:
+                code = contents.decode("utf-8")
+            except UnicodeDecodeError:
+                sites = [(1, 1, 1, "unknown", "file isn't utf-8")]
+            else:
+                sites = [] if skip_code(code, ["percent"]) else scan_code(code)
+            directory = os.path.dirname(path) or "."
+            conn.executemany(
+                "INSERT INTO sites VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (path, directory, start, end, line, kind, reason is None, reason)
+                    for start, end, line, kind, reason in sites
+                ],
+            )
+
+        prefix = index_path(root, base)
+        removed = [
+            path
+            for path in known
+            if path not in seen
+            and (prefix == "." or path == prefix or path.startswith(prefix + "/"))
+        ]
+        for path in removed:
+            conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            conn.execute("DELETE FROM sites WHERE path = ?", (path,))
+
+    return scanned, unchanged, len(removed)
+
+
+def scan_summary(conn):
+    """Returns `(files, sites, convertible)` counts of the whole index"""
+    files = conn.execute("SELECT COUNT(DISTINCT path) FROM sites").fetchone()[0]
+    sites, convertible = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(convertible), 0) FROM sites"
+    ).fetchone()
+    return files, sites, convertible
+
+
+def count_by_dir(conn):
+    """Returns list of `(dir, sites, convertible)`, most sites first"""
+    return conn.execute(
+        "SELECT dir, COUNT(*) AS n, SUM(convertible) FROM sites "
+        "GROUP BY dir ORDER BY n DESC, dir"
+    ).fetchall()
+
+
+def count_by_reason(conn):
+    """Returns list of `(reason, sites)` for the unconvertible sites"""
+    return conn.execute(
+        "SELECT reason, COUNT(*) AS n FROM sites WHERE NOT convertible "
+        "GROUP BY reason ORDER BY n DESC, reason"
+    ).fetchall()
+
+
+def list_sites(conn):
+    """Returns list of `(path, line, kind, reason)`"""
+    return conn.execute(
+        "SELECT path, line, kind, reason FROM sites ORDER BY path, line"
+    ).fetchall()
@@ -0,0 +1,84 @@
+import argparse
+import hashlib
+import os
+
+
+def parse_shard(value):
+    """Parse a `--shard` value like `2/4` into a `(index, count)` tuple.
+
+    The index is 1-based so `1/4` ... `4/4` covers every file exactly once.
+
+    Args:
+        value (str): The raw command line value.
+
+    Returns (int, int) tuple of (index, count)
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard `{value}`, expected i/N")
+
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"invalid shard `{value}`, need 1 <= i <= N")
+
+    return index, count
+
+
+def stable_hash(rel_path):
+    """Hash a relative path the same way on every machine and Python run.
+
+    `hash()` is salted per process so it can't be used to agree on shards.
+    """
+    normalized = rel_path.replace(os.sep, "/")
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    return int(digest[:16], 16)
+
+
+def shard_files(files, root, index, count, by="hash"):
+    """Pick the files that belong to shard `index` of `count`.
+
+    With `by="hash"` every file goes to `stable_hash(path) % count`. With
+    `by="size"` files are handed out largest first to the least loaded shard,
+    which balances the work when a few files dominate.
+
+    Args:
+        files (iterable): `(dir, name)` tuples like `find_py_files` yields.
+        root (str): Directory the relative paths are computed against.
+        index (int): 1-based shard index.
+        count (int): Total number of shards.
+        by (str): Either "hash" or "size".
+
+    Returns list of `(dir, name)` tuples in a stable order.
+    """
+    entries = []
+    for f in files:
+        file_path = os.path.join(f[0], f[1])
+        rel_path = os.path.relpath(file_path, root).replace(os.sep, "/")
+        entries.append((rel_path, stable_hash(rel_path), f))
+
+    entries.sort()
+
+    if by == "hash":
+        return [f for _, key, f in entries if key % count == index - 1]
+
+    if by != "size":
+        raise ValueError(f"unknown shard strategy `{by}`")
+
+    sized = []
+    for rel_path, key, f in entries:
+        try:
+            size = os.path.getsize(os.path.join(f[0], f[1]))
+        except OSError:
+            size = 0
+        sized.append((-size, key, rel_path, f))
+
+    loads = [0] * count
+    picked = []
+    for neg_size, _, rel_path, f in sorted(sized, key=lambda e: e[:3]):
+        target = min(range(count), key=lambda i: (loads[i], i))
+        loads[target] -= neg_size
+        if target == index - 1:
+            picked.append((rel_path, f))
+
+    picked.sort(key=lambda e: e[0])
+    return [f for _, f in picked]
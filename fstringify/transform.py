@@ -1,9 +1,210 @@
+import argparse
 import ast
+import functools
 import re
+import string
+import sys
+import token
+import tokenize
 
-import astor
+from fstringify.astcompat import (
+    LEGACY_CONSTANT_NODES,
+    is_constant,
+    is_num,
+    is_str,
+    make_fstring_literal,
+    make_num,
+    make_slice,
+    make_str,
+    str_value,
+    to_source,
+)
+from fstringify.events import Site
+from fstringify.utils import PRINTF_SPEC_PATTERN
 
-from fstringify.utils import MOD_KEY_PATTERN, MOD_KEY_NAME_PATTERN, VAR_KEY_PATTERN
+
+# the oldest Python with f-strings, what converted code has to run on by default
+DEFAULT_TARGET_VERSION = (3, 6)
+# PEP 701, f-string expressions can have backslashes and the f-string's quotes
+PEP_701_VERSION = (3, 12)
+
+
+def parse_target_version(value):
+    """Parse a `--target-version` value like `3.12` into a `(3, 12)` tuple."""
+    try:
+        version = tuple(int(part) for part in value.split("."))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid version `{value}`, expected X.Y")
+
+    if len(version) != 2 or version < DEFAULT_TARGET_VERSION:
+        raise argparse.ArgumentTypeError(
+            f"invalid version `{value}`, f-strings need 3.6 or newer"
+        )
+    return version
+
+
+def split_format_str(format_str):
+    """Split a %-format string into literal text and conversion specifiers.
+
+    Args:
+        format_str (str): The left side of the `%`.
+
+    Returns a list of `str` (literal text) and `(key, flags, width, precision, type)`
+    tuples, `key` is None for positional specifiers
+    """
+    parts = []
+    literal = ""
+    pos = 0
+    for match in PRINTF_SPEC_PATTERN.finditer(format_str):
+        literal += format_str[pos : match.start()]
+        pos = match.end()
+        key, flags, width, precision, conv = match.groups()
+        if conv == "%" and match.group(0) == "%%":
+            literal += "%"
+            continue
+        if not conv:
+            raise ValueError("incomplete format")
+        if literal:
+            parts.append(literal)
+            literal = ""
+        parts.append((key, flags, width, precision, conv))
+
+    literal += format_str[pos:]
+    if literal:
+        parts.append(literal)
+    return parts
+
+
+def printf_to_format(flags, width, precision, conv):
+    """Map a printf style specifier onto `FormattedValue` fields.
+
+    Args:
+        flags (str): Any of `-#0 +`.
+        width (str): The minimum width or "".
+        precision (str): The precision or None.
+        conv (str): The conversion type like `s` or `f`.
+
+    Returns `(conversion, format_spec)` tuple, format_spec is a str or None
+    Raises ValueError when `format()` would not give the same result.
+    """
+    if conv in "sra":
+        # `format()` pads strings on the other side and has no sign/zero flags
+        if set(flags) - {"-"}:
+            raise ValueError(f"unsupported flags for %{conv}")
+        if not (width or precision):
+            return (-1 if conv == "s" else ord(conv)), None
+        align = ("<" if "-" in flags else ">") + width if width else ""
+        return ord(conv), align + ("." + precision if precision else "")
+
+    if conv in "diu":
+        if precision is not None:
+            raise ValueError("precision on an integer pads with zeros")
+        if flags or width:
+            # `%d` truncates floats, the `d` format spec raises for them
+            raise ValueError(f"flags or width on %{conv} reject floats")
+        return -1, None
+    elif conv in "xXo":
+        if precision is not None:
+            raise ValueError("precision on an integer pads with zeros")
+    elif conv not in "eEfFgG":
+        raise ValueError(f"unsupported conversion %{conv}")
+
+    if ("-" in flags and "0" in flags) or ("+" in flags and " " in flags):
+        raise ValueError("flags override each other")
+
+    spec = "<" if "-" in flags else ""
+    spec += "+" if "+" in flags else " " if " " in flags else ""
+    spec += "#" if "#" in flags else ""
+    spec += "0" if "0" in flags else ""
+    spec += width + ("." + precision if precision is not None else "") + conv
+    return -1, spec
+
+
+def build_joined_str(parts, values):
+    """Build the f-string for `split_format_str` parts.
+
+    String literals formatted with a plain `%s` become part of the literal
+    text, escaped like the rest of it, instead of expressions.
+
+    Args:
+        parts (list): As returned by `split_format_str`.
+        values (list): One expression node per specifier.
+
+    Returns ast.JoinedStr (f-string)
+    """
+    values = list(values)
+    values.reverse()
+    result_node = ast.JoinedStr()
+    result_node.values = []
+    literal = ""
+    for part in parts:
+        if isinstance(part, str):
+            literal += part
+            continue
+
+        key, flags, width, precision, conv = part
+        value = values.pop()
+        check_int_operand(conv, value)
+        conversion, format_spec = printf_to_format(flags, width, precision, conv)
+        if (
+            conversion == -1
+            and format_spec is None
+            and is_str(value)
+            and "\n" not in str_value(value)
+            and "\r" not in str_value(value)
+        ):
+            literal += str_value(value)
+            continue
+
+        if literal:
+            result_node.values.append(make_fstring_literal(literal))
+            literal = ""
+        result_node.values.append(
+            ast.FormattedValue(
+                value=value,
+                conversion=conversion,
+                format_spec=None
+                if format_spec is None
+                else ast.JoinedStr(values=[make_str(format_spec)]),
+            )
+        )
+    if literal:
+        result_node.values.append(make_fstring_literal(literal))
+    return result_node
+
+
+def is_int_literal(node):
+    """Is `node` an int literal like `3` or `-3` (bools aren't)."""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        node = node.operand
+    return is_num(node) and type(ast.literal_eval(node)) is int
+
+
+def check_int_operand(conv, value):
+    """Refuse integer conversions whose operand may not be an int.
+
+    `%d` truncates floats and prints bools as numbers, `{x}` doesn't. `%d`
+    on unknown operands is kept as `{x}`, like fstringify always did, but
+    `%i` and `%u` only convert for int literals.
+
+    Raises ValueError
+    """
+    if conv not in "diu":
+        return
+    if is_int_literal(value):
+        return
+    if isinstance(value, ast.UnaryOp):
+        value = value.operand
+    if conv != "d" or is_constant(value):
+        raise ValueError(f"%{conv} of a value that may not be an int")
+
+
+def get_specs(parts, keyed):
+    """The specifiers of `split_format_str` parts, all keyed or all positional."""
+    specs = [part for part in parts if not isinstance(part, str)]
+    if any((spec[0] is not None) != keyed for spec in specs):
+        raise ValueError("mixed keyed and positional formatting")
+    return specs
 
 
 def handle_from_mod_dict_name(node):
@@ -17,38 +218,58 @@ def handle_from_mod_dict_name(node):
 
     Returns ast.JoinedStr (f-string)
     """
-    # raise ValueError("blah")
-    format_str = node.left.s
-    matches = MOD_KEY_PATTERN.findall(format_str)
-    var_keys = []
-    for idx, m in enumerate(matches):
-        var_key = MOD_KEY_NAME_PATTERN.match(m)
-        if not var_key:
-            raise ValueError("could not find dict key")
-        var_keys.append(var_key[1])
-
-    # build result node
-    result_node = ast.JoinedStr()
-    result_node.values = []
-    var_keys.reverse()
-    blocks = MOD_KEY_PATTERN.split(format_str)
-    # loop through the blocks of a string to build up dateh JoinStr.values
-    for block in blocks:
-        # if this block matches a %(arg)s pattern then inject f-string instead
-        if MOD_KEY_PATTERN.match(block):
-            fv = ast.FormattedValue(
-                value=ast.Subscript(
-                    value=node.right, slice=ast.Index(value=ast.Str(s=var_keys.pop()))
-                ),
-                conversion=-1,
-                format_spec=None,
-            )
+    parts = split_format_str(str_value(node.left))
+    values = [
+        ast.Subscript(value=node.right, slice=make_slice(make_str(spec[0])))
+        for spec in get_specs(parts, keyed=True)
+    ]
+    return build_joined_str(parts, values)
 
-            result_node.values.append(fv)
-        else:
-            # no match means it's just a literal string
-            result_node.values.append(ast.Str(s=block))
-    return result_node
+
+def is_simple_value(node):
+    """Names and literals can be evaluated any number of times (or not at all)."""
+    return isinstance(node, ast.Name) or is_constant(node)
+
+
+def handle_from_mod_dict_literal(node):
+    """Convert a `BinOp` `%` formatted str with a dict literal on the right to an f-string.
+
+    Takes an ast.BinOp representing `"1. %(a)s 2. %(b)d" % {"a": x, "b": y}`
+    and converted it to a ast.JoinedStr representing `f"1. {x} 2. {y}"`
+
+    Values that would end up evaluated more or less often than in the dict,
+    or in another order, have to be simple names or literals.
+
+    Args:
+       node (ast.BinOp): The node to convert to a f-string
+
+    Returns ast.JoinedStr (f-string)
+    """
+    by_key = {}
+    for key, value in zip(node.right.keys, node.right.values):
+        if not is_str(key):
+            raise ValueError("only string literal keys can be inlined")
+        key = str_value(key)
+        if key in by_key and not is_simple_value(by_key[key]):
+            raise ValueError("overwritten dict value has side effects")
+        by_key[key] = value
+
+    parts = split_format_str(str_value(node.left))
+    specs = get_specs(parts, keyed=True)
+    used = [spec[0] for spec in specs]
+    for key in used:
+        if key not in by_key:
+            raise ValueError(f"missing key {key!r}")
+    for key, value in by_key.items():
+        if not is_simple_value(value) and used.count(key) != 1:
+            raise ValueError("dict value with side effects isn't used exactly once")
+
+    evaluated = [key for key in by_key if not is_simple_value(by_key[key])]
+    first_use = sorted(evaluated, key=used.index)
+    if evaluated != first_use:
+        raise ValueError("dict values would be evaluated in another order")
+
+    return build_joined_str(parts, [by_key[key] for key in used])
 
 
 def handle_from_mod_tuple(node):
@@ -63,29 +284,13 @@ def handle_from_mod_tuple(node):
     Returns ast.JoinedStr (f-string)
     """
 
-    format_str = node.left.s
-    matches = VAR_KEY_PATTERN.findall(format_str)
+    parts = split_format_str(str_value(node.left))
+    specs = get_specs(parts, keyed=False)
 
-    if len(node.right.elts) != len(matches):
+    if len(node.right.elts) != len(specs):
         raise ValueError("string formatting length mismatch")
 
-    str_vars = list(map(lambda x: x, node.right.elts))
-
-    # build result node
-    result_node = ast.JoinedStr()
-    result_node.values = []
-    str_vars.reverse()
-    blocks = VAR_KEY_PATTERN.split(format_str)
-    for block in blocks:
-        if VAR_KEY_PATTERN.match(block):
-            fv = ast.FormattedValue(
-                value=str_vars.pop(), conversion=-1, format_spec=None
-            )
-            result_node.values.append(fv)
-        else:
-            result_node.values.append(ast.Str(s=block))
-
-    return result_node
+    return build_joined_str(parts, node.right.elts)
 
 
 def handle_from_mod_generic_name(node):
@@ -105,41 +310,445 @@ def handle_from_mod_generic_name(node):
     Returns ast.JoinedStr (f-string)
     """
 
-    has_dict_str_format = MOD_KEY_PATTERN.findall(node.left.s)
+    has_dict_str_format = any(
+        not isinstance(part, str) and part[0] is not None
+        for part in split_format_str(str_value(node.left))
+    )
     if has_dict_str_format:
         return handle_from_mod_dict_name(node)
 
     # if it's just a name then pretend it's tuple to use that code
-    node.right = ast.Tuple(elts=[node.right])
-    return handle_from_mod_tuple(node)
+    return handle_from_mod_tuple(
+        ast.BinOp(left=node.left, op=node.op, right=ast.Tuple(elts=[node.right]))
+    )
 
 
-def handle_from_mod(node):
-    if isinstance(node.right, (ast.Name, ast.Attribute, ast.Str, ast.Call)):
-        return handle_from_mod_generic_name(node)
+def handle_from_mod(node, target_version=DEFAULT_TARGET_VERSION):
+    """Convert a `%` node that passed `mod_skip_reason` to an f-string.
+
+    Args:
+        node (ast.BinOp): The node to convert to a f-string
+        target_version (tuple): The oldest Python the f-string has to run on.
+
+    Returns ast.JoinedStr (f-string)
+    Raises ValueError when the node can't be converted.
+    """
+    if isinstance(node.right, (ast.Name, ast.Attribute, ast.Call)) or is_str(
+        node.right
+    ):
+        result_node = handle_from_mod_generic_name(node)
 
     elif isinstance(node.right, ast.Tuple):
-        return handle_from_mod_tuple(node)
+        result_node = handle_from_mod_tuple(node)
 
     elif isinstance(node.right, ast.Dict):
-        # print("~~~~ Dict mod strings don't make sense to f-strings")
-        return node
+        result_node = handle_from_mod_dict_literal(node)
+
+    else:
+        raise RuntimeError("unexpected `node.right` class")
+
+    check_expression_strs(result_node, target_version)
+    return result_node
+
+
+RULES = {}
+DEFAULT_RULES = ("percent", "format")
+
+
+def register_rule(cls):
+    """Class decorator that makes a `Rule` available by its `name`."""
+    RULES[cls.name] = cls
+    return cls
+
+
+class Rule(ast.NodeTransformer):
+    """A rewrite that `RulePipeline` runs together with the other rules.
 
-    raise RuntimeError("unexpected `node.right` class")
+    Rules define `visit_<NodeClass>` methods like any `ast.NodeTransformer`.
+    A rule doesn't see the children of a node it replaced or rejected unless
+    `descend` is set, nodes it returns as they are are still walked into.
+    """
 
+    name = None
+    descend = False
+    # tokens that make a file worth looking at, see `process.skip_file`
+    trigger_tokens = ()
 
-class FstringifyTransformer(ast.NodeTransformer):
     def __init__(self):
         super().__init__()
         self.counter = 0
+        self.rejected = 0
         self.lineno = -1
         self.col_offset = -1
+        # a list of `events.Site` while someone is interested in them
+        self.sites = None
+        # the oldest Python the converted code has to run on
+        self.target_version = DEFAULT_TARGET_VERSION
+        # set while visiting the inside of an f-string, rules building
+        # f-strings leave those alone: nested ones would need other quotes
+        # before 3.12, and the quotes are normalized on the text afterwards
+        self.in_fstring = False
+
+    @classmethod
+    def match_chunk(cls, chunk):
+        """Token level check if a statement (list of tokens) is a candidate."""
+        return False
+
+    def reject(self, node, reason):
+        """Note why a node that looked like a candidate is left alone."""
+        self.rejected += 1
+        if self.sites is not None:
+            self.sites.append(Site(self.name, node.lineno, node.col_offset, reason))
+
+    def stats(self):
+        """The per rule counters reported in the meta dict."""
+        return dict(changed=self.counter)
+
+
+def get_rule_classes(rules=None):
+    """Resolve rule names to `Rule` classes, classes and instances are kept.
+
+    Args:
+        rules (iterable): Defaults to `DEFAULT_RULES`.
+
+    Returns list
+    """
+    resolved = []
+    for rule in DEFAULT_RULES if rules is None else rules:
+        if isinstance(rule, str):
+            if rule not in RULES:
+                raise ValueError(f"unknown rule `{rule}`")
+            rule = RULES[rule]
+        resolved.append(rule)
+    return resolved
+
+
+def build_rules(rules=None):
+    """Create fresh rule instances from names, `Rule` classes or instances.
+
+    Instances are used as they are, so they're shared by every statement (and
+    every thread) they're passed for.
+
+    Args:
+        rules (iterable): Defaults to `DEFAULT_RULES`.
+
+    Returns list of `Rule`
+    """
+    return [
+        rule() if isinstance(rule, type) else rule for rule in get_rule_classes(rules)
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def rule_visitors(cls):
+    """The `visit_<NodeClass>` methods a rule class defines itself.
+
+    A pipeline is built for every statement, so this is looked up once per
+    class (and shared between threads) instead of going through `dir` each time.
+
+    Returns tuple of `(node class name, method name)`
+    """
+    visitors = [
+        (attr[len("visit_") :], attr)
+        for attr in dir(cls)
+        if attr.startswith("visit_")
+        and getattr(cls, attr) is not getattr(ast.NodeTransformer, attr, None)
+    ]
+    names = {node_name for node_name, _ in visitors}
+    if (
+        hasattr(ast.NodeTransformer, "visit_Constant")
+        and "Constant" not in names
+        and names & LEGACY_CONSTANT_NODES
+    ):
+        # 3.8+ parses to `ast.Constant`, `NodeVisitor.visit_Constant` hands
+        # those to `visit_Str` and co
+        visitors.append(("Constant", "visit_Constant"))
+    return tuple(visitors)
+
+
+class RulePipeline:
+    """Run several rules over a tree in a single traversal."""
+
+    def __init__(self, rules):
+        self.rules = []
+        for rule in rules:
+            visitors = {
+                node_name: getattr(rule, attr)
+                for node_name, attr in rule_visitors(type(rule))
+            }
+            self.rules.append((rule, visitors))
+
+    def visit(self, node):
+        return self._visit(node, self.rules)
+
+    def _visit(self, node, rules):
+        active = rules
+        for rule, visitors in rules:
+            visitor = visitors.get(node.__class__.__name__)
+            if visitor is None:
+                continue
+
+            original, rejected = node, rule.rejected
+            if rule.sites is None:
+                node = visitor(node)
+            else:
+                counter = rule.counter
+                lineno = getattr(node, "lineno", -1)
+                col_offset = getattr(node, "col_offset", -1)
+                node = visitor(node)
+                if rule.counter > counter:
+                    rule.sites.append(Site(rule.name, lineno, col_offset, None))
+            if not isinstance(node, ast.AST):
+                return node
+            if not rule.descend and (node is not original or rule.rejected > rejected):
+                active = [entry for entry in active if entry[0] is not rule]
+
+        if active and isinstance(node, ast.JoinedStr):
+            self._generic_visit_fstring(node, active)
+        elif active:
+            self._generic_visit(node, active)
+        return node
+
+    def _generic_visit_fstring(self, node, rules):
+        """Visit the children of an f-string with `Rule.in_fstring` set."""
+        outer = [(rule, rule.in_fstring) for rule, _ in self.rules]
+        for rule, _ in outer:
+            rule.in_fstring = True
+        try:
+            self._generic_visit(node, rules)
+        finally:
+            for rule, in_fstring in outer:
+                rule.in_fstring = in_fstring
+
+    def _generic_visit(self, node, rules):
+        """`ast.NodeTransformer.generic_visit` for a subset of the rules."""
+        for field, old_value in ast.iter_fields(node):
+            if isinstance(old_value, list):
+                new_values = []
+                for value in old_value:
+                    if isinstance(value, ast.AST):
+                        value = self._visit(value, rules)
+                        if value is None:
+                            continue
+                        elif not isinstance(value, ast.AST):
+                            new_values.extend(value)
+                            continue
+                    new_values.append(value)
+                old_value[:] = new_values
+            elif isinstance(old_value, ast.AST):
+                new_node = self._visit(old_value, rules)
+                if new_node is None:
+                    delattr(node, field)
+                else:
+                    setattr(node, field, new_node)
+        return node
+
+
+def has_unsafe_str(node):
+    """Check for string literals that can't go into an f-string expression."""
+    for ch in ast.walk(node):
+        # f-string expression part cannot include a backslash
+        if is_str(ch) and (
+            any(
+                map(
+                    lambda x: x in str_value(ch),
+                    ("\n", "\t", "\r", "'", '"', "%s", "%%"),
+                )
+            )
+            or "\\" in str_value(ch)
+        ):
+            return True
+    return False
+
+
+def unsafe_expression_str(value, target_version=DEFAULT_TARGET_VERSION):
+    """Check if a string literal can't go into an f-string expression.
+
+    Before PEP 701 an expression can't have backslashes, and a string with
+    quotes would need a triple quoted f-string around it. Strings that need
+    escapes (newlines, control characters) are refused whatever the target,
+    statements are rebuilt line by line and the code generators can't always
+    write them.
+    """
+    if "%s" in value or "%%" in value or not value.isprintable():
+        return True
+    if target_version >= PEP_701_VERSION:
+        return False
+    return any(ch in value for ch in "'\"\\")
+
+
+def check_expression_strs(node, target_version=DEFAULT_TARGET_VERSION):
+    """Check the string literals in the expressions of the f-string `node`.
+
+    Strings with quotes or backslashes need the generated code checked too,
+    by parsing it back when this Python has the f-string rules of the target.
+
+    Raises ValueError when the f-string can't be written for `target_version`.
+    """
+    quoted = False
+    for value in node.values:
+        if not isinstance(value, ast.FormattedValue):
+            continue
+        for ch in ast.walk(value.value):
+            if not is_str(ch):
+                continue
+            if unsafe_expression_str(str_value(ch), target_version):
+                raise ValueError("quotes or escapes in a string operand")
+            quoted = quoted or any(q in str_value(ch) for q in "'\"\\")
+    if not quoted:
+        return
+
+    tree = ast.parse("_")
+    tree.body[0].value = node
+    try:
+        source = to_source(tree)
+    except ValueError:
+        # `ast.unparse` before 3.12 refuses backslashes in expressions
+        raise ValueError("this Python can't write the f-string")
+    if not parses_on_target(source, target_version):
+        raise ValueError("the f-string doesn't parse on the target version")
+
+
+def parses_on_target(code, target_version=None):
+    """Check if generated code parses, as far as this Python can tell.
+
+    Only checked when this Python has the f-string rules of the target,
+    3.12 changed them.
+    """
+    target_version = tuple(target_version or DEFAULT_TARGET_VERSION)
+    if (sys.version_info >= PEP_701_VERSION) != (target_version >= PEP_701_VERSION):
+        return True
+    try:
+        ast.parse(code)
+    except SyntaxError:
+        return False
+    return True
+
+
+def is_str_bin_op_chunk(chunk):
+    """Token level check for a string literal on the left of a `%`."""
+    last_toknum = None
+    last_tokval = None
+    found = False
+    depth = 0  # brackets opened since the `%`, a dict literal has its `:` inside
+    for toknum, tokval, *rest in chunk:
+        if (
+            toknum == token.OP
+            and tokval == "%"
+            and last_toknum == token.STRING
+            and "\\n" not in last_tokval
+            and "\n" not in last_tokval
+            and "%%" not in last_tokval
+        ):
+            found = True
+            depth = 0
+        elif found and toknum == token.OP and tokval in "([{":
+            depth += 1
+        elif found and toknum == token.OP and tokval in ")]}":
+            depth -= 1
+        # punt if this happens
+        elif found and toknum == token.OP and tokval == ":" and depth <= 0:
+            found = False  # punt on this (see django_noop7 test)
+            break
+
+        if not (toknum == tokenize.NL and tokval == "\n"):
+            last_toknum = toknum
+            last_tokval = tokval
+
+    return found
+
+
+# don't let a `"%09999999d" % 1` in the source allocate huge strings
+MAX_FOLD_WIDTH = 4096
+
+
+def fold_constant_mod(node):
+    """Format a `%` with only literals on both sides at conversion time.
+
+    Takes an ast.BinOp representing `"prefix-%s-%03d" % ("abc", 7)`
+    and returns a ast.Str representing `"prefix-abc-007"`
+
+    Args:
+       node (ast.BinOp): The `%` node, `node.left` is a `ast.Str`
+
+    Returns ast.Str or None if it can't be folded
+    """
+    right = node.right
+    if not (
+        is_str(right)
+        or is_num(right)
+        or isinstance(right, ast.Tuple)
+        and all(is_str(elt) or is_num(elt) for elt in right.elts)
+    ):
+        return None
+
+    try:
+        for part in split_format_str(str_value(node.left)):
+            if (
+                not isinstance(part, str)
+                and max(int(part[2] or 0), int(part[3] or 0)) > MAX_FOLD_WIDTH
+            ):
+                return None
+        value = ast.literal_eval(node.left) % ast.literal_eval(right)
+    except (TypeError, ValueError, KeyError, OverflowError):
+        return None
+    # statements are rebuilt line by line, a triple quoted result would lose
+    # its newlines
+    if "\n" in value or "\r" in value:
+        return None
+    return make_str(value)
+
+
+def mod_skip_reason(node):
+    """Why the `percent` rule leaves a `ast.BinOp` alone before even trying.
+
+    `handle_from_mod` can still reject the node, with a ValueError.
+
+    Returns str or None if the node is worth converting
+    """
+    if not (is_str(node.left) and isinstance(node.op, ast.Mod)):
+        return "not a % on a string literal"
+    if not (
+        isinstance(node.right, (ast.Tuple, ast.Name, ast.Attribute, ast.Call, ast.Dict))
+        or is_str(node.right)
+    ):
+        return f"unsupported operand ({type(node.right).__name__})"
+
+    # bail in these edge cases, statements are rebuilt line by line
+    if "\n" in str_value(node.left):
+        return "a newline in the format string"
+    for ch in ast.walk(node.right):
+        # no nested binops!
+        if isinstance(ch, ast.BinOp):
+            return "operator in the operands"
+    return None
+
+
+@register_rule
+class FstringifyTransformer(Rule):
+    name = "percent"
+    trigger_tokens = ("%",)
+
+    def __init__(self):
+        super().__init__()
+        self.folded = 0
+
+    @classmethod
+    def match_chunk(cls, chunk):
+        return is_str_bin_op_chunk(chunk)
+
+    def stats(self):
+        """`changed` counts every rewritten site, `folded` the constant ones."""
+        return dict(changed=self.counter, folded=self.folded)
 
     def visit_BinOp(self, node):
         """Convert `ast.BinOp` to `ast.JoinedStr` f-string
 
         Currently only if a string literal `ast.Str` is on the left side of the `%`
-        and one of `ast.Tuple`, `ast.Name`, `ast.Dict` is on the right
+        and one of `ast.Tuple`, `ast.Name`, `ast.Dict` is on the right. Format
+        specifiers that `format()` can't reproduce leave the node unchanged.
+        When the right side only holds literals the result is folded into a
+        plain `ast.Str` instead.
 
         Args:
             node (ast.BinOp): The node to convert to a f-string
@@ -147,67 +756,89 @@ class FstringifyTransformer(ast.NodeTransformer):
         Returns ast.JoinedStr (f-string)
         """
 
-        do_change = (
-            isinstance(node.left, ast.Str)
-            and isinstance(node.op, ast.Mod)
-            and isinstance(
-                node.right, (ast.Tuple, ast.Name, ast.Attribute, ast.Str, ast.Call)
-            )
-            # ignore ast.Dict on right
-        )
+        is_mod = is_str(node.left) and isinstance(node.op, ast.Mod)
+        if is_mod:
+            folded = fold_constant_mod(node)
+            if folded is not None:
+                self.counter += 1
+                self.folded += 1
+                self.lineno = node.lineno
+                self.col_offset = node.col_offset
+                return folded
 
-        # bail in these edge cases...
-        if do_change:
-            no_good = ["}", "{", "\n"]
-            for ng in no_good:
-                if ng in node.left.s:
-                    return node
-            for ch in ast.walk(node.right):
-                # no nested binops!
-                if isinstance(ch, ast.BinOp):
-                    return node
-                # f-string expression part cannot include a backslash
-                elif isinstance(ch, ast.Str) and (
-                    any(
-                        map(
-                            lambda x: x in ch.s,
-                            ("\n", "\t", "\r", "'", '"', "%s", "%%"),
-                        )
-                    )
-                    or "\\" in ch.s
-                ):
-                    return node
+        reason = mod_skip_reason(node)
+        if reason is None and self.in_fstring:
+            reason = "inside an f-string"
+        if reason is not None:
+            if is_mod:
+                self.reject(node, reason)
+            return node
 
-        if do_change:
-            self.counter += 1
-            self.lineno = node.lineno
-            self.col_offset = node.col_offset
-            result_node = handle_from_mod(node)
-            return result_node
+        try:
+            result_node = handle_from_mod(node, self.target_version)
+        except ValueError as e:
+            self.reject(node, str(e))
+            return node
 
-        return node
+        self.counter += 1
+        self.lineno = node.lineno
+        self.col_offset = node.col_offset
+        return result_node
 
 
-def fstringify_node(node, debug=False):
-    ft = FstringifyTransformer()
-    result = ft.visit(node)
+def fstringify_node(
+    node, debug=False, rules=None, collect_sites=False, target_version=None
+):
+    """Run the rules over a tree in one traversal.
 
-    return (
-        result,
-        dict(
-            changed=ft.counter > 0,
-            lineno=ft.lineno,
-            col_offset=ft.col_offset,
-            skip=True,
-        ),
+    Args:
+        node (ast.AST): The tree to convert, it's changed in place.
+        rules (iterable): Rule names or classes, defaults to `DEFAULT_RULES`.
+        collect_sites (bool): Also list every converted and rejected site.
+        target_version (tuple): Like `(3, 12)`, defaults to `DEFAULT_TARGET_VERSION`.
+
+    Returns `(node, meta)` tuple, `meta["rules"]` has the counters per rule
+    and `meta["sites"]` the `events.Site`s with `collect_sites`
+    """
+    rules = build_rules(rules)
+    for rule in rules:
+        if collect_sites:
+            rule.sites = []
+        if target_version is not None:
+            rule.target_version = tuple(target_version)
+    result = RulePipeline(rules).visit(node)
+    changed = [rule for rule in rules if rule.counter > 0]
+
+    meta = dict(
+        changed=bool(changed),
+        lineno=changed[0].lineno if changed else -1,
+        col_offset=changed[0].col_offset if changed else -1,
+        skip=True,
+        rules={rule.name: rule.stats() for rule in rules},
     )
+    if collect_sites:
+        meta["sites"] = sorted(
+            (site for rule in rules for site in rule.sites),
+            key=lambda site: (site.lineno, site.col_offset),
+        )
+    return result, meta
 
 
-def fstringify_code(code, include_meta=False, debug=False):
+def fstringify_code(
+    code,
+    include_meta=False,
+    debug=False,
+    rules=None,
+    collect_sites=False,
+    target_version=None,
+):
     """Convert a block of with a %-formatted string to an f-string
 
     Args:
         code (str): The code to convert.
+        rules (iterable): Rule names or classes, defaults to `DEFAULT_RULES`.
+        collect_sites (bool): See `fstringify_node`.
+        target_version (tuple): See `fstringify_node`.
 
     Returns:
        The code formatted with f-strings if possible if it's left unchanged.
@@ -226,7 +857,13 @@ def fstringify_code(code, include_meta=False, debug=False):
         tree = ast.parse(code)
         # if debug:
         #     pp_ast(tree)
-        converted, meta = fstringify_node(tree, debug=debug)
+        converted, meta = fstringify_node(
+            tree,
+            debug=debug,
+            rules=rules,
+            collect_sites=collect_sites,
+            target_version=target_version,
+        )
     except SyntaxError as e:
         meta["skip"] = code.rstrip().endswith(
             ":"
@@ -235,11 +872,444 @@ def fstringify_code(code, include_meta=False, debug=False):
         meta["skip"] = False
 
     if meta["changed"] and converted:
-        new_code = astor.to_source(converted)
-        if include_meta:
+        reason = None
+        try:
+            new_code = to_source(converted)
+        except ValueError:
+            # `ast.unparse` before 3.12 refuses backslashes in f-string expressions
+            reason = "this Python can't write the f-string"
+        else:
+            # the code generators pick the f-string quotes from the context
+            # and don't always end up with ones the target can read
+            if not parses_on_target(new_code, target_version):
+                reason = "the f-string doesn't parse"
+        if reason is not None:
+            meta["changed"] = False
+            for counters in meta["rules"].values():
+                for counter in counters:
+                    counters[counter] = 0
+            if "sites" in meta:
+                meta["sites"] = [
+                    site._replace(reason=site.reason or reason)
+                    for site in meta["sites"]
+                ]
+        elif include_meta:
             return new_code, meta
-        return new_code
+        else:
+            return new_code
 
     if include_meta:
         return code, meta
     return code
+
+
+FIELD_NAME_PATTERN = re.compile(r"^([^.\[]*)((?:\.[^.\[]+|\[[^\]]+\])*)$")
+FIELD_PART_PATTERN = re.compile(r"\.([^.\[]+)|\[([^\]]+)\]")
+
+
+def is_str_format_chunk(chunk):
+    """Token level check for `"literal".format(`"""
+    tokvals = [(toknum, tokval) for toknum, tokval, *rest in chunk]
+    for idx in range(len(tokvals) - 3):
+        if (
+            tokvals[idx][0] == token.STRING
+            and tokvals[idx + 1][1] == "."
+            and tokvals[idx + 2][1] == "format"
+            and tokvals[idx + 3][1] == "("
+        ):
+            return True
+    return False
+
+
+def parse_field_name(field_name, args, kwargs, auto_idx):
+    """Build the expression for a `str.format` replacement field name.
+
+    Args:
+        field_name (str): Like `""`, `"0"`, `"name.attr"` or `"name[0]"`.
+        args (list): The positional argument nodes.
+        kwargs (dict): The keyword argument nodes.
+        auto_idx (int): The next index for an automatically numbered field.
+
+    Returns `(expression, arg key)` tuple
+    """
+    match = FIELD_NAME_PATTERN.match(field_name)
+    if not match:
+        raise ValueError(f"unsupported field `{field_name}`")
+
+    first, rest = match.groups()
+    if first == "":
+        key = auto_idx
+    elif first.isdigit():
+        key = int(first)
+    else:
+        key = first
+
+    if isinstance(key, int):
+        if key >= len(args):
+            raise ValueError("replacement index out of range")
+        expr = args[key]
+    elif key in kwargs:
+        expr = kwargs[key]
+    else:
+        raise ValueError(f"missing keyword `{key}`")
+
+    for attr, item in FIELD_PART_PATTERN.findall(rest):
+        if attr:
+            expr = ast.Attribute(value=expr, attr=attr, ctx=ast.Load())
+        else:
+            index = make_num(int(item)) if item.isdigit() else make_str(item)
+            expr = ast.Subscript(value=expr, slice=make_slice(index))
+    return expr, key
+
+
+def handle_from_format_call(node):
+    """Convert a `"...".format(...)` `ast.Call` to an f-string.
+
+    Takes an ast.Call representing `"{} of {total:>5}".format(a, total=b)`
+    and converted it to a ast.JoinedStr representing `f"{a} of {b:>5}"`
+
+    Arguments with side effects have to be used exactly once and in order.
+
+    Args:
+       node (ast.Call): The node to convert to a f-string
+
+    Returns ast.JoinedStr (f-string)
+    """
+    if any(isinstance(arg, ast.Starred) for arg in node.args) or any(
+        kw.arg is None for kw in node.keywords
+    ):
+        raise ValueError("can't convert *args or **kwargs")
+
+    args = node.args
+    kwargs = {kw.arg: kw.value for kw in node.keywords}
+
+    result_node = ast.JoinedStr()
+    result_node.values = []
+    used = []
+    auto_idx = 0
+    numbering = set()
+    for literal, field_name, format_spec, conversion in string.Formatter().parse(
+        str_value(node.func.value)
+    ):
+        if "{" in literal or "}" in literal:
+            raise ValueError("escaped braces")
+        if literal:
+            result_node.values.append(make_str(literal))
+        if field_name is None:
+            continue
+
+        if format_spec and "{" in format_spec:
+            raise ValueError("nested replacement fields")
+
+        first = FIELD_NAME_PATTERN.match(field_name)
+        numbering.add("auto" if first and first.group(1) == "" else "manual")
+        expr, key = parse_field_name(field_name, args, kwargs, auto_idx)
+        if first and first.group(1) == "":
+            auto_idx += 1
+        used.append(key)
+
+        result_node.values.append(
+            ast.FormattedValue(
+                value=expr,
+                conversion=-1 if conversion is None else ord(conversion),
+                format_spec=ast.JoinedStr(values=[make_str(format_spec)])
+                if format_spec
+                else None,
+            )
+        )
+
+    if len(numbering) > 1:
+        raise ValueError("mixed automatic and manual field numbering")
+
+    call_order = list(range(len(args))) + list(kwargs)
+    values = {**dict(enumerate(args)), **kwargs}
+    for key in call_order:
+        if not is_simple_value(values[key]) and used.count(key) != 1:
+            raise ValueError("argument with side effects isn't used exactly once")
+
+    evaluated = [key for key in call_order if not is_simple_value(values[key])]
+    if evaluated != sorted(evaluated, key=used.index):
+        raise ValueError("arguments would be evaluated in another order")
+
+    return result_node
+
+
+@register_rule
+class FormatCallTransformer(Rule):
+    """Convert `"...".format(...)` calls on string literals to f-strings."""
+
+    name = "format"
+    # calls nested in the arguments of a rejected call are still candidates
+    descend = True
+    trigger_tokens = ("format",)
+
+    @classmethod
+    def match_chunk(cls, chunk):
+        return is_str_format_chunk(chunk)
+
+    def visit_Call(self, node):
+        if not (
+            isinstance(node.func, ast.Attribute)
+            and node.func.attr == "format"
+            and is_str(node.func.value)
+        ):
+            return node
+
+        if self.in_fstring:
+            self.reject(node, "inside an f-string")
+            return node
+        # bail in the same edge cases as `FstringifyTransformer.visit_BinOp`
+        if "\n" in str_value(node.func.value):
+            self.reject(node, "a newline in the format string")
+            return node
+        for arg in node.args + [kw.value for kw in node.keywords]:
+            if has_unsafe_str(arg) or any(
+                is_str(ch) and ("{" in str_value(ch) or "}" in str_value(ch))
+                for ch in ast.walk(arg)
+            ):
+                self.reject(node, "unsafe string in the arguments")
+                return node
+
+        try:
+            result_node = handle_from_format_call(node)
+        except ValueError as e:
+            self.reject(node, str(e))
+            return node
+
+        self.counter += 1
+        self.lineno = node.lineno
+        self.col_offset = node.col_offset
+        return result_node
+
+
+def is_str_concat_chunk(chunk):
+    """Token level check for a string literal next to a `+` and a `str(` call"""
+    tokvals = [(toknum, tokval) for toknum, tokval, *rest in chunk]
+    has_str_call = any(
+        tokvals[idx][1] == "str" and tokvals[idx + 1][1] == "("
+        for idx in range(len(tokvals) - 1)
+    )
+    return has_str_call and any(
+        tokvals[idx][1] == "+"
+        and token.STRING in (tokvals[idx - 1][0], tokvals[idx + 1][0])
+        for idx in range(1, len(tokvals) - 1)
+    )
+
+
+def is_str_call(node):
+    """Check for `str(x)` with a single positional argument."""
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id == "str"
+        and len(node.args) == 1
+        and not isinstance(node.args[0], ast.Starred)
+        and not node.keywords
+    )
+
+
+def get_add_operands(node):
+    """Flatten a left associated `a + b + c` chain into `[a, b, c]`."""
+    operands = []
+    while isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        operands.append(node.right)
+        node = node.left
+    operands.append(node)
+    operands.reverse()
+    return operands
+
+
+@register_rule
+class ConcatTransformer(Rule):
+    """Collapse `"id=" + str(i) + " name=" + str(name)` chains into f-strings.
+
+    Only the leading operands that are provably strings (string literals and
+    `str()` calls) are collapsed, `"a" + str(b) + c` becomes `f"a{b!s}" + c`
+    so `c` still raises for anything that isn't a string.
+    """
+
+    name = "concat"
+    descend = True
+    trigger_tokens = ("+",)
+
+    def __init__(self):
+        super().__init__()
+        # the inner `+` nodes of the last rejected chain, rejected only once
+        self.rejected_chain = ()
+
+    @classmethod
+    def match_chunk(cls, chunk):
+        return is_str_concat_chunk(chunk)
+
+    def is_str_operand(self, node):
+        if is_str(node):
+            # same edge cases as `FstringifyTransformer.visit_BinOp`
+            return not any(ng in str_value(node) for ng in ("}", "{", "\n"))
+        return is_str_call(node) and not has_unsafe_str(node.args[0])
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, ast.Add):
+            return node
+
+        operands = get_add_operands(node)
+        count = 0
+        while count < len(operands) and self.is_str_operand(operands[count]):
+            count += 1
+
+        prefix = operands[:count]
+        if count < 2 or not any(is_str_call(operand) for operand in prefix):
+            # a chain that only stops early because of the edge cases above
+            plain = count
+            while plain < len(operands) and (
+                is_str(operands[plain]) or is_str_call(operands[plain])
+            ):
+                plain += 1
+            if (
+                plain > count
+                and plain >= 2
+                and any(is_str_call(operand) for operand in operands[:plain])
+                and node not in self.rejected_chain
+            ):
+                self.reject(node, "unsafe string in an operand")
+                self.rejected_chain = set()
+                inner = node.left
+                while isinstance(inner, ast.BinOp) and isinstance(inner.op, ast.Add):
+                    self.rejected_chain.add(inner)
+                    inner = inner.left
+            return node
+        if self.in_fstring:
+            self.reject(node, "inside an f-string")
+            return node
+
+        result_node = ast.JoinedStr()
+        result_node.values = []
+        for operand in prefix:
+            if is_str(operand):
+                last = result_node.values[-1] if result_node.values else None
+                if is_str(last):
+                    result_node.values[-1] = make_str(
+                        str_value(last) + str_value(operand)
+                    )
+                else:
+                    result_node.values.append(make_str(str_value(operand)))
+            else:
+                result_node.values.append(
+                    ast.FormattedValue(
+                        value=operand.args[0], conversion=ord("s"), format_spec=None
+                    )
+                )
+
+        self.counter += 1
+        self.lineno = node.lineno
+        self.col_offset = node.col_offset
+
+        for operand in operands[count:]:
+            result_node = ast.BinOp(left=result_node, op=ast.Add(), right=operand)
+        return result_node
+
+
+LOGGING_METHODS = {"debug", "info", "warning", "error", "exception", "critical", "log"}
+
+
+def is_logger(node):
+    """Guess if `node` is a logger from its name: `logging`, `log`, `self.logger`..."""
+    if isinstance(node, ast.Name):
+        name = node.id
+    elif isinstance(node, ast.Attribute):
+        name = node.attr
+    else:
+        return False
+    name = name.lower().strip("_")
+    return name in ("logging", "log") or name.endswith("logger")
+
+
+def is_logging_chunk(chunk):
+    """Token level check for a `%` format in a statement calling a log method"""
+    return is_str_bin_op_chunk(chunk) and any(
+        tokval in LOGGING_METHODS for _, tokval, *rest in chunk
+    )
+
+
+def handle_from_mod_logging_call(node, msg_idx):
+    """Turn the eager `%` message of a logging call into lazy logging arguments.
+
+    Takes an ast.Call representing `log.debug("payload %s" % obj)`
+    and converted it to a ast.Call representing `log.debug("payload %s", obj)`
+
+    Args:
+       node (ast.Call): The logging call
+       msg_idx (int): Position of the message in `node.args`
+
+    Returns ast.Call
+    """
+    msg = node.args[msg_idx]
+    parts = split_format_str(str_value(msg.left))
+    specs = [part for part in parts if not isinstance(part, str)]
+    keyed = any(spec[0] is not None for spec in specs)
+
+    if isinstance(msg.right, ast.Tuple):
+        if keyed or any(isinstance(elt, ast.Starred) for elt in msg.right.elts):
+            raise ValueError("can't pass the tuple as logging arguments")
+        if len(msg.right.elts) != len(specs):
+            raise ValueError("string formatting length mismatch")
+        log_args = msg.right.elts
+    elif keyed or len(specs) == 1:
+        # a single value, or a mapping logging uses for `%(key)s` specifiers
+        log_args = [msg.right]
+    else:
+        raise ValueError("can't tell how many values the right side holds")
+    if not log_args:
+        # without arguments logging doesn't format the message, `%%` would stay
+        raise ValueError("no logging arguments")
+
+    node.args = node.args[:msg_idx] + [msg.left] + list(log_args)
+    return node
+
+
+@register_rule
+class LoggingTransformer(Rule):
+    """Make `log.debug("payload %s" % obj)` format lazily: `log.debug("payload %s", obj)`
+
+    An f-string would still format the message when the level is disabled.
+    """
+
+    name = "logging"
+    trigger_tokens = ("%",)
+
+    @classmethod
+    def match_chunk(cls, chunk):
+        return is_logging_chunk(chunk)
+
+    def visit_Call(self, node):
+        if not (
+            isinstance(node.func, ast.Attribute)
+            and node.func.attr in LOGGING_METHODS
+            and is_logger(node.func.value)
+        ):
+            return node
+
+        msg_idx = 1 if node.func.attr == "log" else 0
+        # extra arguments mean the message gets formatted a second time
+        if len(node.args) != msg_idx + 1 or any(
+            isinstance(arg, ast.Starred) for arg in node.args
+        ):
+            return node
+
+        msg = node.args[msg_idx]
+        if not (
+            isinstance(msg, ast.BinOp)
+            and isinstance(msg.op, ast.Mod)
+            and is_str(msg.left)
+        ):
+            return node
+
+        try:
+            result_node = handle_from_mod_logging_call(node, msg_idx)
+        except ValueError as e:
+            self.reject(node, str(e))
+            return node
+
+        self.counter += 1
+        self.lineno = node.lineno
+        self.col_offset = node.col_offset
+        return result_node
@@ -11,6 +11,10 @@ MOD_KEY_NAME_PATTERN = re.compile("%\(([^)]+)\)s")
 INDENT_PATTERN = re.compile("^(\ +)")
 # VAR_KEY_PATTERN = re.compile("(%[a-z])")
 VAR_KEY_PATTERN = re.compile("(%[sd])")
+# %[(key)][flags][width][.precision]type, an empty type means a dangling `%`
+PRINTF_SPEC_PATTERN = re.compile(
+    r"%(?:\(([^)]*)\))?([-#0 +]*)(\d*)(?:\.(\d+))?(.?)", re.S
+)
 
 from fstringify.transform import fstringify_node
 
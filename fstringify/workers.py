@@ -0,0 +1,254 @@
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import sys
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# how often a task is retried after the worker running it died
+WORKER_RETRIES = 1
+# below this many files starting worker processes costs more than it saves
+PROCESS_MIN_FILES = 50
+EXECUTORS = ("auto", "serial", "thread", "process")
+
+
+def current_rss():
+    """Resident set size of this process in bytes, 0 if it can't be measured."""
+    if resource is None:
+        return 0
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        pass
+
+    # no /proc, fall back to the peak size (bytes on macOS, KiB elsewhere)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def gil_enabled():
+    """False on a free-threaded CPython build running without the GIL."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def choose_executor(executor, jobs, files, recycle=False):
+    """Resolve the `"auto"` executor for a run.
+
+    Threads need no pickling and no worker startup, but only run in parallel
+    without the GIL. With the GIL, worker processes only pay off for larger
+    runs, a handful of files (like a pre-commit run) is done faster serially.
+
+    Args:
+        executor (str): One of `EXECUTORS`.
+        jobs (int): Number of workers asked for.
+        files (int): Number of files in the run.
+        recycle (bool): Whether worker limits are set, only processes have them.
+
+    Returns `"serial"`, `"thread"` or `"process"`
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"unknown executor `{executor}`")
+    if executor != "auto":
+        return executor
+    if recycle:
+        return "process"
+    if jobs <= 1 or files <= 1:
+        return "serial"
+    if not gil_enabled():
+        return "thread"
+    return "process" if files >= PROCESS_MIN_FILES else "serial"
+
+
+def _worker_main(conn, func):
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        try:
+            result, error = func(task), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        conn.send((result, error, current_rss()))
+
+
+class _Worker:
+    def __init__(self, func):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main, args=(child_conn, func)
+        )
+        self.process.start()
+        # only the worker holds the other end now, so its death is an EOF here
+        child_conn.close()
+        self.task = None
+        self.done = 0
+
+    def send(self, task):
+        self.task = task
+        self.conn.send(task[1])
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+class RecyclingPool:
+    """Worker processes that get replaced before they grow too big.
+
+    After every task a worker reports its resident set size. Once that's
+    above `max_rss` bytes, or the worker ran `max_tasks` tasks, it's stopped
+    and a fresh one takes its place, so memory that piles up in a worker
+    (caches, fragmentation) is handed back. When a worker dies mid task (like
+    when it gets OOM-killed) the task is retried on a fresh worker.
+
+    Args:
+        func (callable): Runs one task in a worker and returns its result.
+        jobs (int): Number of worker processes.
+        max_rss (int): Recycle workers above this many bytes.
+        max_tasks (int): Recycle workers after this many tasks.
+    """
+
+    def __init__(self, func, jobs, max_rss=None, max_tasks=None):
+        self.func = func
+        self.jobs = max(1, jobs)
+        self.max_rss = max_rss
+        self.max_tasks = max_tasks
+        self.recycled = 0
+        self.retried = 0
+        self.peak_rss = 0
+
+    def _worn_out(self, worker, rss):
+        return (self.max_rss and rss > self.max_rss) or (
+            self.max_tasks and worker.done >= self.max_tasks
+        )
+
+    def run(self, tasks, on_start=None):
+        """Run `func` over `tasks`.
+
+        Yields `(idx, result, error)` in the order tasks finish, `error` is
+        None or a message when the task raised or kept killing its worker.
+        `on_start(idx)` is called whenever a task is handed to a worker.
+        """
+
+        def send(worker, item):
+            if on_start is not None:
+                on_start(item[0])
+            worker.send(item)
+
+        pending = collections.deque(enumerate(tasks))
+        attempts = collections.Counter()
+        workers = []
+        try:
+            while pending or any(worker.task for worker in workers):
+                while pending and len(workers) < self.jobs:
+                    worker = _Worker(self.func)
+                    send(worker, pending.popleft())
+                    workers.append(worker)
+
+                busy = {worker.conn: worker for worker in workers if worker.task}
+                for conn in wait(list(busy)):
+                    worker = busy[conn]
+                    idx, task = worker.task
+                    try:
+                        result, error, rss = conn.recv()
+                    except EOFError:
+                        workers.remove(worker)
+                        worker.stop()
+                        attempts[idx] += 1
+                        if attempts[idx] > WORKER_RETRIES:
+                            code = worker.process.exitcode
+                            yield idx, None, f"worker died (exit code {code})"
+                        else:
+                            self.retried += 1
+                            pending.appendleft((idx, task))
+                        continue
+
+                    worker.task = None
+                    worker.done += 1
+                    self.peak_rss = max(self.peak_rss, rss)
+                    yield idx, result, error
+
+                    if self._worn_out(worker, rss):
+                        workers.remove(worker)
+                        worker.stop()
+                        self.recycled += 1
+                    elif pending:
+                        send(worker, pending.popleft())
+        finally:
+            for worker in workers:
+                worker.stop()
+
+
+class ThreadPool:
+    """Threads running the tasks in this process.
+
+    The counterpart of `RecyclingPool` for free-threaded builds: nothing is
+    pickled and the workers share everything that's cached at module level.
+    At most `jobs` tasks are in flight, so `on_start` means the same here.
+
+    Args:
+        func (callable): Runs one task and returns its result.
+        jobs (int): Number of threads.
+    """
+
+    def __init__(self, func, jobs):
+        self.func = func
+        self.jobs = max(1, jobs)
+
+    def run(self, tasks, on_start=None):
+        """Run `func` over `tasks`, yields like `RecyclingPool.run`."""
+        pending = enumerate(tasks)
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+
+            def submit(items):
+                for idx, task in items:
+                    if on_start is not None:
+                        on_start(idx)
+                    running[executor.submit(self.func, task)] = idx
+
+            submit(itertools.islice(pending, self.jobs))
+            while running:
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    idx = running.pop(future)
+                    try:
+                        result, error = future.result(), None
+                    except Exception as e:
+                        result, error = None, f"{type(e).__name__}: {e}"
+                    yield idx, result, error
+                    submit(itertools.islice(pending, 1))
+
+
+def run_serial(func, tasks, on_start=None):
+    """Run `func` over `tasks` in this thread, yields like `RecyclingPool.run`."""
+    for idx, task in enumerate(tasks):
+        if on_start is not None:
+            on_start(idx)
+        try:
+            result, error = func(task), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        yield idx, result, error
@@ -0,0 +1,76 @@
+import pytest
+
+from fstringify import fstringify_sources
+from fstringify.api import excluded, fstringify_stdin
+
+
+SOURCES = {
+    "a.py": 'import os\nmsg = "hello %s" % name\n',
+    "b.py": b'# -*- coding: latin-1 -*-\nimport os\nmsg = "caf\xe9 %s" % name\n',
+    "c.py": "import os\n",
+}
+
+
+def test_fstringify_sources():
+    results = fstringify_sources(SOURCES)
+    assert list(results) == ["a.py", "b.py", "c.py"]
+
+    code, meta = results["a.py"]
+    assert code == 'import os\nmsg = f"hello {name}"\n'
+    assert meta["changed"]
+    assert meta["rules"]["percent"]["changed"] == 1
+
+    code, meta = results["b.py"]
+    assert code == '# -*- coding: latin-1 -*-\nimport os\nmsg = f"caf\xe9 {name}"\n'
+
+    assert results["c.py"] == ("import os\n", dict(changed=False, rules={}))
+
+
+def test_fstringify_sources_jobs():
+    sources = {f"mod{i}.py": f'import os\nx = "%s-{i}" % y\n' for i in range(20)}
+    assert fstringify_sources(sources, jobs=2) == fstringify_sources(sources)
+
+
+@pytest.mark.parametrize(
+    "data,expected",
+    [
+        (b'import os\nx = "%s" % y\n', b'import os\nx = f"{y}"\n'),
+        (b'import os\r\nx = "%s" % y\r\n', b'import os\r\nx = f"{y}"\r\n'),
+        # a site on line 1, without a trailing newline
+        (b"x = 'a %s' % y", b'x = f"a {y}"'),
+        (b"x = 'a %s' % y\r\nz = 1", b'x = f"a {y}"\r\nz = 1'),
+        (
+            SOURCES["b.py"],
+            SOURCES["b.py"].replace(b'"caf\xe9 %s" % name', b'f"caf\xe9 {name}"'),
+        ),
+        (
+            b'\xef\xbb\xbfimport os\nx = "%s" % y\n',
+            b'\xef\xbb\xbfimport os\nx = f"{y}"\n',
+        ),
+    ],
+)
+def test_fstringify_stdin(data, expected):
+    new_data, meta = fstringify_stdin(data)
+    assert new_data == expected
+    assert meta["changed"]
+
+
+def test_fstringify_stdin_unchanged():
+    data = b"import os\nx = 1\n"
+    assert fstringify_stdin(data) == (
+        data,
+        dict(changed=False, rules={}, skipped="prefilter"),
+    )
+
+    data = b'import os\nx = "%s" % y\n'
+    new_data, meta = fstringify_stdin(
+        data, filename="app/migrations/0001.py", exclude=["migrations"]
+    )
+    assert (new_data, meta["skipped"]) == (data, "exclude")
+
+
+def test_excluded():
+    assert excluded("pkg/migrations/0001.py", ["migrations"])
+    assert excluded("pkg/a_pb2.py", ["*_pb2.py"])
+    assert excluded("build/lib/a.py", ["build/*"])
+    assert not excluded("pkg/a.py", ["migrations", "*_pb2.py"])
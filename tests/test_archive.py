@@ -0,0 +1,106 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from fstringify import archive
+from fstringify.archive import fstringify_archive, record_hash
+
+
+MODULE = b'import os\nmessage = "hello %s" % name\n'
+CONVERTED = b'import os\nmessage = f"hello {name}"\n'
+DATA = b"\x00\x01 not python %s"
+
+
+def test_tar_archive(tmp_path):
+    src = str(tmp_path / "pkg-1.0.tar.gz")
+    with tarfile.open(src, "w:gz") as tar:
+        for name, data in (("pkg-1.0/pkg/mod.py", MODULE), ("pkg-1.0/data.bin", DATA)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o640
+            tar.addfile(info, io.BytesIO(data))
+
+    dest = str(tmp_path / "out.tar.gz")
+    results, _ = fstringify_archive(src, dest, quiet=True)
+    assert [result[:2] for result in results] == [("pkg-1.0/pkg/mod.py", True)]
+
+    with tarfile.open(dest) as tar:
+        assert tar.getnames() == ["pkg-1.0/pkg/mod.py", "pkg-1.0/data.bin"]
+        assert tar.extractfile("pkg-1.0/pkg/mod.py").read() == CONVERTED
+        assert tar.getmember("pkg-1.0/pkg/mod.py").mode == 0o640
+        assert tar.extractfile("pkg-1.0/data.bin").read() == DATA
+
+
+def test_wheel_record(tmp_path):
+    src = str(tmp_path / "pkg-1.0-py3-none-any.whl")
+    record = (
+        f"pkg/mod.py,{record_hash(MODULE)},{len(MODULE)}\n"
+        f"pkg/data.bin,{record_hash(DATA)},{len(DATA)}\n"
+        "pkg-1.0.dist-info/RECORD,,\n"
+    )
+    with zipfile.ZipFile(src, "w", zipfile.ZIP_DEFLATED) as whl:
+        whl.writestr("pkg/mod.py", MODULE)
+        whl.writestr("pkg-1.0.dist-info/RECORD", record)
+        whl.writestr("pkg/data.bin", DATA)
+
+    dest = str(tmp_path / "out.whl")
+    fstringify_archive(src, dest, quiet=True)
+
+    with zipfile.ZipFile(dest) as whl:
+        assert whl.namelist()[-1] == "pkg-1.0.dist-info/RECORD"
+        assert whl.read("pkg/mod.py") == CONVERTED
+        assert whl.read("pkg/data.bin") == DATA
+        assert whl.getinfo("pkg/mod.py").compress_type == zipfile.ZIP_DEFLATED
+        assert whl.read("pkg-1.0.dist-info/RECORD").decode() == (
+            f"pkg/mod.py,{record_hash(CONVERTED)},{len(CONVERTED)}\n"
+            f"pkg/data.bin,{record_hash(DATA)},{len(DATA)}\n"
+            "pkg-1.0.dist-info/RECORD,,\n"
+        )
+
+
+def test_archive_kind_mismatch(tmp_path):
+    with pytest.raises(ValueError):
+        fstringify_archive(str(tmp_path / "a.zip"), str(tmp_path / "b.tar"))
+
+
+def test_skipped_members(tmp_path, capsys):
+    src = str(tmp_path / "src.zip")
+    with zipfile.ZipFile(src, "w") as zf:
+        zf.writestr("latin.py", b'x = "caf\xe9 %s" % y\n')
+        zf.writestr("comment.py", b"x = 1  # 100%\n")
+        zf.writestr("mod.py", MODULE)
+
+    dest = str(tmp_path / "out.zip")
+    results, _ = fstringify_archive(src, dest)
+    assert [result[:2] for result in results] == [
+        ("latin.py", False),
+        ("comment.py", False),
+        ("mod.py", True),
+    ]
+    out = capsys.readouterr().out
+    assert "latin.py...skipped (not utf-8)" in out
+    assert "comment.py" not in out
+
+    fstringify_archive(src, dest, verbose=True)
+    assert "comment.py...skipped (prefilter)" in capsys.readouterr().out
+    with zipfile.ZipFile(dest) as zf:
+        assert zf.read("latin.py") == b'x = "caf\xe9 %s" % y\n'
+
+
+def test_failed_conversion_keeps_dest(tmp_path, monkeypatch):
+    src = str(tmp_path / "src.zip")
+    with zipfile.ZipFile(src, "w") as zf:
+        zf.writestr("mod.py", MODULE)
+    dest = tmp_path / "out.zip"
+    dest.write_bytes(b"old")
+
+    def fail(name, data, **options):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(archive, "convert_member", fail)
+    with pytest.raises(RuntimeError):
+        fstringify_archive(src, str(dest), quiet=True)
+    assert dest.read_bytes() == b"old"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out.zip", "src.zip"]
@@ -0,0 +1,41 @@
+import ast
+
+from fstringify.astcompat import (
+    is_constant,
+    is_num,
+    is_str,
+    make_num,
+    make_slice,
+    make_str,
+    str_value,
+    to_source,
+)
+
+
+def test_literal_checks():
+    nodes = [ast.parse(src, mode="eval").body for src in ("'a'", "1", "1.5", "True")]
+    assert [is_str(node) for node in nodes] == [True, False, False, False]
+    assert [is_num(node) for node in nodes] == [False, True, True, False]
+    assert all(is_constant(node) for node in nodes)
+    assert str_value(nodes[0]) == "a"
+    assert not is_str(ast.parse("b'a'", mode="eval").body)
+    assert not is_constant(ast.parse("a", mode="eval").body)
+
+
+def test_build_and_unparse():
+    name = ast.Name(id="d", ctx=ast.Load())
+    tree = ast.Module(
+        body=[
+            ast.Expr(
+                value=ast.Subscript(
+                    value=ast.Subscript(
+                        value=name, slice=make_slice(make_str("key")), ctx=ast.Load()
+                    ),
+                    slice=make_slice(make_num(0)),
+                    ctx=ast.Load(),
+                )
+            )
+        ],
+        type_ignores=[],
+    )
+    assert to_source(tree) == "d['key'][0]\n"
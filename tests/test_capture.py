@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+
+import pytest
+
+from fstringify.api import fstringify_files
+from fstringify.capture import (
+    CAPTURE_FILE,
+    PROFILE_FILE,
+    captured_statements,
+    find_captures,
+    load_capture,
+    parse_duration,
+    replay_capture,
+)
+
+
+CODE = 'import os\nx = "%s" % y\nif a:\n    z = "%s-%d" % (\n        b, c)\n'
+
+
+def test_parse_duration():
+    assert parse_duration("2s") == 2.0
+    assert parse_duration("500ms") == 0.5
+    assert parse_duration("1.5") == 1.5
+    assert parse_duration("2m") == 120.0
+    for value in ("2x", "s", "-1s"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_duration(value)
+
+
+def test_capture_and_replay(tmp_path):
+    (tmp_path / "a.py").write_text(CODE)
+    (tmp_path / "b.py").write_text('import os\nx = "%s" % y\n')
+    capture_dir = str(tmp_path / "captures")
+    files = [(str(tmp_path), "a.py"), (str(tmp_path), "b.py")]
+
+    fstringify_files(
+        files,
+        quiet=True,
+        capture_slow_threshold=0.0,
+        capture_dir=capture_dir,
+        target_version=(3, 8),
+    )
+    paths = find_captures(capture_dir)
+    assert [os.path.basename(path).split("-")[0] for path in paths] == ["a.py", "b.py"]
+
+    capture, contents = load_capture(paths[0])
+    assert contents == CODE
+    assert capture["path"] == str(tmp_path / "a.py")
+    assert capture["spans"] == [[2, 2], [4, 5]]
+    assert capture["options"] == dict(target_version=[3, 8])
+    assert set(capture["stages"]) == {"prefilter", "read", "convert", "write"}
+    assert find_captures(paths[0]) == [paths[0]]
+
+    capture, seconds, report = replay_capture(paths[0], top=5)
+    assert seconds > 0
+    assert "fstringify_code_by_line" in report
+    assert os.path.isfile(os.path.join(paths[0], PROFILE_FILE))
+
+    assert captured_statements(paths[0]) == ['x = "%s" % y', 'z = "%s-%d" % (\nb, c)']
+
+
+def test_fast_files_arent_captured(tmp_path):
+    (tmp_path / "a.py").write_text(CODE)
+    capture_dir = tmp_path / "captures"
+
+    results, _ = fstringify_files(
+        [(str(tmp_path), "a.py")],
+        quiet=True,
+        capture_slow_threshold=60.0,
+        capture_dir=str(capture_dir),
+    )
+    assert results[0][1]
+    assert not capture_dir.exists()
+
+
+def test_load_capture_checks_version(tmp_path):
+    (tmp_path / CAPTURE_FILE).write_text(json.dumps(dict(version=0)))
+    with pytest.raises(ValueError):
+        load_capture(str(tmp_path))
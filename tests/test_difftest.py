@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from fstringify.difftest import (
+    check_source,
+    compiles,
+    ddmin,
+    diff_sources,
+    fuzz_sources,
+    lost_statement,
+    random_module,
+    resolve_engine,
+)
+from fstringify.process import fstringify_code_by_line
+from fstringify.transform import fstringify_code
+
+
+def eggs_to_ham(code):
+    """An engine that is wrong about one line."""
+    return fstringify_code_by_line(code).replace("eggs", "ham")
+
+
+def drop_first_line(code):
+    """An engine that loses the first statement."""
+    return fstringify_code_by_line(code).partition("\n")[2]
+
+
+def test_ddmin():
+    assert ddmin(list(range(20)), lambda items: 7 in items) == [7]
+    assert ddmin(list(range(20)), lambda items: {3, 15} <= set(items)) == [3, 15]
+    assert ddmin([1], lambda items: True) == [1]
+
+
+def test_resolve_engine():
+    assert resolve_engine("tests.test_difftest:eggs_to_ham") is eggs_to_ham
+    code = "x = '%s' % y\n"
+    assert resolve_engine("ast")(code) == fstringify_code_by_line(code)
+    assert resolve_engine("ast")(code) != code
+    with pytest.raises(ValueError):
+        resolve_engine("nope")
+
+
+def test_mismatch_is_shrunk():
+    code = "".join(f"a{idx} = '%s' % b\n" for idx in range(10))
+    code += "spam = 'eggs %s' % b\n"
+    engines = ("ast", "tests.test_difftest:eggs_to_ham")
+    (mismatch,) = diff_sources([("mod.py", code)], engines=engines)
+
+    assert mismatch.name == "mod.py"
+    assert mismatch.kind == "ast"
+    assert mismatch.lineno == 11
+    assert mismatch.repro == "spam = 'eggs %s' % b"
+    assert "eggs {b}" in mismatch.outputs[0]
+    assert "ham {b}" in mismatch.outputs[1]
+
+    (mismatch,) = diff_sources(
+        [("mod.py", code)], engines=engines, shrink_mismatch=False
+    )
+    assert mismatch.repro == code
+
+
+def test_text_mismatch():
+    def engines_agree(code):
+        return check_source(code, ("ast", "tests.test_difftest:eggs_to_ham"))[0]
+
+    assert engines_agree("x = 1\n") is None
+    assert engines_agree("x = 1\n# eggs\n") == "text"
+
+
+def test_lost_statements():
+    assert (
+        lost_statement("x = 1\nif y:\n    z = 2", "x = 1\nif y:\n    z = f(2)") is None
+    )
+    assert lost_statement("x = 1\nif y:\n    z = 2", "x = 1\nif y:\n    z()") == 3
+    assert lost_statement("x = '%s' % y", "") == 1
+
+    engine = "tests.test_difftest:drop_first_line"
+    mismatches = diff_sources([("mod.py", "x = '%s' % y")], engines=(engine, engine))
+    assert [(m.kind, m.lineno) for m in mismatches] == [("lost", 1)]
+
+
+def test_fuzz_sources():
+    assert fuzz_sources(3, seed=5) == fuzz_sources(3, seed=5)
+    assert fuzz_sources(3, seed=5) != fuzz_sources(3, seed=6)
+    codes = [random_module(random.Random(seed), statements=5) for seed in range(50)]
+    assert all(compiles(code) for code in codes)
+    assert all(code.startswith(("v0 = ", "if v:")) for code in codes)
+    assert any(not code.endswith("\n") for code in codes)
+    assert any(code.count(" % ") == 1 for code in codes)
+
+
+def test_fuzzed_engines_agree():
+    assert diff_sources(fuzz_sources(6, seed=3), jobs=2) == []
+
+
+def test_unparsable_fstrings_are_refused():
+    # the fuzzer found astor writing `f'{d[\'k\']}"'` here
+    code = "x = '\"%s' % (d['k'],)"
+    assert compiles(fstringify_code(code))
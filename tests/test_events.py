@@ -0,0 +1,66 @@
+from fstringify import Observer
+from fstringify.api import fstringify_files
+from fstringify.events import Dispatcher
+
+
+class Recorder(Observer):
+    def __init__(self):
+        self.calls = []
+
+    def on_run_start(self, total):
+        self.calls.append(("run_start", total))
+
+    def on_file_start(self, path):
+        self.calls.append(("file_start", path))
+
+    def on_file_skipped(self, path, reason):
+        self.calls.append(("file_skipped", path, reason))
+
+    def on_site_converted(self, path, site):
+        self.calls.append(("converted", path, site.rule, site.lineno))
+
+    def on_site_rejected(self, path, site):
+        self.calls.append(("rejected", path, site.rule, site.lineno, site.reason))
+
+    def on_file_done(self, path, changed, meta, seconds, error):
+        self.calls.append(("file_done", path, changed, error))
+
+    def on_run_done(self, summary):
+        self.calls.append(("run_done", summary["files"], summary["changed"]))
+
+
+def test_observer_hooks(tmp_path):
+    (tmp_path / "a.py").write_text(
+        'import os\nx = "%s" % y\ndef f():\n    return "%s %s" % (z,)\nw = 1 % 2\n'
+    )
+    (tmp_path / "b.py").write_text("import os\n")
+    files = [(str(tmp_path), "a.py"), (str(tmp_path), "b.py")]
+    a, b = (str(tmp_path / name) for name in ("a.py", "b.py"))
+
+    recorder = Recorder()
+    fstringify_files(files, quiet=True, observers=[recorder])
+
+    assert recorder.calls == [
+        ("run_start", 2),
+        ("file_start", a),
+        ("converted", a, "percent", 2),
+        ("rejected", a, "percent", 4, "string formatting length mismatch"),
+        ("file_done", a, True, None),
+        ("file_start", b),
+        ("file_skipped", b, "prefilter"),
+        ("file_done", b, False, None),
+        ("run_done", 2, 1),
+    ]
+
+
+def test_dispatcher_skips_unused_hooks():
+    class Done(Observer):
+        def on_file_done(self, path, changed, meta, seconds, error):
+            pass
+
+    events = Dispatcher([Done()])
+    assert len(events.on_file_done) == 1
+    assert events.on_run_start == []
+    assert events.on_site_converted == []
+    assert not events.wants_sites
+    assert not Dispatcher().wants_sites
@@ -0,0 +1,49 @@
+from fstringify.fastpath import fast_fstringify, same_ast
+from fstringify.process import fstringify_code_by_line
+from fstringify.transform import fstringify_code
+
+
+def test_fast_fstringify():
+    assert fast_fstringify('b = "1+%s+2" % a') == 'b = f"1+{a}+2"'
+    assert fast_fstringify("b = '%s-%d' % (a, self.b)") == 'b = f"{a}-{self.b}"'
+    assert fast_fstringify("print('a \"%s\"' % x, y)  # hi") == (
+        "print(f'a \"{x}\"', y)  # hi"
+    )
+    assert fast_fstringify("\nreturn '%s' % (x,)") == 'return f"{x}"'
+
+
+def test_fast_fstringify_leaves_the_rest_to_the_ast_route():
+    for code in (
+        'b = "%(k)s" % d',
+        'b = "%s" % d[0]',
+        'b = "%s" % f(x)',
+        'b = "%s" % None',
+        'b = "{%s}" % x',
+        'b = "%s %s" % x',
+        'b = "%s" % x + y',
+        'b = y + "%s" % x',
+        'b = x * "%s" % y',
+        'b = "%s" "%s" % (x, y)',
+        'b = ["%s" % x for x in y]',
+        'b = """%s""" % x',
+        'b = "100%% %s" % x',
+    ):
+        assert fast_fstringify(code) is None, code
+
+
+def test_fast_path_matches_ast_route():
+    for code in ('b = "1+%s+2" % a', "x = ('%s.%s' % (a.b, c))", 'print("%d" % n)'):
+        assert same_ast(fast_fstringify(code), fstringify_code(code))
+
+
+def test_fstringify_code_by_line_fast_path():
+    code = """
+def run(self):
+    print('a val: %s' % self.a)
+    print('a val: %s b val: %s' % (self.a, self.b))
+    print('dk val: %(k)s' % self.d)
+    print('damnf', 'asdf: %s' % asdf)
+"""
+    expected = fstringify_code_by_line(code)
+    assert fstringify_code_by_line(code, fast_path=True) == expected
+    assert fstringify_code_by_line(code, fast_path=True, verify=True) == expected
@@ -101,7 +101,7 @@ if __name__ == '__main__':
 
     def test_mod_str_literal(self):
         code = 'b = "1+%s+2" % "a"'
-        expected = "b = f\"1+{'a'}+2\"\n"
+        expected = "b = '1+a+2'\n"
         result = fstringify_code(code)
         self.assertCodeEqual(result, expected)
 
@@ -325,13 +325,16 @@ def load_handler(path, *args, **kwargs):
         result = fstringify_code_by_line(code, debug=False)
         self.assertCodeEqual(result, code)
 
-    def test_django_noop5(self):
+    def test_django_backslash_operand_folded(self):
         code = """
         print("this is new line: %s" % "\\\\")
 """
+        # a folded constant has no f-string expression to keep backslashes out of
+        expected = """        print('this is new line: \\\\')
+"""
 
         result = fstringify_code_by_line(code, debug=False)
-        self.assertCodeEqual(result, code)
+        self.assertCodeEqual(result, expected)
 
     def test_django_noop6(self):
         code = """
@@ -369,14 +372,17 @@ def load_handler(path, *args, **kwargs):
 
         self.assertCodeEqual(result, code)
 
-    def test_django_noop9(self):
+    def test_django_op9(self):
         code = """
     hint = "HINT: %s" % self.hint if self.hint else ''
 """
+        # `%` binds tighter than the conditional expression
+        expected = """    hint = f"HINT: {self.hint}" if self.hint else ''
+"""
 
         result = fstringify_code_by_line(code, debug=False, stats=True)
 
-        self.assertCodeEqual(result, code)
+        self.assertCodeEqual(result, expected)
 
     def test_django_op_10(self):
         code = """
@@ -0,0 +1,90 @@
+import cProfile
+import sys
+
+from fstringify.hotspots import (
+    FunctionTime,
+    find_hotspots,
+    function_ranges,
+    hot_lines,
+    load_profile,
+    profile_functions,
+    rank_hotspots,
+)
+from fstringify.process import fstringify_code_by_line
+
+
+CODE = """import functools
+
+
+def hot(name):
+    def inner(x):
+        return "inner %s" % x
+    return "hot %s" % name
+
+
+@functools.lru_cache()
+def cold(name):
+    return "cold %s" % name
+
+
+top = "top %s" % hot
+"""
+
+FUNCTIONS = [
+    FunctionTime("hot", 4, 10, 0.5, 2.0),
+    FunctionTime("inner", 5, 40, 1.5, 1.5),
+    # decorated functions start on the decorator line
+    FunctionTime("cold", 10, 1, 0.001, 0.001),
+]
+
+
+def test_find_hotspots():
+    spots = {spot.start: spot for spot in find_hotspots(CODE, FUNCTIONS)}
+    assert spots[6].function == "inner"
+    assert spots[7].function == "hot"
+    assert spots[12].function == "cold"
+    assert spots[15].function is None
+
+    ranked = [spot.start for spot in rank_hotspots(spots.values())]
+    assert ranked == [6, 7, 12, 15]
+    assert hot_lines(spots.values(), 1.0) == {6, 7}
+
+
+def test_only_hot_lines_converted():
+    lines = hot_lines(find_hotspots(CODE, FUNCTIONS), 1.0)
+    result = fstringify_code_by_line(CODE, lines=lines)
+    assert 'return f"inner {x}"' in result
+    assert 'return f"hot {name}"' in result
+    assert 'return "cold %s" % name' in result
+    assert 'top = "top %s" % hot' in result
+
+
+def test_load_profile(tmp_path):
+    path = tmp_path / "src" / "mod.py"
+    path.parent.mkdir()
+    code = 'def work(x):\n    return "%s" % x\n'
+    path.write_text(code)
+    namespace = {}
+    exec(compile(code, str(path), "exec"), namespace)
+
+    profiler = cProfile.Profile()
+    profiler.runcall(namespace["work"], 1)
+    profiler.dump_stats(str(tmp_path / "prof.pstats"))
+
+    profile = load_profile(str(tmp_path / "prof.pstats"))
+    (function,) = profile_functions(profile, str(path), str(tmp_path))
+    assert (function.name, function.lineno, function.calls) == ("work", 1, 1)
+
+    # looked up by relative path when the profile comes from another checkout
+    moved = "/elsewhere/src/mod.py"
+    assert profile_functions(profile, moved, "/elsewhere") == [function]
+
+
+def test_function_ranges():
+    code = 'def f(x):\n    return g(\n        x,\n        "%s" % x,\n    )\n'
+    (ranges,) = function_ranges(code)
+    if sys.version_info >= (3, 8):
+        assert ranges == ({1}, 1, 5)
+    else:
+        # without `end_lineno` the last line any node starts on
+        assert ranges == ({1}, 1, 4)
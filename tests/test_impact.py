@@ -0,0 +1,46 @@
+import json
+
+from fstringify.impact import (
+    build_impact_report,
+    impact_markdown,
+    measure_code,
+    write_impact_report,
+)
+
+
+CODE = """
+def f(self, d):
+    a = "x %s y %d" % (self.name, boom())
+    b = "%(a)s-%(b).2f" % d
+    c = "%(a)s %(b)r" % {"a": 1, "b": self.x}
+    e = "%5.1f" % 2.5
+    skipped = "%s" % (x + y)
+"""
+
+
+def test_measure_code():
+    sites = measure_code(CODE, "m.py", number=10, repeat=1)
+    assert [site["line"] for site in sites] == [3, 4, 5, 6]
+
+    # operands are swapped for dummies, `boom()` never runs
+    assert sites[0]["before"] == "'x %s y %d' % (_v0, _v1)"
+    assert sites[0]["after"] == "f'x {_v0} y {_v1}'"
+    assert sites[0]["operands"] == {"_v0": "str", "_v1": "int"}
+    assert sites[1]["operands"] == {"_v0": {"a": "str", "b": "float"}}
+    # literals are kept as they are
+    assert sites[2]["operands"] == {"_v1": "str"}
+    assert sites[3]["after"] == "'  2.5'"
+    assert all(site["before_ns"] > 0 and site["speedup"] for site in sites)
+
+
+def test_write_impact_report(tmp_path):
+    report = build_impact_report(measure_code(CODE, "m.py", number=10, repeat=1))
+    assert report["summary"]["sites"] == 4
+
+    write_impact_report(report, str(tmp_path / "impact.json"))
+    assert json.loads((tmp_path / "impact.json").read_text()) == report
+
+    write_impact_report(report, str(tmp_path / "impact.md"))
+    markdown = (tmp_path / "impact.md").read_text()
+    assert markdown == impact_markdown(report)
+    assert "| m.py:3 | `'x %s y %d' % (_v0, _v1)` |" in markdown
@@ -0,0 +1,26 @@
+from fstringify.metrics import MetricsWriter
+
+
+def test_metrics_file(tmp_path):
+    fn = str(tmp_path / "fstringify.prom")
+    metrics = MetricsWriter(fn, interval=3600)
+    meta = dict(
+        bytes=2000,
+        stages=dict(prefilter=0.25, convert=0.5),
+        rules=dict(percent=dict(changed=3, folded=1)),
+    )
+    metrics.update(True, 0.02, meta)
+    metrics.update(False, 2.0, dict(meta, rules={}))
+    metrics.update(False, 0.0, dict(rules={}), error="worker died")
+    metrics.write()
+
+    lines = open(fn).read().splitlines()
+    assert 'fstringify_files_total{result="changed"} 1' in lines
+    assert 'fstringify_files_total{result="failed"} 1' in lines
+    assert "fstringify_bytes_total 4000" in lines
+    assert 'fstringify_sites_total{rule="percent"} 3' in lines
+    assert 'fstringify_stage_seconds_total{stage="convert"} 1' in lines
+    assert 'fstringify_file_seconds_bucket{le="0.05"} 2' in lines
+    assert 'fstringify_file_seconds_bucket{le="+Inf"} 3' in lines
+    assert "fstringify_file_seconds_count 3" in lines
+    assert not (tmp_path / "fstringify.prom.tmp").exists()
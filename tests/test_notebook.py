@@ -0,0 +1,110 @@
+import json
+
+from fstringify.api import find_files, fstringify_file
+from fstringify.notebook import fstringify_notebook_code, skip_notebook
+
+
+def make_notebook(*cells):
+    return dict(
+        cells=list(cells),
+        metadata={"kernelspec": {"name": "python3"}},
+        nbformat=4,
+        nbformat_minor=5,
+    )
+
+
+def code_cell(source, outputs=()):
+    return dict(
+        cell_type="code",
+        execution_count=1,
+        metadata={"scrolled": True},
+        outputs=list(outputs),
+        source=source,
+    )
+
+
+OUTPUT = {"name": "stdout", "output_type": "stream", "text": ["0.50\n"]}
+NOTEBOOK = make_notebook(
+    dict(cell_type="markdown", metadata={}, source=["Rate is %s % x\n"]),
+    code_cell(
+        ["import math\n", "for x in xs:\n", '    print("%.2f" % x)'], outputs=[OUTPUT]
+    ),
+    code_cell(["%timeit f(x)\n", 'y = "%s" % x']),
+    code_cell('import os\nz = "%s-%s" % (a, b)\n'),
+)
+
+
+def test_fstringify_notebook_code():
+    contents = json.dumps(NOTEBOOK, indent=1) + "\n"
+    new_contents, meta = fstringify_notebook_code(contents)
+    assert meta["changed"]
+    assert meta["rules"]["percent"]["changed"] == 2
+    assert new_contents.endswith("}\n")
+
+    notebook = json.loads(new_contents)
+    markdown, loop, magic, plain = notebook["cells"]
+    assert markdown == NOTEBOOK["cells"][0]
+    assert loop["source"] == [
+        "import math\n",
+        "for x in xs:\n",
+        '    print(f"{x:.2f}")',
+    ]
+    assert loop["outputs"] == [OUTPUT]
+    assert loop["metadata"] == {"scrolled": True}
+    # magics aren't Python, the cell is left alone
+    assert magic == NOTEBOOK["cells"][2]
+    assert plain["source"] == 'import os\nz = f"{a}-{b}"\n'
+    assert notebook["metadata"] == NOTEBOOK["metadata"]
+
+
+def test_sites_on_the_first_line_of_a_cell():
+    # Jupyter stores sources without a trailing newline
+    notebook = make_notebook(
+        code_cell(["r = '%s' % s"]),
+        code_cell(['y = "%s" % x\n', "z = y"]),
+        code_cell("w = '%d' % n"),
+    )
+    new_contents, meta = fstringify_notebook_code(json.dumps(notebook))
+    assert meta["rules"]["percent"]["changed"] == 3
+
+    single, first, plain = json.loads(new_contents)["cells"]
+    assert single["source"] == ['r = f"{s}"']
+    assert first["source"] == ['y = f"{x}"\n', "z = y"]
+    assert plain["source"] == 'w = f"{n}"'
+
+
+def test_unchanged_notebook_is_returned_as_is():
+    contents = json.dumps(make_notebook(code_cell("import os\n")))
+    assert fstringify_notebook_code(contents) == (
+        contents,
+        dict(changed=False, rules={}),
+    )
+
+
+def test_skip_notebook():
+    assert skip_notebook(json.dumps(make_notebook(code_cell("x = 1"))))
+    # only code cells count
+    assert skip_notebook(json.dumps(make_notebook(NOTEBOOK["cells"][0])))
+    assert not skip_notebook(json.dumps(NOTEBOOK))
+    assert skip_notebook("not json %s")
+    assert not skip_notebook(json.dumps(make_notebook(code_cell("'{}'.format(1)"))))
+
+
+def test_notebooks_in_a_run(tmp_path):
+    (tmp_path / "analysis.ipynb").write_text(json.dumps(NOTEBOOK, indent=1))
+    (tmp_path / "plain.ipynb").write_text(json.dumps(make_notebook()))
+    (tmp_path / ".ipynb_checkpoints").mkdir()
+    (tmp_path / ".ipynb_checkpoints" / "analysis-checkpoint.ipynb").write_text("{}")
+    (tmp_path / "mod.py").write_text("import os\n")
+
+    files = sorted(name for _, name in find_files(str(tmp_path)))
+    assert files == ["analysis.ipynb", "mod.py", "plain.ipynb"]
+
+    changed, meta = fstringify_file(str(tmp_path / "analysis.ipynb"), include_meta=True)
+    assert changed
+    assert meta["rules"]["percent"]["changed"] == 2
+    assert 'f\\"{x:.2f}\\"' in (tmp_path / "analysis.ipynb").read_text()
+
+    changed, meta = fstringify_file(str(tmp_path / "plain.ipynb"), include_meta=True)
+    assert not changed
+    assert meta["skipped"] == "prefilter"
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from fstringify import main
+from fstringify.plan import apply_edits, apply_plan, compute_edits, load_plan
+
+
+def test_edits_round_trip():
+    old = 'import os\n# caf\xe9\nx = "%s" % y\nz = 1\n'
+    new = 'import os\n# caf\xe9\nx = f"{y}"\nz = 1\n'
+    edits = compute_edits(old, new)
+    # byte offsets, the comment line is 8 bytes in UTF-8
+    assert edits == [[18, 31, 'x = f"{y}"\n']]
+    assert apply_edits(old.encode("utf-8"), edits) == new.encode("utf-8")
+
+
+def test_plan_and_apply(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "src").mkdir()
+    for i in range(4):
+        (tmp_path / "src" / f"mod{i}.py").write_text(f'import os\nx = "%s-{i}" % y\n')
+    (tmp_path / "src" / "plain.py").write_text("import os\n")
+
+    main(["plan", "--quiet", "src", "-o", "plan.json"])
+    plan = load_plan("plan.json")
+    assert [entry["path"] for entry in plan["files"]] == [
+        f"src/mod{i}.py" for i in range(4)
+    ]
+    # nothing is written while planning
+    assert (tmp_path / "src" / "mod0.py").read_text() == 'import os\nx = "%s-0" % y\n'
+
+    (tmp_path / "src" / "mod3.py").write_text("import os\n")
+    shards = [apply_plan(plan, shard=(i, 2)) for i in (1, 2)]
+    applied = sorted(shards[0][0] + shards[1][0])
+    assert applied == ["src/mod0.py", "src/mod1.py", "src/mod2.py"]
+    assert shards[0][2] + shards[1][2] == ["src/mod3.py"]
+    assert (tmp_path / "src" / "mod1.py").read_text() == 'import os\nx = f"{y}-1"\n'
+
+    assert apply_plan(plan) == (
+        [],
+        ["src/mod0.py", "src/mod1.py", "src/mod2.py"],
+        ["src/mod3.py"],
+    )
+
+
+def test_plan_and_apply_crlf(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    old = b'import os\r\nx = "%s" % y\r\nz = 1\r\n'
+    (tmp_path / "mod.py").write_bytes(old)
+
+    main(["plan", "--quiet", "mod.py", "-o", "plan.json"])
+    (entry,) = load_plan("plan.json")["files"]
+    assert entry["edits"] == [[11, 25, 'x = f"{y}"\r\n']]
+
+    assert apply_plan(load_plan("plan.json")) == (["mod.py"], [], [])
+    assert (tmp_path / "mod.py").read_bytes() == b'import os\r\nx = f"{y}"\r\nz = 1\r\n'
+
+
+def test_load_plan_checks_version(tmp_path):
+    fn = tmp_path / "plan.json"
+    fn.write_text(json.dumps(dict(version=0, files=[])))
+    with pytest.raises(ValueError):
+        load_plan(str(fn))
@@ -1,4 +1,6 @@
+from fstringify import process
 from fstringify.process import (
+    fstringify_code_by_line,
     no_skipping,
     rebuild_transformed_lines,
     get_str_bin_op_lines,
@@ -65,3 +67,51 @@ def test_rebuild_transformed_lines():
     lines = rebuild_transformed_lines(code_block, "    ")
     assert lines == """    attrs = {'r': '%d' % row_idx}"""
 
+
+
+def test_fstringify_code_by_line_jobs(monkeypatch):
+    code = "\n".join(
+        [""]
+        + [f"    a{i} = 'value %s' % b{i}" for i in range(30)]
+        + ["    c = {'r': '%d' % row_idx}", "    d = c", ""]
+    )
+    expected = fstringify_code_by_line(code)
+    assert "f\"value {b29}\"" in expected
+
+    monkeypatch.setattr(process, "INTRA_FILE_MIN_SCOPES", 1)
+    monkeypatch.setattr(process, "INTRA_FILE_BATCH_SIZE", 4)
+    assert fstringify_code_by_line(code, jobs=3) == expected
+
+
+def test_dict_literal_operand():
+    code = """
+def g():
+    x = '%(a)s took %(t).2f' % {'a': name, 't': took}
+    query = {'%s__in' % related_field.name: instances}
+"""
+    assert fstringify_code_by_line(code) == """
+def g():
+    x = f"{name} took {took:.2f}"
+    query = {'%s__in' % related_field.name: instances}
+"""
+
+
+def test_first_line():
+    assert fstringify_code_by_line("x = '%s' % y\nz = 1\n") == 'x = f"{y}"\nz = 1\n'
+    # without a trailing newline, like a piped in snippet or a notebook cell
+    assert fstringify_code_by_line("x = '%s' % y") == 'x = f"{y}"'
+    assert no_skipping("x = '%s' % y")[0] == [0]
+
+
+def test_nested_conversions():
+    # the inner site would need another quote than the outer f-string
+    for code in ('x = "%s" % g("{}".format(y))', 'x = "{}".format(g("%d" % y))'):
+        result = fstringify_code_by_line(code)
+        assert result.startswith('x = f"{g(')
+        compile(result, "<test>", "exec")
+    assert fstringify_code_by_line('x = f"{g(\'%s\' % y)}"') == 'x = f"{g(\'%s\' % y)}"'
+
+
+def test_quotes_are_only_swapped_when_it_still_parses(monkeypatch):
+    monkeypatch.setattr(process, "force_double_quote_fstring", lambda code: code + "(")
+    assert fstringify_code_by_line("x = '%s' % y") == "x = f'{y}'"
@@ -0,0 +1,24 @@
+import io
+
+from fstringify.progress import Progress, format_duration
+
+
+def test_progress_line():
+    stream = io.StringIO()
+    progress = Progress(4, stream=stream)
+    progress.start -= 2.0
+    progress.update(True, 1_000_000)
+    progress.update(False, 1_000_000, error="worker died")
+    line = progress.line(now=progress.start + 2.0)
+    assert line == "2/4 files, 1.0 files/s, 1.00 MB/s, ETA 2s, 1 changed, 1 failed"
+
+    progress.finish()
+    # not a terminal, so whole lines instead of redrawing in place
+    assert stream.getvalue().endswith(" failed\n")
+    assert "\r" not in stream.getvalue()
+
+
+def test_format_duration():
+    assert format_duration(59) == "59s"
+    assert format_duration(61) == "1m01s"
+    assert format_duration(3 * 3600 + 120) == "3h02m"
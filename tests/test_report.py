@@ -0,0 +1,29 @@
+import pytest
+
+from fstringify.report import build_report, merge_reports, missing_shards
+
+
+def test_merge_reports():
+    percent = {"percent": {"changed": 2, "folded": 1}}
+    first = build_report(
+        [("/src/a.py", True, 0.5, percent), ("/src/b.py", False, 0.25, {})],
+        "/src",
+        1.0,
+        (1, 3),
+    )
+    second = build_report([("/src/pkg/c.py", True, 2.0, percent)], "/src", 2.0, (3, 3))
+
+    merged = merge_reports([first, second])
+    assert merged["files"] == 3
+    assert merged["changed"] == 2
+    assert merged["changed_files"] == ["a.py", "pkg/c.py"]
+    assert merged["total_time"] == 3.0
+    assert merged["wall_time"] == 2.0
+    assert merged["rules"] == {"percent": {"changed": 4, "folded": 2}}
+    assert missing_shards(merged) == [2]
+
+
+def test_merge_reports_rejects_duplicate_shards():
+    report = build_report([("/src/a.py", True, 0.5, {})], "/src", 1.0, (1, 2))
+    with pytest.raises(ValueError):
+        merge_reports([report, report])
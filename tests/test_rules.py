@@ -0,0 +1,113 @@
+import ast
+
+from fstringify.astcompat import MODERN_AST
+from fstringify.process import fstringify_code_by_line
+from fstringify.transform import Rule, fstringify_code, fstringify_node, register_rule
+
+
+@register_rule
+class UpperRule(Rule):
+    """Test rule upper casing `"lower"` string literals"""
+
+    name = "test-upper"
+    descend = True
+    trigger_tokens = ("lower",)
+
+    @classmethod
+    def match_chunk(cls, chunk):
+        return any(tokval == '"lower"' for _, tokval, *rest in chunk)
+
+    def visit_Str(self, node):
+        if node.s != "lower":
+            return node
+        self.counter += 1
+        return ast.Str(s="LOWER")
+
+
+def test_rules_share_one_traversal():
+    code = 'x = ("a %s" % b, "lower")'
+    result, meta = fstringify_code(
+        code, include_meta=True, rules=["percent", "test-upper"]
+    )
+    # astor drops the parentheses of the tuple, `ast.unparse` keeps them
+    if MODERN_AST:
+        assert result == "x = (f'a {b}', 'LOWER')\n"
+    else:
+        assert result == "x = f'a {b}', 'LOWER'\n"
+    assert meta["rules"] == {
+        "percent": {"changed": 1, "folded": 0},
+        "test-upper": {"changed": 1},
+    }
+
+
+def test_rules_see_nodes_replaced_by_earlier_rules():
+    code = 'x = "%s" % f("lower")'
+    result, meta = fstringify_code(
+        code, include_meta=True, rules=["percent", UpperRule]
+    )
+    assert meta["rules"]["test-upper"]["changed"] == 1
+    # `test-upper` still sees the `Str` inside the f-string `percent` built
+    assert result == "x = f\"{f('LOWER')}\"\n"
+
+
+def test_rules_find_their_own_candidates():
+    code = """
+def f():
+    a = "lower"
+    b = "%s" % c
+"""
+    result, meta = fstringify_code_by_line(
+        code, rules=["percent", "test-upper"], include_meta=True
+    )
+    assert (
+        result
+        == """
+def f():
+    a = 'LOWER'
+    b = f"{c}"
+"""
+    )
+    assert meta["rules"] == {
+        "percent": {"changed": 1, "folded": 0},
+        "test-upper": {"changed": 1},
+    }
+    assert (
+        fstringify_code_by_line(code, rules=["test-upper"])
+        == """
+def f():
+    a = 'LOWER'
+    b = "%s" % c
+"""
+    )
+
+
+def test_rules_report_rejections():
+    code = """
+a = "{}".format(b, "{")
+c = "{" + str(d) + str(e)
+log.info("%s %s" % (f,))
+g = "{}".format(h)
+"""
+    _, meta = fstringify_node(
+        ast.parse(code), rules=["format", "concat", "logging"], collect_sites=True
+    )
+    assert [(site.rule, site.lineno, site.reason) for site in meta["sites"]] == [
+        ("format", 2, "unsafe string in the arguments"),
+        ("concat", 3, "unsafe string in an operand"),
+        ("logging", 4, "string formatting length mismatch"),
+        ("format", 5, None),
+    ]
+
+
+def test_sites_of_nodes_without_a_position():
+    class ComprehensionRule(Rule):
+        name = "test-comprehension"
+
+        def visit_comprehension(self, node):
+            self.counter += 1
+            return node
+
+    _, meta = fstringify_node(
+        ast.parse("x = [y for y in z]"), rules=[ComprehensionRule], collect_sites=True
+    )
+    assert [(site.lineno, site.col_offset) for site in meta["sites"]] == [(-1, -1)]
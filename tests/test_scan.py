@@ -0,0 +1,76 @@
+import os
+
+from fstringify.scan import (
+    count_by_dir,
+    count_by_reason,
+    list_sites,
+    open_index,
+    scan_code,
+    scan_summary,
+    update_index,
+)
+
+
+CODE = """import os
+a = "%s %s" % (b, c)
+d = "%(x)s" % mapping
+e = "{} %s" % f
+g = "%s" % (h if i else j)
+k = "%s %s" % (l,)
+m = (
+    "%d" % n
+)
+"""
+
+
+def test_scan_code():
+    assert scan_code(CODE) == [
+        (2, 2, 2, "tuple", None),
+        (3, 3, 3, "name", None),
+        (4, 4, 4, "name", None),
+        (5, 5, 5, "ifexp", "unsupported operand (IfExp)"),
+        (6, 6, 6, "tuple", "string formatting length mismatch"),
+        (7, 9, 8, "name", None),
+    ]
+
+
+def test_update_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text(CODE)
+    (tmp_path / "b.py").write_text('import os\nx = "%s" % y\n')
+    files = [("pkg", "a.py"), (".", "b.py")]
+
+    conn = open_index("index.sqlite")
+    assert update_index(conn, files, ".") == (2, 0, 0)
+    assert scan_summary(conn) == (2, 7, 5)
+    assert count_by_dir(conn) == [("pkg", 6, 4), (".", 1, 1)]
+    assert count_by_reason(conn)[0] == ("string formatting length mismatch", 1)
+
+    # untouched files aren't read again, removed ones are dropped
+    assert update_index(conn, files, ".") == (0, 2, 0)
+    os.remove("b.py")
+    (tmp_path / "pkg" / "a.py").write_text("import os\n")
+    assert update_index(open_index("index.sqlite"), files[:1], ".") == (1, 0, 1)
+    assert scan_summary(conn) == (0, 0, 0)
+
+
+def test_paths_are_relative_to_root(tmp_path, monkeypatch):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text(CODE)
+    files = [(str(tmp_path / "pkg"), "a.py")]
+
+    indexes = []
+    for cwd in (tmp_path, tmp_path / "pkg"):
+        monkeypatch.chdir(cwd)
+        conn = open_index(str(tmp_path / f"{len(indexes)}.sqlite"))
+        assert update_index(conn, files, str(tmp_path)) == (1, 0, 0)
+        indexes.append(list_sites(conn))
+    assert indexes[0] == indexes[1]
+    assert indexes[0][0] == ("pkg/a.py", 2, "tuple", None)
+
+    # a single file is stored relative to its directory and prunes nothing else
+    conn = open_index(str(tmp_path / "0.sqlite"))
+    file_root = str(tmp_path / "pkg" / "a.py")
+    assert update_index(conn, files, file_root) == (1, 0, 0)
+    assert {path for path, *_ in list_sites(conn)} == {"pkg/a.py", "a.py"}
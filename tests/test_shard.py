@@ -0,0 +1,37 @@
+import argparse
+
+import pytest
+
+from fstringify.shard import parse_shard, shard_files
+
+
+def make_tree(tmp_path, sizes):
+    files = []
+    for name, size in sizes.items():
+        (tmp_path / name).write_text("x" * size)
+        files.append((str(tmp_path), name))
+    return files
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for bad in ("0/4", "5/4", "a/b", "3"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(bad)
+
+
+def test_shards_partition_files(tmp_path):
+    files = make_tree(tmp_path, {f"mod{i}.py": i for i in range(20)})
+    for by in ("hash", "size"):
+        shards = [shard_files(files, str(tmp_path), i, 3, by=by) for i in (1, 2, 3)]
+        picked = [f for shard in shards for f in shard]
+        assert sorted(picked) == sorted(files)
+        assert shard_files(reversed(files), str(tmp_path), 2, 3, by=by) == shards[1]
+
+
+def test_size_shards_balance_load(tmp_path):
+    files = make_tree(tmp_path, {"big.py": 100, "a.py": 50, "b.py": 50})
+    assert shard_files(files, str(tmp_path), 1, 2, by="size") == [
+        (str(tmp_path), "big.py")
+    ]
+    assert len(shard_files(files, str(tmp_path), 2, 2, by="size")) == 2
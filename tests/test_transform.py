@@ -0,0 +1,257 @@
+import argparse
+import sys
+
+import pytest
+
+from fstringify import transform
+from fstringify.astcompat import MODERN_AST
+from fstringify.process import fstringify_code_by_line
+from fstringify.transform import fstringify_code, parse_target_version, split_format_str
+
+
+VALUES = dict(t=1.23456, obj=["a"], h=255, x="x", s="abc", f=-12.5, i=42, y=-7)
+
+
+def run(code):
+    namespace = dict(VALUES)
+    exec(code, namespace)
+    return namespace["result"]
+
+
+def assert_same_result(code, expected):
+    code = f"result = {code}"
+    converted = fstringify_code(code)
+    assert converted == f"result = {expected}\n"
+    assert run(converted) == run(code)
+
+
+@pytest.mark.parametrize(
+    "code,expected",
+    [
+        ('"%.3f ms" % t', "f'{t:.3f} ms'"),
+        ('"%r" % obj', "f'{obj!r}'"),
+        ('"%08x" % h', "f'{h:08x}'"),
+        ('"%#X|%o" % (h, i)', "f'{h:#X}|{i:o}'"),
+        ('"%5s|%-5s|%.2s" % (s, s, s)', "f'{s!s:>5}|{s!s:<5}|{s!s:.2}'"),
+        ('"%+.2e % x" % (f, i)', "f'{f:+.2e} {i: x}'"),
+        ('"%d|%s" % (i, s)', "f'{i}|{s}'"),
+        ('"%s %d" % (s, i)', "f'{s} {i}'"),
+        ('"%(a)s-%(b)5.1f" % {"a": x, "b": t}', "f'{x}-{t:5.1f}'"),
+        ('"%(a)s %(a)r" % {"a": x}', "f'{x} {x!r}'"),
+        ('"%(a)s" % {"a": len(s), "b": 1}', "f'{len(s)}'"),
+    ],
+)
+def test_printf_specifiers(code, expected):
+    assert_same_result(code, expected)
+
+
+@pytest.mark.parametrize(
+    "code,expected",
+    [
+        ('"prefix-%s-%03d" % ("abc", 7)', "'prefix-abc-007'"),
+        ('"%.2f%%" % 12.345', "'12.35%'"),
+    ],
+)
+def test_fold_constant_operands(code, expected):
+    assert fstringify_code(f"result = {code}") == f"result = {expected}\n"
+
+
+@pytest.mark.parametrize(
+    "code", ['"%s" % (1, 2)', '"%09999d" % 1', r'"%s" % "a\nb"', r'"a\r%d" % 1']
+)
+def test_fold_constant_operands_noop(code):
+    assert fstringify_code(f"result = {code}") == f"result = {code}"
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        '"%c" % i',
+        '"%.3d" % i',
+        '"%05s" % s',
+        '"%-05d" % i',
+        '"%5d" % t',
+        '"%-5i|%05d" % (i, y)',
+        '"%+d" % t',
+        '"%i" % i',
+        '"%u" % i',
+        '"%d %s" % (2.5, s)',
+        '"%d %s" % (True, s)',
+        '"%d %s" % (-0.0, s)',
+        '"%(c)s" % {"a": x}',
+        '"%*d" % (i, i)',
+        '"%s %(a)s" % {"a": x}',
+        '"%(a)s" % {"a": len(s), "b": len(x)}',
+        '"%(b)s %(a)s" % {"a": len(s), "b": len(x)}',
+        '"%(a)s %(a)s" % {"a": len(s)}',
+        '"%(a)s" % {"a": x, **obj}',
+    ],
+)
+def test_printf_specifiers_refused(code):
+    code = f"result = {code}"
+    assert fstringify_code(code) == code
+
+
+@pytest.mark.parametrize(
+    "code,expected",
+    [
+        ('"{%s}" % x', "f'{{{x}}}'"),
+        ("""'{"k": %d}' % i""", """f'{{"k": {i}}}'"""),
+        ("""'%s-%s' % ("it's", s)""", """f"it's-{s}\""""),
+        ('"%(a)s: %(b)s" % {"a": "{a}", "b": s}', "f'{{a}}: {s}'"),
+    ],
+)
+def test_braces_and_string_operands(code, expected):
+    assert_same_result(code, expected)
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        """'%s' % obj.count("it's")""",
+        """"%(it's)s" % VALUES""",
+        r'"%s" % "\\".join(obj)',
+    ],
+)
+def test_quoted_expressions_need_pep_701(code):
+    code = f"result = {code}"
+    assert fstringify_code(code) == code
+
+    converted = fstringify_code(code, target_version=(3, 12))
+    if MODERN_AST and sys.version_info < (3, 12) and "\\" in code:
+        # `ast.unparse` can't write backslashes in expressions before 3.12
+        assert converted == code
+    else:
+        assert converted.startswith("result = f")
+
+
+@pytest.mark.parametrize(
+    "code", [r'"%s!" % (d["a\nb"],)', r'"%s!" % (d["a\x00b"],)', r'"%s" % f("\r")']
+)
+def test_escapes_in_expressions_refused(code):
+    code = f"result = {code}"
+    assert fstringify_code(code) == code
+    assert fstringify_code(code, target_version=(3, 12)) == code
+
+
+def test_unwritable_fstrings_are_refused(monkeypatch):
+    def to_source(node):
+        raise ValueError("Unable to avoid backslash in f-string expression part")
+
+    monkeypatch.setattr(transform, "to_source", to_source)
+    code = 'result = "%s" % x'
+    result, meta = fstringify_code(code, include_meta=True)
+    assert result == code
+    assert not meta["changed"]
+    assert meta["rules"]["percent"]["changed"] == 0
+
+
+def test_parse_target_version():
+    assert parse_target_version("3.12") == (3, 12)
+    for value in ("3.5", "3", "3.x"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_target_version(value)
+
+
+def test_split_format_str():
+    assert split_format_str("a %(k)-5.2f%% %s") == [
+        "a ",
+        ("k", "-", "5", "2", "f"),
+        "% ",
+        (None, "", "", None, "s"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "code,expected",
+    [
+        ('"{} of {}".format(s, i)', "f'{s} of {i}'"),
+        ('"{1}-{0}-{1}".format(s, i)', "f'{i}-{s}-{i}'"),
+        ('"{name!r:>10}".format(name=x)', "f'{x!r:>10}'"),
+        ('"{0[0]}/{1.real:.1f}".format(obj, f)', "f'{obj[0]}/{f.real:.1f}'"),
+        ('"{}".format(len(s), i)', "f'{len(s)}'"),
+        ('len("{} x".format(s))', "len(f'{s} x')"),
+        ('str.upper("{}-{}".format(s, i))', "str.upper(f'{s}-{i}')"),
+        ('["{}".format(c) for c in s]', "[f'{c}' for c in s]"),
+    ],
+)
+def test_format_calls(code, expected):
+    assert_same_result(code, expected)
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        '"{}".format(*obj)',
+        '"{x}".format(**VALUES)',
+        '"{} {}".format(len(s))',
+        '"{0} {}".format(s, i)',
+        '"{{}} {}".format(s)',
+        '"{:{w}}".format(s, w=5)',
+        '"{0} {0}".format(len(s))',
+        '"{1} {0}".format(len(s), len(x))',
+        '"{}".format(len(s), len(x))',
+        '"{}".format("it\'s")',
+    ],
+)
+def test_format_calls_refused(code):
+    code = f"result = {code}"
+    assert fstringify_code(code) == code
+
+
+def test_format_calls_in_statements():
+    code = 'raise ValueError("{} x".format(s))'
+    assert fstringify_code(code) == "raise ValueError(f'{s} x')\n"
+
+
+@pytest.mark.parametrize(
+    "code,expected",
+    [
+        ('"id=" + str(i) + " s=" + str(s)', "f'id={i!s} s={s!s}'"),
+        ('"id=" + str(i) + " s=" + s', "f'id={i!s} s=' + s"),
+        ('str(f) + "-" + "x"', "f'{f!s}-x'"),
+    ],
+)
+def test_concat_chains(code, expected):
+    code = f"result = {code}"
+    converted = fstringify_code(code, rules=["concat"])
+    assert converted == f"result = {expected}\n"
+    assert run(converted) == run(code)
+
+
+@pytest.mark.parametrize(
+    "code", ['s + "a" + str(i)', '"a" + "b"', '"{" + str(i)', '"a" + str(i, "x")']
+)
+def test_concat_chains_refused(code):
+    code = f"result = {code}"
+    assert fstringify_code(code, rules=["concat"]) == code
+
+
+def test_concat_chains_inside_fstrings():
+    code = 'x = "a" + str("x" + str(y))'
+    result = fstringify_code_by_line(code, rules=["concat"])
+    assert result.startswith('x = f"a{')
+    assert result.count("f'") + result.count('f"') == 1
+    compile(result, "<test>", "exec")
+
+
+@pytest.mark.parametrize(
+    "code,expected",
+    [
+        ('log.debug("payload %s" % obj)', "log.debug('payload %s', obj)"),
+        (
+            'self.logger.info("%s %d" % (s, i), exc_info=True)',
+            "self.logger.info('%s %d', s, i, exc_info=True)",
+        ),
+        ('logging.log(10, "%(a)s" % d)', "logging.log(10, '%(a)s', d)"),
+        ('log.info("%s %s" % pair)', 'log.info("%s %s" % pair)'),
+        ('log.info("%s" % s, i)', "log.info(f'{s}', i)"),
+        ('other.info("%s" % s)', "other.info(f'{s}')"),
+        ('foo(log.info("a %s" % b))', "foo(log.info('a %s', b))"),
+        ('log.info("done 100%%" % ())', "log.info('done 100%')"),
+        ('raise ValueError("%s" % s)', "raise ValueError(f'{s}')"),
+    ],
+)
+def test_logging_calls(code, expected):
+    result = fstringify_code(code, rules=["logging", "percent"])
+    assert result.rstrip("\n") == expected
@@ -0,0 +1,138 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from fstringify.api import fstringify_files
+from fstringify.workers import (
+    PROCESS_MIN_FILES,
+    RecyclingPool,
+    ThreadPool,
+    choose_executor,
+    current_rss,
+    run_serial,
+)
+
+
+def pid_task(task):
+    return task, os.getpid()
+
+
+def crash_once_task(marker):
+    # dies the first time, like a worker that gets OOM-killed
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return "ok"
+
+
+def always_crash_task(task):
+    os._exit(3)
+
+
+def raise_task(task):
+    raise ValueError(f"bad {task}")
+
+
+def test_recycle_after_max_tasks():
+    pool = RecyclingPool(pid_task, 2, max_tasks=3)
+    outcomes = sorted(pool.run(range(12)))
+    assert [result[0] for _, result, _ in outcomes] == list(range(12))
+    pids = [result[1] for _, result, _ in outcomes]
+    assert max(pids.count(pid) for pid in pids) == 3
+    assert pool.recycled == sum(pids.count(pid) == 3 for pid in set(pids))
+
+
+def test_recycle_above_max_rss():
+    pool = RecyclingPool(pid_task, 1, max_rss=1)
+    outcomes = list(pool.run(range(3)))
+    assert len({result[1] for _, result, _ in outcomes}) == 3
+    assert pool.peak_rss > 1
+
+
+def test_retry_on_fresh_worker(tmp_path):
+    pool = RecyclingPool(crash_once_task, 1)
+    assert list(pool.run([str(tmp_path / "marker")])) == [(0, "ok", None)]
+    assert pool.retried == 1
+
+
+def test_errors_are_reported():
+    assert list(RecyclingPool(always_crash_task, 1).run(["x"])) == [
+        (0, None, "worker died (exit code 3)")
+    ]
+    assert list(RecyclingPool(raise_task, 1).run(["x"])) == [
+        (0, None, "ValueError: bad x")
+    ]
+
+
+def test_current_rss():
+    assert current_rss() > 0
+
+
+def test_thread_pool():
+    started = []
+    pool = ThreadPool(lambda task: (task, threading.get_ident()), 3)
+    outcomes = sorted(pool.run(range(10), on_start=started.append))
+    assert [result[0] for _, result, _ in outcomes] == list(range(10))
+    assert sorted(started) == list(range(10))
+    assert list(ThreadPool(raise_task, 2).run(["x"])) == [
+        (0, None, "ValueError: bad x")
+    ]
+
+
+def test_run_serial():
+    started = []
+    assert list(run_serial(str, [1, 2], on_start=started.append)) == [
+        (0, "1", None),
+        (1, "2", None),
+    ]
+    assert started == [0, 1]
+    assert list(run_serial(raise_task, ["x", "y"])) == [
+        (0, None, "ValueError: bad x"),
+        (1, None, "ValueError: bad y"),
+    ]
+
+
+def test_choose_executor(monkeypatch):
+    monkeypatch.setattr(sys, "_is_gil_enabled", lambda: True, raising=False)
+    assert choose_executor("auto", 1, 1000) == "serial"
+    assert choose_executor("auto", 4, 20) == "serial"
+    assert choose_executor("auto", 4, PROCESS_MIN_FILES) == "process"
+    assert choose_executor("auto", 4, 20, recycle=True) == "process"
+    assert choose_executor("thread", 4, 20) == "thread"
+
+    monkeypatch.setattr(sys, "_is_gil_enabled", lambda: False)
+    assert choose_executor("auto", 4, 20) == "thread"
+    assert choose_executor("auto", 1, 20) == "serial"
+
+    with pytest.raises(ValueError):
+        choose_executor("fibers", 4, 20)
+
+
+def test_executors_agree(tmp_path):
+    for i in range(6):
+        (tmp_path / f"mod{i}.py").write_text(f'import os\nx = "%s-{i}" % y\n')
+    files = [(str(tmp_path), f"mod{i}.py") for i in range(6)]
+
+    for executor in ("thread", "process"):
+        results, _ = fstringify_files(files, quiet=True, workers=3, executor=executor)
+        assert [result[1] for result in results] == [True] * 6
+        assert (tmp_path / "mod5.py").read_text() == 'import os\nx = f"{y}-5"\n'
+        for i in range(6):
+            (tmp_path / f"mod{i}.py").write_text(f'import os\nx = "%s-{i}" % y\n')
+
+    with pytest.raises(ValueError):
+        fstringify_files(files, quiet=True, executor="thread", max_files_per_worker=2)
+
+
+@pytest.mark.parametrize("executor", ["serial", "thread", "process"])
+def test_failing_file_doesnt_stop_the_run(tmp_path, capsys, executor):
+    (tmp_path / "bad.py").write_bytes(b'x = "\xff %s" % y\n')
+    (tmp_path / "good.py").write_text('import os\nx = "%s" % y\n')
+    files = [(str(tmp_path), "bad.py"), (str(tmp_path), "good.py")]
+
+    results, _ = fstringify_files(files, workers=2, executor=executor)
+    assert [result[1] for result in results] == [False, True]
+    assert "bad.py...failed (" in capsys.readouterr().out
+    assert (tmp_path / "good.py").read_text() == 'import os\nx = f"{y}"\n'